@@ -1,15 +1,17 @@
-import json
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-from thread_utils import ThreadedTask, file_lock
+from thread_utils import ThreadedTask, despachador_para
+from treeview_utils import ModeloFilas, VirtualTreeview
+from stock_store import StockStore
 
 class ClientePanel:
     def __init__(self, root):
         self.root = root
         self.root.title("Panel de Cliente - Stock Disponible")
         self.root.geometry("800x600")
-        self.threaded_task = ThreadedTask()
+        self.threaded_task = ThreadedTask(root)
+        self.stock = StockStore.abrir()
         
         # Configurar el estilo
         style = ttk.Style()
@@ -41,86 +43,86 @@ class ClientePanel:
         tree_frame = ttk.Frame(self.main_frame)
         tree_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        # Crear Treeview para mostrar los productos
-        self.tree = ttk.Treeview(tree_frame, 
-                                columns=('ID', 'Nombre', 'Cantidad', 'Estado'),
-                                show='headings',
-                                height=15)
+        # Búsqueda incremental sobre el catálogo
+        ttk.Label(tree_frame, text="Buscar:").grid(row=0, column=0, sticky=tk.W)
+        self.busqueda = tk.StringVar()
+        self.busqueda.trace_add("write", lambda *args: self.tree.buscar(self.busqueda.get()))
+        ttk.Entry(tree_frame, textvariable=self.busqueda, width=40).grid(row=0, column=1, sticky=tk.W)
         
-        # Definir las columnas
-        self.tree.heading('ID', text='Código')
-        self.tree.heading('Nombre', text='Producto')
-        self.tree.heading('Cantidad', text='Unidades Disponibles')
-        self.tree.heading('Estado', text='Estado')
-        
-        # Ajustar el ancho de las columnas
-        self.tree.column('ID', width=100, anchor='center')
-        self.tree.column('Nombre', width=250, anchor='w')
-        self.tree.column('Cantidad', width=150, anchor='center')
-        self.tree.column('Estado', width=150, anchor='center')
+        # Tabla virtual: solo se pintan las filas visibles del catálogo
+        self.tree = VirtualTreeview(tree_frame, columnas=(
+            ('ID', 'Código', 100, 'center'),
+            ('Nombre', 'Producto', 250, 'w'),
+            ('Cantidad', 'Unidades Disponibles', 150, 'center'),
+            ('Estado', 'Estado', 150, 'center'),
+        ), height=15)
         
         # Posicionar el Treeview
         self.tree.grid(row=1, column=0, columnspan=2, pady=10)
         
-        # Agregar scrollbar
-        scrollbar = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        scrollbar.grid(row=1, column=2, sticky='ns')
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        # Configurar colores para los diferentes estados
+        self.tree.tag_configure('alto', foreground='green')
+        self.tree.tag_configure('medio', foreground='orange')
+        self.tree.tag_configure('bajo', foreground='red')
+        self.tree.tag_configure('agotado', foreground='gray')
+        
+        # No se vuelve a pintar la tabla si el stock no ha cambiado
+        self.version_stock = None
         
         # Botón de actualizar
-        ttk.Button(self.main_frame, text="Actualizar Stock", command=self.cargar_stock).grid(row=2, column=0, columnspan=2, pady=10)
+        ttk.Button(self.main_frame, text="Actualizar Stock", command=self.cargar_stock).grid(row=3, column=0, columnspan=2, pady=10)
         
         # Cargar el stock inicial
         self.cargar_stock()
+        
+        # Se repinta sin avisar cuando cambia el stock en otra ventana o proceso.
+        # El aviso llega desde otros hilos: lo pasa al de Tk el despachador
+        self.despachador = despachador_para(self.root)
+        self.dejar_de_escuchar = self.despachador.escuchar()
+        self.cancelar_suscripcion = self.stock.suscribir(self.stock_cambiado)
+        self.root.bind('<Destroy>', self.al_cerrar, add='+')
+
+    def stock_cambiado(self, version):
+        if not self.despachador.avisar(self.repintar_stock):
+            self.cancelar_suscripcion()
+
+    def repintar_stock(self):
+        self.cargar_stock(avisar=False)
 
-    def cargar_stock(self):
+    def al_cerrar(self, event):
+        if event.widget is self.root:
+            self.cancelar_suscripcion()
+            self.dejar_de_escuchar()
+
+    def cargar_stock(self, avisar=True):
         # Mostrar indicador de carga
         self.tree.configure(cursor="wait")
         self.root.configure(cursor="wait")
         
+        version_anterior = self.version_stock
+        
         def load_data():
-            with file_lock:
-                with open('database/stock.json', 'r', encoding='utf-8') as file:
-                    return json.load(file)
-        
-        def update_ui(stock):
-            # Limpiar treeview
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            
-            # Insertar datos con estado de stock
-            for producto in stock:
-                cantidad = producto['cantidad']
-                if cantidad > 100:
-                    estado = "Bien Abastecido"
-                    tag = "alto"
-                elif 50 <= cantidad <= 100:
-                    estado = "Stock Medio"
-                    tag = "medio"
-                elif 1 <= cantidad < 50:
-                    estado = "Stock Bajo"
-                    tag = "bajo"
-                else:
-                    estado = "Sin Stock"
-                    tag = "agotado"
-                
-                self.tree.insert('', tk.END, values=(
-                    producto['id'],
-                    producto['nombre'],
-                    f"{cantidad} unidades",
-                    estado
-                ), tags=(tag,))
+            self.stock.refrescar()
+            version = self.stock.version
+            if version == version_anterior:
+                return None
             
-            # Configurar colores para los diferentes estados
-            self.tree.tag_configure('alto', foreground='green')
-            self.tree.tag_configure('medio', foreground='orange')
-            self.tree.tag_configure('bajo', foreground='red')
-            self.tree.tag_configure('agotado', foreground='gray')
+            # El índice se construye y ordena aquí, fuera del hilo de Tk
+            modelo = ModeloFilas(self.filas_stock(self.stock.instantanea()))
+            modelo.preordenar(4)
+            return version, modelo
+        
+        def update_ui(resultado):
+            if resultado is not None:
+                version, modelo = resultado
+                self.tree.mostrar(modelo)
+                self.version_stock = version
             
             # Restaurar cursor y mostrar mensaje
             self.tree.configure(cursor="")
             self.root.configure(cursor="")
-            messagebox.showinfo("Actualización", "Stock actualizado correctamente")
+            if avisar:
+                messagebox.showinfo("Actualización", "Stock actualizado correctamente")
         
         def error_handler(error):
             messagebox.showerror("Error", f"Error al cargar el stock: {error}")
@@ -130,6 +132,31 @@ class ClientePanel:
         
         self.threaded_task.execute(load_data, update_ui, error_handler)
 
+    @staticmethod
+    def filas_stock(stock):
+        # Filas (clave, valores, tags) con el estado de stock de cada producto
+        for producto in stock:
+            cantidad = producto['cantidad']
+            if cantidad > 100:
+                estado = "Bien Abastecido"
+                tag = "alto"
+            elif 50 <= cantidad <= 100:
+                estado = "Stock Medio"
+                tag = "medio"
+            elif 1 <= cantidad < 50:
+                estado = "Stock Bajo"
+                tag = "bajo"
+            else:
+                estado = "Sin Stock"
+                tag = "agotado"
+            
+            yield producto['id'], (
+                producto['id'],
+                producto['nombre'],
+                f"{cantidad} unidades",
+                estado
+            ), (tag,)
+
 def main():
     root = tk.Tk()
     app = ClientePanel(root)
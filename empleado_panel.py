@@ -5,14 +5,17 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 from thread_utils import ThreadedTask, file_lock
+from treeview_utils import TreeviewSync, firma_fichero
 import threading
 
+SENSORS_PATH = "database/sensors.json"
+
 class EmpleadoPanelGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Panel del Empleado - Supermercado Inteligente")
         self.root.geometry("1000x600")
-        self.threaded_task = ThreadedTask()
+        self.threaded_task = ThreadedTask(root)
         
         # Configurar el estilo
         style = ttk.Style()
@@ -58,6 +61,15 @@ class EmpleadoPanelGUI:
         # Posicionar Treeview
         self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
+        # Configurar colores
+        self.tree.tag_configure('normal', foreground='green')
+        self.tree.tag_configure('advertencia', foreground='orange')
+        self.tree.tag_configure('critico', foreground='red')
+        
+        # Solo se tocan las filas que cambian, y nada si el fichero no cambió
+        self.tree_sync = TreeviewSync(self.tree)
+        self.firma_sensores = None
+        
         # Frame para botones
         button_frame = ttk.Frame(self.main_frame)
         button_frame.grid(row=2, column=0, pady=20)
@@ -79,32 +91,33 @@ class EmpleadoPanelGUI:
         self.tree.configure(cursor="wait")
         self.root.configure(cursor="wait")
         
+        firma_anterior = self.firma_sensores
+        
         def load_data():
             with file_lock:
-                return leer_json("database/sensors.json")
+                firma = firma_fichero(SENSORS_PATH)
+                if firma is not None and firma == firma_anterior:
+                    return None
+                return firma, leer_json(SENSORS_PATH)
         
-        def update_ui(sensores):
-            # Limpiar tabla
-            for item in self.tree.get_children():
-                self.tree.delete(item)
-            
-            # Insertar nuevos datos
-            for sensor in sensores:
-                valor = sensor.get("valor")
-                valor_str = self.formatear_valor(valor, sensor.get("unidad", ""))
-                estado = self.determinar_estado(sensor)
+        def update_ui(resultado):
+            if resultado is not None:
+                firma, sensores = resultado
+                filas = []
+                for posicion, sensor in enumerate(sensores):
+                    valor = sensor.get("valor")
+                    valor_str = self.formatear_valor(valor, sensor.get("unidad", ""))
+                    estado = self.determinar_estado(sensor)
+                    
+                    filas.append((sensor.get('id', f"#{posicion}"), (
+                        sensor.get('id', 'N/A'),
+                        sensor.get('tipo', 'Desconocido').title(),
+                        valor_str,
+                        estado
+                    ), (estado.lower(),)))
                 
-                self.tree.insert('', tk.END, values=(
-                    sensor.get('id', 'N/A'),
-                    sensor.get('tipo', 'Desconocido').title(),
-                    valor_str,
-                    estado
-                ), tags=(estado.lower(),))
-            
-            # Configurar colores
-            self.tree.tag_configure('normal', foreground='green')
-            self.tree.tag_configure('advertencia', foreground='orange')
-            self.tree.tag_configure('critico', foreground='red')
+                self.tree_sync.sincronizar(filas)
+                self.firma_sensores = firma
             
             # Restaurar cursor
             self.tree.configure(cursor="")
@@ -128,7 +141,7 @@ class EmpleadoPanelGUI:
         
         def get_sensor_details():
             with file_lock:
-                sensores = leer_json("database/sensors.json")
+                sensores = leer_json(SENSORS_PATH)
                 for sensor in sensores:
                     if str(sensor.get('id')) == str(sensor_id):
                         return sensor
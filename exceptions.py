@@ -25,4 +25,26 @@ class ValidacionError(UsuarioError):
 
 class BaseDatosError(Exception):
     """Se lanza cuando hay problemas con la base de datos (archivo JSON)"""
-    pass
\ No newline at end of file
+    pass
+
+
+class StockError(Exception):
+    """Clase base para excepciones relacionadas con el stock"""
+    pass
+
+
+class ProductoExisteError(StockError):
+    """Se lanza cuando se intenta dar de alta un producto con un ID que ya existe"""
+    pass
+
+
+class ProductoNoEncontradoError(StockError):
+    """Se lanza cuando no se encuentra el producto a modificar o eliminar"""
+    pass
+
+
+class ImportacionError(StockError):
+    """Se lanza cuando alguna línea de una importación o ajuste masivo no es válida"""
+    def __init__(self, errores):
+        super().__init__(f"{len(errores)} líneas con errores")
+        self.errores = errores
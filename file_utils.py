@@ -0,0 +1,158 @@
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Union
+
+from exceptions import BaseDatosError
+
+if os.name == "nt":
+    import ctypes
+    import msvcrt
+    from ctypes import wintypes
+
+    LOCKFILE_FAIL_IMMEDIATELY = 0x01
+    LOCKFILE_EXCLUSIVE_LOCK = 0x02
+    ERROR_LOCK_VIOLATION = 33
+
+    class _OVERLAPPED(ctypes.Structure):
+        _fields_ = [
+            ("Internal", ctypes.c_void_p),
+            ("InternalHigh", ctypes.c_void_p),
+            ("Offset", wintypes.DWORD),
+            ("OffsetHigh", wintypes.DWORD),
+            ("hEvent", wintypes.HANDLE),
+        ]
+
+    _kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    _kernel32.LockFileEx.argtypes = [
+        wintypes.HANDLE, wintypes.DWORD, wintypes.DWORD, wintypes.DWORD, wintypes.DWORD, ctypes.POINTER(_OVERLAPPED)
+    ]
+    _kernel32.LockFileEx.restype = wintypes.BOOL
+    _kernel32.UnlockFileEx.argtypes = [
+        wintypes.HANDLE, wintypes.DWORD, wintypes.DWORD, wintypes.DWORD, ctypes.POINTER(_OVERLAPPED)
+    ]
+    _kernel32.UnlockFileEx.restype = wintypes.BOOL
+
+    def _bloquear(fd: int, exclusivo: bool, esperar: bool) -> bool:
+        flags = (LOCKFILE_EXCLUSIVE_LOCK if exclusivo else 0) | (0 if esperar else LOCKFILE_FAIL_IMMEDIATELY)
+        if _kernel32.LockFileEx(msvcrt.get_osfhandle(fd), flags, 0, 0xFFFFFFFF, 0xFFFFFFFF, ctypes.byref(_OVERLAPPED())):
+            return True
+        error = ctypes.get_last_error()
+        if error == ERROR_LOCK_VIOLATION:
+            return False
+        raise ctypes.WinError(error)
+
+    def _desbloquear(fd: int):
+        _kernel32.UnlockFileEx(msvcrt.get_osfhandle(fd), 0, 0xFFFFFFFF, 0xFFFFFFFF, ctypes.byref(_OVERLAPPED()))
+
+else:
+    import fcntl
+
+    def _bloquear(fd: int, exclusivo: bool, esperar: bool) -> bool:
+        modo = fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH
+        try:
+            fcntl.flock(fd, modo if esperar else modo | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def _desbloquear(fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class FileLock:
+    """
+    Bloqueo consultivo del sistema operativo sobre un fichero auxiliar
+    (`<ruta>.lock`), válido entre procesos: flock en POSIX y LockFileEx en
+    Windows. Los lectores toman el bloqueo compartido y pueden ir a la vez;
+    los escritores toman el exclusivo y van de uno en uno.
+
+    Dentro de un mismo hilo es reentrante: pedirlo de nuevo mientras se
+    tiene no vuelve a bloquear, salvo pasar de compartido a exclusivo, que
+    no está permitido.
+    """
+
+    def __init__(self, ruta: str, timeout: Optional[float] = 30.0):
+        self.ruta = ruta
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @contextmanager
+    def compartido(self):
+        with self._bloqueo(exclusivo=False):
+            yield
+
+    @contextmanager
+    def exclusivo(self):
+        with self._bloqueo(exclusivo=True):
+            yield
+
+    @contextmanager
+    def _bloqueo(self, exclusivo: bool):
+        actual = getattr(self._local, "modo", None)
+        if actual is not None:
+            if exclusivo and actual == "compartido":
+                raise RuntimeError("No se puede pasar de bloqueo compartido a exclusivo")
+            self._local.profundidad += 1
+            try:
+                yield
+            finally:
+                self._local.profundidad -= 1
+            return
+
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        # Un descriptor por toma: flock se aplica por descriptor abierto, así
+        # que dos hilos del mismo proceso también se excluyen entre sí
+        fd = os.open(self.ruta, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            self._esperar(fd, exclusivo)
+            self._local.modo = "exclusivo" if exclusivo else "compartido"
+            self._local.profundidad = 1
+            try:
+                yield
+            finally:
+                self._local.modo = None
+                _desbloquear(fd)
+        finally:
+            os.close(fd)
+
+    def _esperar(self, fd: int, exclusivo: bool):
+        if self.timeout is None:
+            _bloquear(fd, exclusivo, esperar=True)
+            return
+
+        limite = time.monotonic() + self.timeout
+        espera = 0.005
+        while not _bloquear(fd, exclusivo, esperar=False):
+            if time.monotonic() >= limite:
+                raise BaseDatosError(f"Tiempo de espera agotado al bloquear {self.ruta}")
+            time.sleep(espera)
+            espera = min(espera * 2, 0.1)
+
+
+def escritura_atomica(ruta: str, contenido: Union[str, bytes]):
+    """
+    Escribe el fichero completo en un temporal del mismo directorio y lo
+    sustituye con os.replace: quien lo lea ve el contenido anterior o el
+    nuevo, nunca uno a medias.
+    """
+    directorio = os.path.dirname(ruta) or "."
+    os.makedirs(directorio, exist_ok=True)
+    if isinstance(contenido, str):
+        contenido = contenido.encode("utf-8")
+
+    fd, tmp_path = tempfile.mkstemp(dir=directorio, prefix=os.path.basename(ruta) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(contenido)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, ruta)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -2,46 +2,11 @@ import json
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-import threading
-from queue import Queue
-
-
-import json
-import tkinter as tk
-from tkinter import ttk
-from tkinter import messagebox
-import threading
-from queue import Queue
-import time
-
-class ThreadedTask:
-    def __init__(self):
-        self.queue = Queue()
-    
-    def execute(self, func, callback=None, error_callback=None):
-        def thread_target():
-            try:
-                result = func()
-                self.queue.put(('success', result))
-            except Exception as e:
-                self.queue.put(('error', str(e)))
-        
-        def check_queue():
-            try:
-                message_type, result = self.queue.get_nowait()
-                if message_type == 'success' and callback:
-                    callback(result)
-                elif message_type == 'error' and error_callback:
-                    error_callback(result)
-            except Queue.Empty:
-                tk.Tk().after(100, check_queue)
-        
-        thread = threading.Thread(target=thread_target)
-        thread.daemon = True
-        thread.start()
-        
-        if callback or error_callback:
-            tk.Tk().after(100, check_queue)
+from tkinter import filedialog
+from thread_utils import SIN_PLAZO, ThreadedTask, despachador_para
+from treeview_utils import ModeloFilas, VirtualTreeview
+from stock_store import StockStore
+from stock_import import ajustar_cantidades, importar_productos
 
 class LoginEmpleado:
     def __init__(self, root):
@@ -78,7 +43,7 @@ class LoginEmpleado:
         self.root = root
         self.root.title("Login Empleado - Gestor de Stock")
         self.root.geometry("400x300")
-        self.threaded_task = ThreadedTask()
+        self.threaded_task = ThreadedTask(root)
         
         # Frame principal
         self.frame = ttk.Frame(root, padding="20")
@@ -170,10 +135,10 @@ class GestorStock:
         self.root = root
         self.root.title("Gestor de Stock - Supermercado Tannhauser")
         self.root.geometry("1000x600")
-        self.threaded_task = ThreadedTask()
+        self.threaded_task = ThreadedTask(root)
         
-        # Lock para operaciones con archivos
-        self.file_lock = threading.Lock()
+        # Stock indexado por id; cada cambio solo anexa una línea al registro
+        self.stock = StockStore.abrir()
         
         # Configurar el estilo
         style = ttk.Style()
@@ -212,67 +177,83 @@ class GestorStock:
         ttk.Button(button_frame, text="Modificar", command=self.modificar_producto).grid(row=0, column=1, padx=5)
         ttk.Button(button_frame, text="Eliminar", command=self.eliminar_producto).grid(row=0, column=2, padx=5)
         ttk.Button(button_frame, text="Limpiar", command=self.limpiar_campos).grid(row=0, column=3, padx=5)
-        
-        # Treeview para mostrar productos
-        self.tree = ttk.Treeview(self.main_frame, columns=('ID', 'Nombre', 'Cantidad'), show='headings', height=15)
+        ttk.Button(button_frame, text="Importar", command=self.importar_productos).grid(row=0, column=4, padx=5)
+        ttk.Button(button_frame, text="Ajuste masivo", command=self.ajustar_cantidades).grid(row=0, column=5, padx=5)
+        
+        # Búsqueda incremental sobre el catálogo
+        ttk.Label(button_frame, text="Buscar:").grid(row=0, column=6, padx=(20,5))
+        self.busqueda = tk.StringVar()
+        self.busqueda.trace_add("write", lambda *args: self.tree.buscar(self.busqueda.get()))
+        ttk.Entry(button_frame, textvariable=self.busqueda, width=25).grid(row=0, column=7, padx=5)
+        
+        # Tabla virtual para mostrar productos: solo se pintan las filas visibles
+        self.tree = VirtualTreeview(self.main_frame, columnas=(
+            ('ID', 'ID', 100, 'center'),
+            ('Nombre', 'Nombre del Producto', 300, 'w'),
+            ('Cantidad', 'Cantidad', 100, 'center'),
+        ), height=15)
         self.tree.grid(row=3, column=0, columnspan=4, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        # Configurar columnas
-        self.tree.heading('ID', text='ID')
-        self.tree.heading('Nombre', text='Nombre del Producto')
-        self.tree.heading('Cantidad', text='Cantidad')
-        
-        self.tree.column('ID', width=100, anchor='center')
-        self.tree.column('Nombre', width=300, anchor='w')
-        self.tree.column('Cantidad', width=100, anchor='center')
-        
-        # Scrollbar
-        scrollbar = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        scrollbar.grid(row=3, column=4, sticky='ns')
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        
         # Binding para selección
-        self.tree.bind('<<TreeviewSelect>>', self.item_seleccionado)
+        self.tree.al_seleccionar(self.item_seleccionado)
+        
+        # No se vuelve a pintar la tabla si el stock no ha cambiado
+        self.version_stock = None
         
         # Cargar datos iniciales
         self.cargar_datos()
+        
+        # Se repinta cuando cambia el stock, desde esta ventana, otra o otro proceso.
+        # El aviso llega desde otros hilos: lo pasa al de Tk el despachador
+        self.despachador = despachador_para(self.root)
+        self.dejar_de_escuchar = self.despachador.escuchar()
+        self.cancelar_suscripcion = self.stock.suscribir(self.stock_cambiado)
+        self.root.bind('<Destroy>', self.al_cerrar, add='+')
+    
+    def stock_cambiado(self, version):
+        if not self.despachador.avisar(self.cargar_datos):
+            self.cancelar_suscripcion()
+    
+    def al_cerrar(self, event):
+        if event.widget is self.root:
+            self.cancelar_suscripcion()
+            self.dejar_de_escuchar()
+            self.threaded_task.cancelar_todas()
     
     def cargar_datos(self):
+        version_anterior = self.version_stock
+        
         def load_data():
-            with self.file_lock:
-                with open('database/stock.json', 'r', encoding='utf-8') as file:
-                    return json.load(file)
-        
-        def update_ui(stock):
-            # Limpiar treeview
-            for item in self.tree.get_children():
-                self.tree.delete(item)
+            self.stock.refrescar()
+            version = self.stock.version
+            if version == version_anterior:
+                return None
+            
+            # El índice se construye y ordena aquí, fuera del hilo de Tk
+            modelo = ModeloFilas(
+                (producto['id'], (producto['id'], producto['nombre'], producto['cantidad']), ())
+                for producto in self.stock.instantanea()
+            )
+            modelo.preordenar(3)
+            return version, modelo
+        
+        def update_ui(resultado):
+            if resultado is None:
+                return
             
-            # Insertar datos
-            for producto in stock:
-                self.tree.insert('', tk.END, values=(
-                    producto['id'],
-                    producto['nombre'],
-                    producto['cantidad']
-                ))
+            version, modelo = resultado
+            self.tree.mostrar(modelo)
+            self.version_stock = version
         
         def error_handler(error):
             messagebox.showerror("Error", f"Error al cargar los datos: {error}")
         
         self.threaded_task.execute(load_data, update_ui, error_handler)
     
-    def guardar_datos(self, stock):
-        try:
-            with open('database/stock.json', 'w', encoding='utf-8') as file:
-                json.dump(stock, file, indent=4, ensure_ascii=False)
-            self.cargar_datos()
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al guardar los datos: {str(e)}")
-    
     def leer_stock_actual(self):
         try:
-            with open('database/stock.json', 'r', encoding='utf-8') as file:
-                return json.load(file)
+            self.stock.refrescar()
+            return self.stock.listar()
         except Exception as e:
             messagebox.showerror("Error", f"Error al leer el stock: {str(e)}")
             return []
@@ -299,42 +280,29 @@ class GestorStock:
         progress.start()
         
         def add_product():
-            time.sleep(0.5)  # Simular tiempo de proceso
-            with self.file_lock:
-                stock = self.leer_stock_actual()
-                
-                # Verificar si el ID ya existe
-                if any(prod['id'] == id for prod in stock):
-                    raise ValueError("Ya existe un producto con ese ID")
-                
-                nuevo_producto = {
-                    'id': id,
-                    'nombre': nombre,
-                    'cantidad': cantidad
-                }
-                
-                stock.append(nuevo_producto)
-                self.guardar_datos(stock)
-                return True
+            # Falla con ProductoExisteError si el ID ya existe
+            self.stock.agregar({
+                'id': id,
+                'nombre': nombre,
+                'cantidad': cantidad
+            })
+            return True
         
         def on_success(result):
             progress.stop()
             progress.destroy()
             messagebox.showinfo("Éxito", "Producto agregado correctamente")
             self.limpiar_campos()
-            self.cargar_datos()
         
         def on_error(error):
             progress.stop()
             progress.destroy()
-            if "tiempo de espera" in str(error):
-                messagebox.showerror("Error", "La operación tardó demasiado tiempo en completarse")
-            elif "Ya existe un producto" in str(error):
+            if "Ya existe un producto" in str(error):
                 messagebox.showwarning("Advertencia", str(error))
             else:
                 messagebox.showerror("Error", f"Error al agregar el producto: {str(error)}")
         
-        self.threaded_task.execute(add_product, on_success, on_error, timeout=5)  # timeout de 5 segundos
+        self.threaded_task.execute(add_product, on_success, on_error, timeout=SIN_PLAZO)
     
     def modificar_producto(self):
         id = self.id_entry.get().strip()
@@ -353,28 +321,13 @@ class GestorStock:
             return
         
         def update_product():
-            with self.file_lock:
-                stock = self.leer_stock_actual()
-                
-                # Buscar y modificar el producto
-                producto_encontrado = False
-                for producto in stock:
-                    if producto['id'] == id:
-                        producto['nombre'] = nombre
-                        producto['cantidad'] = cantidad
-                        producto_encontrado = True
-                        break
-                
-                if not producto_encontrado:
-                    raise ValueError("No se encontró un producto con ese ID")
-                
-                self.guardar_datos(stock)
-                return True
+            # Falla con ProductoNoEncontradoError si el ID no existe
+            self.stock.actualizar(id, nombre=nombre, cantidad=cantidad)
+            return True
         
         def on_success(result):
             messagebox.showinfo("Éxito", "Producto modificado correctamente")
             self.limpiar_campos()
-            self.cargar_datos()
         
         def on_error(error):
             if "No se encontró un producto" in str(error):
@@ -382,46 +335,70 @@ class GestorStock:
             else:
                 messagebox.showerror("Error", f"Error al modificar el producto: {str(error)}")
         
-        self.threaded_task.execute(update_product, on_success, on_error)
+        self.threaded_task.execute(update_product, on_success, on_error, timeout=SIN_PLAZO)
     
     def eliminar_producto(self):
-        seleccion = self.tree.selection()
-        if not seleccion:
+        id_producto = self.tree.seleccion()
+        if id_producto is None:
             messagebox.showwarning("Advertencia", "Por favor, seleccione un producto para eliminar")
             return
         
         if not messagebox.askyesno("Confirmar", "¿Está seguro de que desea eliminar este producto?"):
             return
         
-        valores = self.tree.item(seleccion[0])['values']
-        id_producto = valores[0]
-        
         def delete_product():
-            with self.file_lock:
-                stock = self.leer_stock_actual()
-                new_stock = [prod for prod in stock if prod['id'] != id_producto]
-                
-                if len(new_stock) == len(stock):
-                    raise ValueError("No se encontró el producto para eliminar")
-                
-                self.guardar_datos(new_stock)
-                return True
+            self.stock.eliminar(id_producto)
+            return True
         
         def on_success(result):
             messagebox.showinfo("Éxito", "Producto eliminado correctamente")
             self.limpiar_campos()
-            self.cargar_datos()
         
         def on_error(error):
             messagebox.showerror("Error", f"Error al eliminar el producto: {str(error)}")
         
-        self.threaded_task.execute(delete_product, on_success, on_error)
+        self.threaded_task.execute(delete_product, on_success, on_error, timeout=SIN_PLAZO)
+    
+    def importar_productos(self):
+        ruta = filedialog.askopenfilename(
+            title="Importar productos (id, nombre, cantidad)",
+            filetypes=[("CSV o JSON por líneas", "*.csv *.jsonl *.ndjson"), ("Todos los archivos", "*.*")]
+        )
+        if ruta:
+            self.operacion_masiva(lambda: importar_productos(self.stock, ruta), "Importación")
+    
+    def ajustar_cantidades(self):
+        ruta = filedialog.askopenfilename(
+            title="Ajuste masivo de cantidades (id, delta)",
+            filetypes=[("CSV o JSON por líneas", "*.csv *.jsonl *.ndjson"), ("Todos los archivos", "*.*")]
+        )
+        if ruta:
+            self.operacion_masiva(lambda: ajustar_cantidades(self.stock, ruta), "Ajuste masivo")
+    
+    def operacion_masiva(self, operacion, titulo):
+        progress = ttk.Progressbar(self.main_frame, mode='indeterminate')
+        progress.grid(row=6, column=0, columnspan=2, pady=5, sticky=(tk.W, tk.E))
+        progress.start()
+        
+        def on_success(resultado):
+            progress.stop()
+            progress.destroy()
+            if resultado.ok:
+                messagebox.showinfo(titulo, resultado.resumen())
+            else:
+                messagebox.showwarning(titulo, resultado.resumen())
+        
+        def on_error(error):
+            progress.stop()
+            progress.destroy()
+            messagebox.showerror("Error", f"{titulo}: {error}")
+        
+        self.threaded_task.execute(operacion, on_success, on_error, timeout=SIN_PLAZO)
     
-    def item_seleccionado(self, event):
+    def item_seleccionado(self, id_producto):
         try:
-            seleccion = self.tree.selection()
-            if seleccion:
-                valores = self.tree.item(seleccion[0])['values']
+            valores = self.tree.valores(id_producto)
+            if valores:
                 self.id_entry.delete(0, tk.END)
                 self.nombre_entry.delete(0, tk.END)
                 self.cantidad_entry.delete(0, tk.END)
@@ -37,6 +37,12 @@ const char* ordinaryServerUrl = "http://IP_DE_TU_PC:8000/ingest/ordinary";
 // Si mantienes el envío anterior de sensores, deja también tu endpoint anterior:
 const char* serverUrl = "http://IP_DE_TU_PC:8000/ingest/readings/batch";
 
+// Envío por lotes en formato binario compacto (ver Backend/binary_ingest.py).
+// Con USAR_ENVIO_BINARIO a 1, temperatura, humedad y sensor ordinario se
+// acumulan y se envían juntos cada LECTURAS_POR_ENVIO lecturas.
+#define USAR_ENVIO_BINARIO 0
+const char* binaryServerUrl = "http://IP_DE_TU_PC:8000/ingest/readings/binary";
+
 // =========================
 // OBJETOS
 // =========================
@@ -50,6 +56,13 @@ float humedad = 0.0;
 int calidadAire = 0;
 float distanciaCm = 0.0;
 
+// Clave de idempotencia de cada lectura: identificador del arranque + número
+// de secuencia. Si un POST falla y se reintenta con la misma clave, la API
+// descarta la copia en lugar de guardar la lectura dos veces.
+uint32_t arranqueId = 0;
+uint32_t secuenciaLecturas = 0;
+#define MAX_INTENTOS_ENVIO 3
+
 // La librería del enunciado indica que leerDatosOrdinarios()
 // devuelve un array con 2 datos: int y char[].
 // En Arduino/C++ se representa de forma segura con una estructura.
@@ -132,14 +145,8 @@ String escaparJson(const char* texto) {
 // los envía a la BBDD del proyecto mediante la API.
 // =======================================================
 bool DataBaseInsert(int valorNumerico, const char valorAlfanumerico[]) {
-  if (WiFi.status() != WL_CONNECTED) {
-    Serial.println("WiFi no conectado. Intentando reconectar...");
-    conectarWiFi();
-  }
-
-  HTTPClient http;
-  http.begin(ordinaryServerUrl);
-  http.addHeader("Content-Type", "application/json");
+  secuenciaLecturas++;
+  String clave = String(arranqueId, HEX) + "-" + String(secuenciaLecturas);
 
   String json = "{";
   json += "\"numeric_value\":";
@@ -148,32 +155,154 @@ bool DataBaseInsert(int valorNumerico, const char valorAlfanumerico[]) {
   json += "\"text_value\":\"";
   json += escaparJson(valorAlfanumerico);
   json += "\",";
-  json += "\"source\":\"esp32\"";
+  json += "\"source\":\"esp32\",";
+  json += "\"idempotency_key\":\"";
+  json += clave;
+  json += "\"";
   json += "}";
 
   Serial.println("Enviando lectura del sensor ordinario:");
   Serial.println(json);
 
-  int httpCode = http.POST(json);
-  Serial.print("Código HTTP: ");
-  Serial.println(httpCode);
-
   bool insertado = false;
 
-  if (httpCode > 0) {
-    String respuesta = http.getString();
-    Serial.println("Respuesta del servidor:");
-    Serial.println(respuesta);
+  // Los reintentos llevan la misma clave, así que nunca duplican la lectura
+  for (int intento = 1; intento <= MAX_INTENTOS_ENVIO && !insertado; intento++) {
+    if (WiFi.status() != WL_CONNECTED) {
+      Serial.println("WiFi no conectado. Intentando reconectar...");
+      conectarWiFi();
+    }
 
-    insertado = (httpCode >= 200 && httpCode < 300);
-  } else {
-    Serial.println("Error al enviar la petición HTTP del sensor ordinario");
+    HTTPClient http;
+    http.begin(ordinaryServerUrl);
+    http.addHeader("Content-Type", "application/json");
+
+    int httpCode = http.POST(json);
+    Serial.print("Código HTTP (intento ");
+    Serial.print(intento);
+    Serial.print("): ");
+    Serial.println(httpCode);
+
+    if (httpCode > 0) {
+      String respuesta = http.getString();
+      Serial.println("Respuesta del servidor:");
+      Serial.println(respuesta);
+
+      insertado = (httpCode >= 200 && httpCode < 300);
+    } else {
+      Serial.println("Error al enviar la petición HTTP del sensor ordinario");
+    }
+
+    http.end();
+
+    if (!insertado && intento < MAX_INTENTOS_ENVIO) {
+      delay(500 * intento);
+    }
   }
 
-  http.end();
   return insertado;
 }
 
+// =======================================================
+// ENVÍO BINARIO POR LOTES
+// Cabecera de 20 bytes + registros de tamaño fijo (10 bytes + texto),
+// todo en little-endian como la propia ESP32.
+// =======================================================
+#define SENSOR_BIN_TEMPERATURA 1
+#define SENSOR_BIN_HUMEDAD 2
+#define SENSOR_BIN_ORDINARIO 6
+
+#define TAM_CABECERA_BIN 20
+#define ANCHO_TEXTO_BIN 12
+#define TAM_REGISTRO_BIN (10 + ANCHO_TEXTO_BIN)
+#define MAX_REGISTROS_BIN 48
+#define LECTURAS_POR_ENVIO 12
+
+uint8_t loteBinario[TAM_CABECERA_BIN + MAX_REGISTROS_BIN * TAM_REGISTRO_BIN];
+uint32_t momentosLote[MAX_REGISTROS_BIN];  // millis() de cada lectura del lote
+uint16_t registrosLote = 0;
+uint32_t primeraSeqLote = 0;
+
+bool enviarLoteBinario();
+
+void anotarLecturaBinaria(uint8_t sensorId, float valor, const char* texto) {
+  if (registrosLote >= MAX_REGISTROS_BIN && !enviarLoteBinario()) {
+    // Sin conexión y con el lote lleno: se descarta para seguir midiendo
+    Serial.println("Lote binario lleno y sin conexión: se descartan las lecturas pendientes");
+    registrosLote = 0;
+  }
+
+  if (registrosLote == 0) {
+    primeraSeqLote = secuenciaLecturas + 1;
+  }
+  secuenciaLecturas++;
+
+  uint8_t* registro = loteBinario + TAM_CABECERA_BIN + registrosLote * TAM_REGISTRO_BIN;
+  memset(registro, 0, TAM_REGISTRO_BIN);
+  registro[0] = sensorId;
+  registro[1] = texto ? 0x01 : 0x00;
+  // Bytes 2-5: antigüedad en ms, se rellena al enviar
+  memcpy(registro + 6, &valor, 4);
+  if (texto) {
+    strncpy((char*)(registro + 10), texto, ANCHO_TEXTO_BIN);
+  }
+
+  momentosLote[registrosLote] = millis();
+  registrosLote++;
+}
+
+bool enviarLoteBinario() {
+  if (registrosLote == 0) {
+    return true;
+  }
+
+  if (WiFi.status() != WL_CONNECTED) {
+    Serial.println("WiFi no conectado. Intentando reconectar...");
+    conectarWiFi();
+  }
+
+  // Cabecera: magia, nº de registros, ancho del texto, reservado,
+  // instante del envío (0 = hora del servidor), arranque y primera secuencia
+  uint32_t enviado = 0;
+  memcpy(loteBinario, "TNB1", 4);
+  memcpy(loteBinario + 4, &registrosLote, 2);
+  loteBinario[6] = ANCHO_TEXTO_BIN;
+  loteBinario[7] = 0;
+  memcpy(loteBinario + 8, &enviado, 4);
+  memcpy(loteBinario + 12, &arranqueId, 4);
+  memcpy(loteBinario + 16, &primeraSeqLote, 4);
+
+  uint32_t ahora = millis();
+  for (uint16_t i = 0; i < registrosLote; i++) {
+    uint32_t edad = ahora - momentosLote[i];
+    memcpy(loteBinario + TAM_CABECERA_BIN + i * TAM_REGISTRO_BIN + 2, &edad, 4);
+  }
+
+  size_t tamano = TAM_CABECERA_BIN + registrosLote * TAM_REGISTRO_BIN;
+
+  HTTPClient http;
+  http.begin(binaryServerUrl);
+  http.addHeader("Content-Type", "application/octet-stream");
+  int httpCode = http.POST(loteBinario, tamano);
+  http.end();
+
+  Serial.print("Lote binario (");
+  Serial.print(registrosLote);
+  Serial.print(" lecturas, ");
+  Serial.print(tamano);
+  Serial.print(" bytes). Código HTTP: ");
+  Serial.println(httpCode);
+
+  if (httpCode >= 200 && httpCode < 300) {
+    registrosLote = 0;
+    return true;
+  }
+
+  // Se conserva el lote: el reintento lleva las mismas secuencias y la API
+  // descarta las lecturas que ya hubiera guardado
+  return false;
+}
+
 // =======================================================
 // LECTURA DEL SENSOR ORDINARIO Y ALMACENAMIENTO EN BBDD
 // Usa las funciones indicadas por el enunciado:
@@ -195,6 +324,11 @@ void leerSensorOrdinarioYGuardar() {
   Serial.print("Valor alfanumérico: ");
   Serial.println(datos.valorAlfanumerico);
 
+#if USAR_ENVIO_BINARIO
+  anotarLecturaBinaria(SENSOR_BIN_ORDINARIO, datos.valorNumerico, datos.valorAlfanumerico);
+  return;
+#endif
+
   bool ok = DataBaseInsert(datos.valorNumerico, datos.valorAlfanumerico);
 
   if (ok) {
@@ -257,6 +391,9 @@ void setup() {
 
   dht.begin();
 
+  // Distinto en cada arranque: las secuencias de un arranque anterior no chocan
+  arranqueId = esp_random();
+
   pinMode(TRIG_PIN, OUTPUT);
   pinMode(ECHO_PIN, INPUT);
 
@@ -304,6 +441,17 @@ void loop() {
   // Parte nueva del ejercicio: lectura + inserción del sensor ordinario
   leerSensorOrdinarioYGuardar();
 
+#if USAR_ENVIO_BINARIO
+  if (dhtOk) {
+    anotarLecturaBinaria(SENSOR_BIN_TEMPERATURA, temperatura, NULL);
+    anotarLecturaBinaria(SENSOR_BIN_HUMEDAD, humedad, NULL);
+  }
+
+  if (registrosLote >= LECTURAS_POR_ENVIO) {
+    enviarLoteBinario();
+  }
+#endif
+
   Serial.println();
   delay(5000);
 }
@@ -0,0 +1,335 @@
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class Umbral:
+    """Umbral de alert_thresholds ya compilado para evaluarlo sin consultas."""
+
+    __slots__ = ("id", "state_code", "operador", "valor", "histeresis", "severity", "title", "plantilla")
+
+    def __init__(self, row: Dict):
+        self.id = int(row["id"])
+        self.state_code = row["state_code"]
+        self.operador = row["operator_type"]
+        self.valor = float(row["threshold_value"])
+        self.histeresis = float(row.get("hysteresis_value") or 0)
+        self.severity = row["severity"]
+        self.title = row["title"]
+        self.plantilla = row["description_template"]
+
+    def superado(self, valor: float) -> bool:
+        return valor > self.valor if self.operador == "gt" else valor < self.valor
+
+    def normalizado(self, valor: float) -> bool:
+        if self.operador == "gt":
+            return valor <= self.valor - self.histeresis
+        return valor >= self.valor + self.histeresis
+
+    def descripcion(self, datos: Dict) -> str:
+        try:
+            return self.plantilla.format_map(datos)
+        except (KeyError, IndexError, ValueError):
+            return self.plantilla
+
+
+class _Datos(dict):
+    # Los marcadores desconocidos de la plantilla se dejan tal cual
+    def __missing__(self, clave):
+        return "{" + clave + "}"
+
+
+class TransaccionAlertas:
+    """Cambios de alertas hechos dentro de una transacción aún sin confirmar."""
+
+    __slots__ = ("cambios", "disparadas", "resueltas")
+
+    def __init__(self):
+        # (device_id, umbral_id) -> True si queda abierta, False si se resolvió
+        self.cambios: Dict[Tuple[int, int], bool] = {}
+        self.disparadas = 0
+        self.resueltas = 0
+
+
+class AlertEngine:
+    """
+    Evalúa los umbrales de alert_thresholds en cada escritura de current_state.
+
+    Los umbrales activos se compilan en un índice state_code -> umbrales; la
+    tabla solo se vuelve a consultar (COUNT + MAX(updated_at)) cada
+    intervalo_recarga segundos, y se recompila si ha cambiado. Cada
+    (dispositivo, umbral) recuerda si tiene una alerta abierta:
+
+    - se inserta un evento en events solo al pasar de normal a superado;
+    - la alerta se resuelve cuando el valor vuelve más allá de la
+      histéresis, no en cuanto deja de superar el umbral.
+
+    Los eventos se escriben con la conexión de la lectura, dentro de su
+    transacción. Lo que cambia en ella se guarda en su TransaccionAlertas:
+    confirmar() lo pasa a las alertas abiertas tras el commit y descartar()
+    lo olvida tras un rollback. Mientras tanto ese (dispositivo, umbral)
+    queda reservado y las demás transacciones no lo tocan; la siguiente
+    lectura decide.
+    """
+
+    EVENT_TYPE = "alerta_umbral"
+
+    def __init__(self, intervalo_recarga: float = 5.0):
+        self.intervalo_recarga = intervalo_recarga
+
+        self._lock = threading.Lock()
+        self._indice: Dict[str, Tuple[Umbral, ...]] = {}
+        # (device_id, umbral_id) con una alerta abierta ya confirmada
+        self._activas: Set[Tuple[int, int]] = set()
+        # (device_id, umbral_id) -> transacción que la está cambiando
+        self._en_curso: Dict[Tuple[int, int], TransaccionAlertas] = {}
+        # Cambios confirmados mientras se recarga, para aplicarlos encima
+        self._recargas_en_curso = 0
+        self._confirmados: List[Tuple[Tuple[int, int], bool]] = []
+        self._firma = None
+        self._cargado = False
+        self._proxima_comprobacion = 0.0
+
+        self._evaluaciones = 0
+        self._disparadas = 0
+        self._resueltas = 0
+        self._recargas = 0
+
+    # ----------------------- índice de umbrales -----------------------
+
+    def invalidar(self):
+        with self._lock:
+            self._cargado = False
+            self._proxima_comprobacion = 0.0
+
+    def _comprobar_cambios(self, conn):
+        ahora = time.monotonic()
+        if self._cargado and ahora < self._proxima_comprobacion:
+            return
+
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*), MAX(updated_at), COALESCE(SUM(is_active), 0) FROM alert_thresholds")
+        firma = tuple(cursor.fetchone())
+        cursor.close()
+
+        with self._lock:
+            self._proxima_comprobacion = ahora + self.intervalo_recarga
+            if self._cargado and firma == self._firma:
+                return
+            self._recargas_en_curso += 1
+            desde = len(self._confirmados)
+
+        # Las consultas van fuera del lock; lo confirmado entre tanto se
+        # vuelve a aplicar encima al instalar el resultado
+        try:
+            indice, activas = self._cargar(conn)
+        except Exception:
+            with self._lock:
+                self._terminar_recarga()
+            raise
+
+        with self._lock:
+            for clave, abierta in self._confirmados[desde:]:
+                if abierta:
+                    activas.add(clave)
+                else:
+                    activas.discard(clave)
+            self._terminar_recarga()
+            self._indice = indice
+            self._activas = activas
+            self._firma = firma
+            self._cargado = True
+            self._recargas += 1
+
+    def _terminar_recarga(self):
+        self._recargas_en_curso -= 1
+        if not self._recargas_en_curso:
+            self._confirmados = []
+
+    def _cargar(self, conn) -> Tuple[Dict[str, Tuple[Umbral, ...]], Set[Tuple[int, int]]]:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            """
+            SELECT id, state_code, operator_type, threshold_value, hysteresis_value,
+                   severity, title, description_template
+            FROM alert_thresholds
+            WHERE is_active = 1
+            """
+        )
+        indice: Dict[str, List[Umbral]] = {}
+        for row in cursor.fetchall():
+            umbral = Umbral(row)
+            indice.setdefault(umbral.state_code, []).append(umbral)
+
+        cursor.execute(
+            "SELECT device_id, payload FROM events WHERE event_type = %s AND is_resolved = 0",
+            (self.EVENT_TYPE,)
+        )
+        activas = set()
+        for row in cursor.fetchall():
+            try:
+                umbral_id = json.loads(row["payload"] or "{}").get("threshold_id")
+            except (TypeError, ValueError):
+                continue
+            if umbral_id is not None and row["device_id"] is not None:
+                activas.add((int(row["device_id"]), int(umbral_id)))
+        cursor.close()
+
+        return {codigo: tuple(umbrales) for codigo, umbrales in indice.items()}, activas
+
+    # ----------------------- transacciones -----------------------
+
+    def transaccion(self) -> TransaccionAlertas:
+        return TransaccionAlertas()
+
+    def confirmar(self, transaccion: TransaccionAlertas):
+        """Tras el commit: los cambios de la transacción pasan a ser los vigentes."""
+        if not transaccion.cambios:
+            return
+        with self._lock:
+            self._aplicar(transaccion.cambios.items())
+            for clave in transaccion.cambios:
+                if self._en_curso.get(clave) is transaccion:
+                    del self._en_curso[clave]
+            self._disparadas += transaccion.disparadas
+            self._resueltas += transaccion.resueltas
+        transaccion.cambios = {}
+
+    def descartar(self, transaccion: TransaccionAlertas):
+        """Tras el rollback: sus eventos no existen, solo se liberan las reservas."""
+        if not transaccion.cambios:
+            return
+        with self._lock:
+            for clave in transaccion.cambios:
+                if self._en_curso.get(clave) is transaccion:
+                    del self._en_curso[clave]
+        transaccion.cambios = {}
+
+    def _aplicar(self, cambios: Iterable[Tuple[Tuple[int, int], bool]]):
+        cambios = list(cambios)
+        for clave, abierta in cambios:
+            if abierta:
+                self._activas.add(clave)
+            else:
+                self._activas.discard(clave)
+        if self._recargas_en_curso:
+            self._confirmados.extend(cambios)
+
+    # ----------------------- evaluación -----------------------
+
+    def evaluar(
+        self,
+        conn,
+        device_id: int,
+        codigos: Iterable[str],
+        valor: float,
+        contexto: Optional[Dict] = None,
+        transaccion: Optional[TransaccionAlertas] = None,
+    ):
+        """
+        Evalúa el valor escrito en current_state contra los umbrales de
+        cualquiera de los códigos (state_code y tipo de sensor).
+
+        Sin transaccion los cambios se dan por confirmados en el momento
+        (conexión en autocommit).
+        """
+        self._comprobar_cambios(conn)
+
+        disparar: List[Umbral] = []
+        resolver: List[Umbral] = []
+
+        with self._lock:
+            self._evaluaciones += 1
+            for codigo in codigos:
+                for umbral in self._indice.get(codigo, ()):
+                    clave = (device_id, umbral.id)
+                    duena = self._en_curso.get(clave)
+                    if duena is not None and duena is not transaccion:
+                        continue
+                    if transaccion is not None and clave in transaccion.cambios:
+                        activa = transaccion.cambios[clave]
+                    else:
+                        activa = clave in self._activas
+
+                    if not activa and umbral.superado(valor):
+                        disparar.append(umbral)
+                    elif activa and umbral.normalizado(valor):
+                        resolver.append(umbral)
+                    else:
+                        continue
+
+                    if transaccion is None:
+                        self._aplicar([(clave, not activa)])
+                    else:
+                        transaccion.cambios[clave] = not activa
+                        self._en_curso[clave] = transaccion
+
+        if not disparar and not resolver:
+            return
+
+        # Las escrituras van fuera del lock: solo ocurren en los cambios
+        ahora = datetime.now()
+        cursor = conn.cursor()
+        for umbral in disparar:
+            datos = _Datos(contexto or {})
+            datos.update({"valor": valor, "umbral": umbral.valor, "operador": umbral.operador})
+            cursor.execute(
+                """
+                INSERT INTO events (device_id, event_type, severity, title, description, event_time, payload)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """,
+                (
+                    device_id,
+                    self.EVENT_TYPE,
+                    umbral.severity,
+                    umbral.title,
+                    umbral.descripcion(datos),
+                    ahora,
+                    json.dumps({
+                        "threshold_id": umbral.id,
+                        "state_code": umbral.state_code,
+                        "operator": umbral.operador,
+                        "threshold_value": umbral.valor,
+                        "value": valor,
+                        **({"sensor_name": contexto["sensor"]} if contexto and "sensor" in contexto else {}),
+                    }, ensure_ascii=False),
+                )
+            )
+
+        # Se resuelve por (dispositivo, umbral), no por un id recordado: así
+        # se cierra también cualquier evento abierto que no esté en memoria
+        for umbral in resolver:
+            cursor.execute(
+                """
+                UPDATE events SET is_resolved = 1, resolved_at = %s
+                WHERE event_type = %s AND is_resolved = 0 AND device_id = %s
+                  AND JSON_EXTRACT(payload, '$.threshold_id') = %s
+                """,
+                (ahora, self.EVENT_TYPE, device_id, umbral.id)
+            )
+        cursor.close()
+
+        if transaccion is not None:
+            transaccion.disparadas += len(disparar)
+            transaccion.resueltas += len(resolver)
+        else:
+            with self._lock:
+                self._disparadas += len(disparar)
+                self._resueltas += len(resolver)
+
+    def alertas_activas(self) -> List[Tuple[int, int]]:
+        with self._lock:
+            return list(self._activas)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "umbrales": sum(len(umbrales) for umbrales in self._indice.values()),
+                "activas": len(self._activas),
+                "evaluaciones": self._evaluaciones,
+                "disparadas": self._disparadas,
+                "resueltas": self._resueltas,
+                "recargas": self._recargas,
+            }
@@ -1,30 +1,147 @@
+import gzip
+import json
+import math
+import os
 import sys
+from datetime import datetime
 from pathlib import Path
-from typing import Optional, List
+from typing import Dict, Literal, Optional, List
 
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import FastAPI, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
 # Añadir la raíz del proyecto al path
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
-from models.db import get_connection
+from models.binary_ingest import decodificar_lote
+from models.db_pool import backend, pool
+from models.edge_sync import EdgeLog, EdgeSyncWorker
+from models.ingest_buffer import IngestBuffer
+from models.ingest_dedup import DedupCache
+from models.live_feed import LiveFeed
 from models.sensor_data_manager import SensorDataManager
+from models.sensor_export import columnas_exportacion, comprimir_gzip, generar_csv, generar_ndjson
 
 app = FastAPI(title="Tannhäuser API", version="1.0.0")
 
-sensor_manager = SensorDataManager()
+# Modo tienda (edge): con TANNHAUSER_EDGE_UPSTREAM cada lectura se anota
+# primero en un registro local que se envía en lotes al servidor central.
+edge_log: Optional[EdgeLog] = None
+edge_sync: Optional[EdgeSyncWorker] = None
+if os.getenv("TANNHAUSER_EDGE_UPSTREAM"):
+    edge_log = EdgeLog(
+        os.getenv("TANNHAUSER_EDGE_LOG", "edge_log"),
+        fsync=os.getenv("TANNHAUSER_EDGE_FSYNC", "0") == "1",
+    )
+    edge_sync = EdgeSyncWorker(
+        edge_log,
+        os.environ["TANNHAUSER_EDGE_UPSTREAM"],
+        os.getenv("TANNHAUSER_EDGE_ID", "tienda"),
+        intervalo=float(os.getenv("TANNHAUSER_EDGE_SYNC_INTERVAL", "30")),
+        max_registros=int(os.getenv("TANNHAUSER_EDGE_SYNC_BATCH", "5000")),
+    )
 
+sensor_manager = SensorDataManager(registro_local=edge_log)
 
-class ReadingIn(BaseModel):
+# Feed en directo (/sensors/live): recibe los cambios de current_state ya
+# confirmados y los reparte por SSE a los paneles conectados.
+live_feed = LiveFeed(
+    ventana=float(os.getenv("TANNHAUSER_LIVE_WINDOW", "0.25")),
+    max_clientes=int(os.getenv("TANNHAUSER_LIVE_MAX_CLIENTS", "100")),
+)
+sensor_manager.agregar_oyente(live_feed.publicar)
+
+# Modo de ingesta asíncrona: los endpoints /ingest/* encolan y responden 202,
+# y un hilo escribe en la BBDD por microlotes.
+ingest_buffer: Optional[IngestBuffer] = None
+if os.getenv("TANNHAUSER_INGEST_ASYNC", "0") == "1":
+    ingest_buffer = IngestBuffer(
+        sensor_manager,
+        max_size=int(os.getenv("TANNHAUSER_INGEST_QUEUE_SIZE", "10000")),
+        batch_size=int(os.getenv("TANNHAUSER_INGEST_BATCH_SIZE", "200")),
+        flush_interval=float(os.getenv("TANNHAUSER_INGEST_FLUSH_INTERVAL", "0.5")),
+        spool_path=os.getenv("TANNHAUSER_INGEST_SPOOL") or None,
+        fsync=os.getenv("TANNHAUSER_INGEST_FSYNC", "0") == "1",
+        dead_letter_path=os.getenv("TANNHAUSER_INGEST_DEAD_LETTER") or None,
+    )
+
+
+@app.on_event("startup")
+def iniciar_ingesta():
+    if ingest_buffer:
+        ingest_buffer.iniciar()
+    if edge_sync:
+        edge_sync.iniciar()
+
+
+@app.on_event("shutdown")
+def detener_ingesta():
+    if ingest_buffer:
+        ingest_buffer.detener()
+    if edge_sync:
+        edge_sync.detener()
+        edge_log.cerrar()
+
+
+def lectura_duplicada(sensor_name: str, data: Dict):
+    return {
+        "status": "duplicate",
+        "message": "Lectura ya recibida, no se guarda de nuevo",
+        "data": {"sensor_name": sensor_name, **data}
+    }
+
+
+def cola_llena(response: Response):
+    response.status_code = 429
+    response.headers["Retry-After"] = "1"
+    return {
+        "status": "error",
+        "message": "La cola de ingesta está llena, reintente más tarde",
+        "ingest": ingest_buffer.estadisticas()
+    }
+
+
+def no_guardada(response: Response, mensaje: str):
+    # Ni la BBDD ni el registro local la aceptaron: la placa debe reintentar
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return {
+        "status": "error",
+        "message": mensaje,
+        "details": "No se pudo conectar con la BBDD"
+    }
+
+
+class IdempotentIn(BaseModel):
+    # Clave explícita, o identificador de arranque de la placa + número de
+    # secuencia: el reintento de una lectura ya guardada se descarta en
+    # lugar de duplicarla
+    seq: Optional[int] = None
+    boot: Optional[int] = Field(None, ge=1)
+    idempotency_key: Optional[str] = Field(None, max_length=64)
+
+    def clave_idempotencia(self) -> Optional[str]:
+        if self.idempotency_key:
+            return self.idempotency_key
+        # La secuencia vuelve a 0 al reiniciar la placa: sin el arranque no
+        # identifica la lectura y se ignora. Mismo formato que la ingesta binaria.
+        if self.seq is not None and self.boot:
+            return f"{self.boot:x}-{self.seq}"
+        return None
+
+
+class ReadingIn(IdempotentIn):
     sensor_name: str
     value: str | float | int
     source: Optional[str] = "esp32"
 
 
-class BatchReadingItem(BaseModel):
+class BatchReadingItem(IdempotentIn):
     sensor_name: str
     value: str | float | int
+    recorded_at: Optional[datetime] = None
 
 
 class BatchReadingsIn(BaseModel):
@@ -32,7 +149,7 @@ class BatchReadingsIn(BaseModel):
     readings: List[BatchReadingItem]
 
 
-class OrdinaryReadingIn(BaseModel):
+class OrdinaryReadingIn(IdempotentIn):
     numeric_value: int | float
     text_value: str
     source: Optional[str] = "esp32"
@@ -45,13 +162,15 @@ def root():
 
 @app.get("/health")
 def health():
-    conn = get_connection()
+    conn = pool.obtener()
 
     if not conn:
         return {
             "status": "error",
             "database": "down",
-            "details": "No se pudo conectar con MySQL"
+            "backend": backend.nombre,
+            "details": "No se pudo conectar con la base de datos",
+            "pool": pool.estadisticas()
         }
 
     try:
@@ -64,7 +183,9 @@ def health():
         return {
             "status": "ok",
             "database": "ok",
-            "details": f"Conexión correcta con la base de datos: {db[0]}"
+            "backend": backend.nombre,
+            "details": f"Conexión correcta con la base de datos: {db[0]}",
+            "pool": pool.estadisticas()
         }
     except Exception as e:
         try:
@@ -75,18 +196,84 @@ def health():
         return {
             "status": "error",
             "database": "down",
-            "details": str(e)
+            "details": str(e),
+            "pool": pool.estadisticas()
         }
 
 
+@app.get("/health/pool")
+def health_pool():
+    return {
+        "status": "ok",
+        "pool": pool.estadisticas()
+    }
+
+
+@app.get("/health/ingest")
+def health_ingest():
+    return {
+        "status": "ok",
+        "mode": "async" if ingest_buffer else "sync",
+        "ingest": ingest_buffer.estadisticas() if ingest_buffer else None,
+        "dedup": sensor_manager.dedup.estadisticas()
+    }
+
+
+@app.get("/health/edge")
+def health_edge():
+    return {
+        "status": "ok",
+        "mode": "edge" if edge_sync else "central",
+        "edge": edge_sync.estadisticas() if edge_sync else None
+    }
+
+
+@app.get("/health/alerts")
+def health_alerts():
+    return {
+        "status": "ok",
+        "alerts": sensor_manager.alertas.estadisticas()
+    }
+
+
+@app.get("/health/live")
+def health_live():
+    return {
+        "status": "ok",
+        "live": live_feed.estadisticas()
+    }
+
+
 @app.post("/ingest/readings")
-def ingest_reading(reading: ReadingIn):
+def ingest_reading(reading: ReadingIn, response: Response):
+    clave = reading.clave_idempotencia()
+    if sensor_manager.lectura_duplicada(reading.sensor_name, clave):
+        return lectura_duplicada(reading.sensor_name, {"value": reading.value, "idempotency_key": clave})
+
+    if ingest_buffer:
+        if not ingest_buffer.encolar_lectura(reading.sensor_name, reading.value, reading.source or "esp32", clave):
+            return cola_llena(response)
+
+        response.status_code = 202
+        return {
+            "status": "accepted",
+            "message": "Lectura recibida, pendiente de guardar",
+            "data": {
+                "sensor_name": reading.sensor_name,
+                "value": reading.value,
+                "source": reading.source or "esp32"
+            }
+        }
+
     try:
-        sensor_manager.guardar_lectura_sensor(
+        guardada = sensor_manager.guardar_lectura_sensor(
             nombre_sensor=reading.sensor_name,
             valor=reading.value,
-            source=reading.source or "esp32"
+            source=reading.source or "esp32",
+            idempotency_key=clave
         )
+        if not guardada:
+            return no_guardada(response, "No se pudo guardar la lectura")
 
         return {
             "status": "ok",
@@ -106,21 +293,58 @@ def ingest_reading(reading: ReadingIn):
 
 
 @app.post("/ingest/readings/batch")
-def ingest_readings_batch(batch: BatchReadingsIn):
-    try:
-        for item in batch.readings:
-            sensor_manager.guardar_lectura_sensor(
-                nombre_sensor=item.sensor_name,
-                valor=item.value,
-                source=batch.source or "esp32"
-            )
+def ingest_readings_batch(batch: BatchReadingsIn, response: Response):
+    lecturas = [
+        {
+            "sensor": item.sensor_name,
+            "valor": item.value,
+            "idempotency_key": item.clave_idempotencia(),
+            **({"recorded_at": item.recorded_at} if item.recorded_at else {}),
+        }
+        for item in batch.readings
+    ]
+
+    if ingest_buffer:
+        if not ingest_buffer.encolar_lote(lecturas, batch.source or "esp32"):
+            return cola_llena(response)
 
+        response.status_code = 202
         return {
-            "status": "ok",
-            "message": "Lecturas por lote guardadas correctamente",
+            "status": "accepted",
+            "message": "Lote recibido, pendiente de guardar",
             "total": len(batch.readings),
             "source": batch.source or "esp32"
         }
+
+    try:
+        resultados = sensor_manager.guardar_lecturas_lote(
+            lecturas,
+            source=batch.source or "esp32"
+        )
+        guardadas = sum(1 for r in resultados if r["estado"] == "ok")
+        duplicadas = sum(1 for r in resultados if r["estado"] == "duplicada")
+        fallidas = len(resultados) - guardadas - duplicadas
+
+        return {
+            "status": "ok" if not fallidas else "partial",
+            "message": "Lecturas por lote guardadas correctamente"
+            if not fallidas
+            else "Algunas lecturas del lote no se pudieron guardar",
+            "total": len(batch.readings),
+            "saved": guardadas,
+            "duplicates": duplicadas,
+            "failed": fallidas,
+            "source": batch.source or "esp32",
+            "results": [
+                {
+                    "index": r["indice"],
+                    "sensor_name": r["sensor"],
+                    "status": r["estado"],
+                    **({"details": r["detalle"]} if "detalle" in r else {}),
+                }
+                for r in resultados
+            ]
+        }
     except Exception as e:
         return {
             "status": "error",
@@ -128,14 +352,162 @@ def ingest_readings_batch(batch: BatchReadingsIn):
             "details": str(e)
         }
 
+
+VALOR_NO_FINITO = "Valor no finito (NaN o infinito)"
+
+
+@app.post("/ingest/readings/binary")
+async def ingest_readings_binary(request: Request, response: Response, source: str = "esp32"):
+    """
+    Lote en el formato binario compacto de la ESP32 (ver binary_ingest).
+    Responde como /ingest/readings/batch pero solo detalla las lecturas que
+    no se guardaron.
+    """
+    try:
+        lecturas, ordinarias = decodificar_lote(await request.body())
+    except ValueError as e:
+        response.status_code = 400
+        return {"status": "error", "message": "Lote binario no válido", "details": str(e)}
+
+    total = len(lecturas) + len(ordinarias)
+
+    # Un float32 NaN o infinito se rechaza solo, sin arrastrar al resto del lote
+    rechazadas = [
+        {"indice": lectura["indice"], "sensor": lectura["sensor"], "estado": "error", "detalle": VALOR_NO_FINITO}
+        for lectura in lecturas
+        if isinstance(lectura["valor"], float) and not math.isfinite(lectura["valor"])
+    ] + [
+        {"indice": indice, "sensor": nombre_sensor, "estado": "error", "detalle": VALOR_NO_FINITO}
+        for indice, nombre_sensor, valor_numerico, *_ in ordinarias
+        if not math.isfinite(valor_numerico)
+    ]
+    if rechazadas:
+        indices_rechazados = {r["indice"] for r in rechazadas}
+        lecturas = [lectura for lectura in lecturas if lectura["indice"] not in indices_rechazados]
+        ordinarias = [ordinaria for ordinaria in ordinarias if ordinaria[0] not in indices_rechazados]
+
+    if ingest_buffer:
+        # Todo el lote o nada: un 429 a medias haría que el reintento duplicase lo ya encolado.
+        # Encolar escribe y hace fsync del spool: fuera del bucle de eventos
+        aceptado = await run_in_threadpool(
+            ingest_buffer.encolar_lote,
+            lecturas,
+            source,
+            ordinarias=[
+                {
+                    "valor_numerico": valor_numerico,
+                    "valor_alfanumerico": valor_alfanumerico,
+                    "idempotency_key": clave,
+                    "recorded_at": recorded_at,
+                }
+                for _, _, valor_numerico, valor_alfanumerico, recorded_at, clave in ordinarias
+            ],
+        )
+        if not aceptado:
+            return cola_llena(response)
+
+        response.status_code = 202
+        return {
+            "status": "accepted",
+            "message": "Lote recibido, pendiente de guardar",
+            "total": total,
+            "accepted": total - len(rechazadas),
+            "rejected": len(rechazadas),
+            "source": source,
+            "errors": [
+                {"index": r["indice"], "sensor_name": r["sensor"], "details": r["detalle"]}
+                for r in sorted(rechazadas, key=lambda r: r["indice"])
+            ],
+        }
+
+    def guardar():
+        resultados = list(rechazadas)
+        if lecturas:
+            for r in sensor_manager.guardar_lecturas_lote(lecturas, source=source):
+                resultados.append({**r, "indice": lecturas[r["indice"]]["indice"]})
+        for indice, nombre_sensor, valor_numerico, valor_alfanumerico, recorded_at, clave in ordinarias:
+            guardada = sensor_manager.guardar_lectura_sensor_ordinario(
+                valor_numerico, valor_alfanumerico, source=source, idempotency_key=clave, recorded_at=recorded_at
+            )
+            resultados.append({
+                "indice": indice,
+                "sensor": nombre_sensor,
+                "estado": "ok" if guardada else "error",
+                **({} if guardada else {"detalle": "No se pudo escribir en la BBDD"}),
+            })
+        return resultados
+
+    try:
+        resultados = await run_in_threadpool(guardar)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": "No se pudieron guardar las lecturas del lote binario",
+            "details": str(e)
+        }
+
+    guardadas = sum(1 for r in resultados if r["estado"] == "ok")
+    duplicadas = sum(1 for r in resultados if r["estado"] == "duplicada")
+    fallidas = [r for r in resultados if r["estado"] == "error"]
+
+    return {
+        "status": "ok" if not fallidas else "partial",
+        "message": "Lecturas del lote binario guardadas correctamente"
+        if not fallidas
+        else "Algunas lecturas del lote binario no se pudieron guardar",
+        "total": total,
+        "saved": guardadas,
+        "duplicates": duplicadas,
+        "failed": len(fallidas),
+        "source": source,
+        "errors": [
+            {
+                "index": r["indice"],
+                "sensor_name": r["sensor"],
+                "details": r.get("detalle"),
+            }
+            for r in sorted(fallidas, key=lambda r: r["indice"])
+        ]
+    }
+
+
 @app.post("/ingest/ordinary")
-def ingest_ordinary_reading(reading: OrdinaryReadingIn):
+def ingest_ordinary_reading(reading: OrdinaryReadingIn, response: Response):
+    clave = reading.clave_idempotencia()
+    if sensor_manager.lectura_duplicada("sensor_ordinario", clave):
+        return lectura_duplicada("sensor_ordinario", {
+            "numeric_value": reading.numeric_value,
+            "text_value": reading.text_value,
+            "idempotency_key": clave
+        })
+
+    if ingest_buffer:
+        if not ingest_buffer.encolar_ordinaria(
+            reading.numeric_value, reading.text_value, reading.source or "esp32", clave
+        ):
+            return cola_llena(response)
+
+        response.status_code = 202
+        return {
+            "status": "accepted",
+            "message": "Lectura del sensor ordinario recibida, pendiente de guardar",
+            "data": {
+                "sensor_name": "sensor_ordinario",
+                "numeric_value": reading.numeric_value,
+                "text_value": reading.text_value,
+                "source": reading.source or "esp32"
+            }
+        }
+
     try:
-        sensor_manager.guardar_lectura_sensor_ordinario(
+        guardada = sensor_manager.guardar_lectura_sensor_ordinario(
             valor_numerico=reading.numeric_value,
             valor_alfanumerico=reading.text_value,
-            source=reading.source or "esp32"
+            source=reading.source or "esp32",
+            idempotency_key=clave
         )
+        if not guardada:
+            return no_guardada(response, "No se pudo guardar la lectura del sensor ordinario")
 
         return {
             "status": "ok",
@@ -153,3 +525,272 @@ def ingest_ordinary_reading(reading: OrdinaryReadingIn):
             "message": "No se pudo guardar la lectura del sensor ordinario",
             "details": str(e)
         }
+
+
+# Claves Idempotency-Key de los lotes de sincronización ya confirmados en la BBDD
+lotes_sincronizados = DedupCache(max_claves=10000)
+
+
+@app.post("/ingest/sync")
+async def ingest_sync(
+    request: Request,
+    response: Response,
+    x_edge_id: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """
+    Recibe un lote NDJSON (opcionalmente con gzip) del registro local de una
+    tienda. Reenviar el mismo lote es seguro: si su Idempotency-Key
+    ("<edge_id>:<primera>-<última>") ya se confirmó se responde sin tocar
+    la BBDD, y en cualquier caso las secuencias ya aplicadas se cuentan
+    como duplicadas. Un reenvío mientras el primer envío sigue en curso
+    espera al bloqueo de edge_sync_state, así que solo se da por aplicado
+    lo que de verdad se confirmó.
+    """
+    if not x_edge_id:
+        response.status_code = 400
+        return {"status": "error", "message": "Falta la cabecera X-Edge-Id"}
+
+    cuerpo = await request.body()
+    try:
+        if request.headers.get("content-encoding", "").lower() == "gzip":
+            cuerpo = gzip.decompress(cuerpo)
+        registros = [json.loads(linea) for linea in cuerpo.decode("utf-8").splitlines() if linea.strip()]
+        if any(not isinstance(r.get("seq"), int) for r in registros):
+            raise ValueError("Todos los registros deben llevar su secuencia (seq)")
+        if idempotency_key and registros:
+            secuencias = [r["seq"] for r in registros]
+            esperada = f"{x_edge_id}:{min(secuencias)}-{max(secuencias)}"
+            if idempotency_key != esperada:
+                raise ValueError(f"La Idempotency-Key no corresponde al lote (se esperaba {esperada})")
+    except (OSError, ValueError, AttributeError) as e:
+        response.status_code = 400
+        return {"status": "error", "message": "Lote de sincronización no válido", "details": str(e)}
+
+    if idempotency_key and registros and lotes_sincronizados.contiene(idempotency_key):
+        return {
+            "status": "ok",
+            "message": "Lote de sincronización ya aplicado",
+            "edge_id": x_edge_id,
+            "total": len(registros),
+            "applied": 0,
+            "duplicates": len(registros),
+            "last_seq": max(r["seq"] for r in registros),
+            "errors": [],
+        }
+
+    try:
+        resultado = await run_in_threadpool(sensor_manager.guardar_lote_sincronizado, x_edge_id, registros)
+        if idempotency_key:
+            lotes_sincronizados.registrar(idempotency_key)
+        return {
+            "status": "ok",
+            "message": "Lote de sincronización aplicado",
+            "edge_id": x_edge_id,
+            "total": len(registros),
+            "applied": resultado["aplicadas"],
+            "duplicates": resultado["duplicadas"],
+            "last_seq": resultado["ultima_seq"],
+            "errors": resultado["errores"],
+        }
+    except Exception as e:
+        response.status_code = 503
+        return {
+            "status": "error",
+            "message": "No se pudo aplicar el lote de sincronización",
+            "details": str(e)
+        }
+
+
+@app.get("/sensors/latest")
+def sensors_latest():
+    try:
+        lecturas = sensor_manager.obtener_ultimas_lecturas()
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": "No se pudieron leer las últimas lecturas",
+            "details": str(e)
+        }
+
+    return {
+        "status": "ok",
+        "count": len(lecturas),
+        "readings": lecturas
+    }
+
+
+@app.get("/sensors/live")
+async def sensors_live(
+    request: Request,
+    response: Response,
+    sensor: Optional[List[str]] = Query(None),
+    device_id: Optional[List[int]] = Query(None),
+    state_code: Optional[List[str]] = Query(None),
+):
+    """
+    Server-Sent Events con cada cambio de current_state (event: state).
+    El estado inicial se pide a /sensors/latest; aquí solo llegan cambios.
+    """
+    suscripcion = live_feed.suscribir(sensores=sensor, dispositivos=device_id, state_codes=state_code)
+    if suscripcion is None:
+        response.status_code = 503
+        return {
+            "status": "error",
+            "message": "Demasiados clientes conectados al feed en directo",
+            "details": live_feed.max_clientes
+        }
+
+    return StreamingResponse(
+        live_feed.eventos_sse(suscripcion, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/sensors/{sensor_name}/latest")
+def sensor_latest(sensor_name: str, response: Response):
+    try:
+        lecturas = sensor_manager.obtener_ultimas_lecturas(sensor_name)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": "No se pudo leer la última lectura",
+            "details": str(e)
+        }
+
+    if not lecturas:
+        response.status_code = 404
+        return {
+            "status": "error",
+            "message": "El sensor no tiene lecturas",
+            "details": sensor_name
+        }
+
+    return {
+        "status": "ok",
+        "sensor_name": sensor_name,
+        "reading": lecturas[0]
+    }
+
+
+@app.get("/sensors/{sensor_name}/readings")
+def sensor_readings(
+    sensor_name: str,
+    response: Response,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    order: Literal["asc", "desc"] = "asc",
+):
+    try:
+        pagina = sensor_manager.leer_pagina_lecturas(
+            sensor_name,
+            desde=since,
+            hasta=until,
+            limite=limit,
+            cursor=cursor,
+            descendente=order == "desc",
+        )
+    except ValueError as e:
+        response.status_code = 400
+        return {
+            "status": "error",
+            "message": "Parámetros de consulta no válidos",
+            "details": str(e)
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": "No se pudieron leer las lecturas",
+            "details": str(e)
+        }
+
+    return {
+        "status": "ok",
+        "sensor_name": sensor_name,
+        "count": len(pagina["lecturas"]),
+        "next_cursor": pagina["cursor"],
+        "readings": pagina["lecturas"]
+    }
+
+
+@app.get("/sensors/{sensor_name}/export")
+def sensor_export(
+    sensor_name: str,
+    response: Response,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    comprimir: bool = Query(False, alias="gzip"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    try:
+        bloques = sensor_manager.exportar_lecturas(sensor_name, desde=since, hasta=until)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": "No se pudo exportar el histórico",
+            "details": str(e)
+        }
+
+    if bloques is None:
+        response.status_code = 404
+        return {
+            "status": "error",
+            "message": "Sensor sin datos o base de datos no disponible",
+            "details": sensor_name
+        }
+
+    if format == "csv":
+        contenido = generar_csv(bloques, columnas_exportacion(sensor_name))
+        media_type = "text/csv"
+    else:
+        contenido = generar_ndjson(bloques)
+        media_type = "application/x-ndjson"
+
+    nombre_fichero = f"{sensor_name}.{format}"
+    if comprimir:
+        contenido = comprimir_gzip(contenido)
+        media_type = "application/gzip"
+        nombre_fichero += ".gz"
+
+    return StreamingResponse(
+        contenido,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nombre_fichero}"'}
+    )
+
+
+@app.get("/sensors/{sensor_name}/series")
+def sensor_series(
+    sensor_name: str,
+    response: Response,
+    since: datetime,
+    until: Optional[datetime] = None,
+    max_points: int = Query(500, ge=1, le=5000),
+):
+    if until and until < since:
+        response.status_code = 400
+        return {
+            "status": "error",
+            "message": "Parámetros de consulta no válidos",
+            "details": "until debe ser posterior a since"
+        }
+
+    try:
+        serie = sensor_manager.obtener_serie(sensor_name, since, until, max_points)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": "No se pudo leer la serie",
+            "details": str(e)
+        }
+
+    return {
+        "status": "ok",
+        "sensor_name": sensor_name,
+        "resolution": serie["resolucion"],
+        "count": len(serie["puntos"]),
+        "points": serie["puntos"]
+    }
@@ -0,0 +1,144 @@
+"""
+Formato binario compacto para los lotes de la ESP32 (little-endian).
+
+Cabecera (20 bytes):
+    4s  magia "TNB1"
+    H   número de registros
+    B   ancho del texto de cada registro (0-64 bytes)
+    B   reservado
+    I   instante del envío en segundos Unix (0 = hora del servidor)
+    I   identificador del arranque de la placa (0 = sin idempotencia)
+    I   secuencia del primer registro
+
+Registro (10 bytes + ancho del texto):
+    B   id del sensor (SENSORES_BINARIOS)
+    B   flags (bit 0: el registro lleva texto)
+    I   antigüedad de la lectura en ms respecto al envío
+    f   valor (float32)
+    Ns  texto rellenado con NUL
+
+Con identificador de arranque, la clave de idempotencia del registro i es
+"{arranque:x}-{primera_seq + i}", la misma que usa el envío JSON del sketch.
+"""
+
+import struct
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+MAGIA = b"TNB1"
+CABECERA = struct.Struct("<4sHBBIII")
+MAX_ANCHO_TEXTO = 64
+FLAG_TEXTO = 0x01
+
+# Ids fijos del protocolo: no reordenar, la placa los lleva compilados
+SENSORES_BINARIOS = {
+    1: "sensor_temperatura",
+    2: "sensor_humedad",
+    3: "sensor_luz",
+    4: "sensor_nevera",
+    5: "sensor_puerta",
+    6: "sensor_ordinario",
+}
+
+_formatos: Dict[int, struct.Struct] = {}
+
+
+def formato_registro(ancho_texto: int) -> struct.Struct:
+    formato = _formatos.get(ancho_texto)
+    if formato is None:
+        formato = _formatos[ancho_texto] = struct.Struct(f"<BBIf{ancho_texto}s")
+    return formato
+
+
+def decodificar_lote(
+    datos: bytes, ahora: Optional[datetime] = None
+) -> Tuple[List[Dict], List[Tuple[int, str, float, str, datetime, Optional[str]]]]:
+    """
+    Decodifica un lote binario sin copiar el cuerpo (memoryview + iter_unpack).
+
+    Devuelve (lecturas, ordinarias):
+    - lecturas: dicts para SensorDataManager.guardar_lecturas_lote, con
+      "indice" (posición en el lote) y sensor None si el id es desconocido.
+    - ordinarias: (indice, sensor, valor_numerico, valor_alfanumerico,
+      recorded_at, idempotency_key) del sensor ordinario.
+
+    Lanza ValueError si la cabecera o el tamaño no son válidos.
+    """
+    vista = memoryview(datos)
+    if len(vista) < CABECERA.size:
+        raise ValueError("Lote binario demasiado corto")
+
+    magia, total, ancho_texto, _, enviado, arranque, primera_seq = CABECERA.unpack_from(vista)
+    if magia != MAGIA:
+        raise ValueError("Formato de lote binario desconocido")
+    if ancho_texto > MAX_ANCHO_TEXTO:
+        raise ValueError("Ancho de texto no válido")
+
+    formato = formato_registro(ancho_texto)
+    cuerpo = vista[CABECERA.size:]
+    if len(cuerpo) != total * formato.size:
+        raise ValueError(f"Se esperaban {total} registros de {formato.size} bytes")
+
+    base = datetime.fromtimestamp(enviado) if enviado else (ahora or datetime.now())
+    prefijo = f"{arranque:x}-" if arranque else None
+
+    lecturas = []
+    ordinarias = []
+    # Las lecturas de una misma pasada del loop comparten antigüedad
+    fechas: Dict[int, datetime] = {}
+    for indice, (sensor_id, flags, edad_ms, valor, texto) in enumerate(formato.iter_unpack(cuerpo)):
+        nombre_sensor = SENSORES_BINARIOS.get(sensor_id)
+        recorded_at = fechas.get(edad_ms)
+        if recorded_at is None:
+            recorded_at = fechas[edad_ms] = base - timedelta(milliseconds=edad_ms)
+        clave = f"{prefijo}{primera_seq + indice}" if prefijo else None
+        # float32: se redondea para no guardar 21.299999237 en lugar de 21.3
+        valor = round(valor, 4)
+
+        if flags & FLAG_TEXTO:
+            texto = texto.split(b"\0", 1)[0].decode("utf-8", "replace")
+        else:
+            texto = None
+
+        if nombre_sensor == "sensor_ordinario":
+            ordinarias.append((indice, nombre_sensor, valor, texto or "", recorded_at, clave))
+            continue
+
+        lecturas.append({
+            "indice": indice,
+            "sensor": nombre_sensor,
+            "valor": texto if texto is not None else valor,
+            "recorded_at": recorded_at,
+            "idempotency_key": clave,
+        })
+
+    return lecturas, ordinarias
+
+
+def codificar_lote(
+    registros: List[Tuple[int, int, float, Optional[str]]],
+    ancho_texto: int = 0,
+    enviado: int = 0,
+    arranque: int = 0,
+    primera_seq: int = 0,
+) -> bytes:
+    """
+    Construye un lote binario a partir de (sensor_id, edad_ms, valor, texto).
+    Es lo que hace el sketch en la placa; sirve para pruebas y simuladores.
+    """
+    formato = formato_registro(ancho_texto)
+    salida = bytearray(CABECERA.size + len(registros) * formato.size)
+    CABECERA.pack_into(salida, 0, MAGIA, len(registros), ancho_texto, 0, enviado, arranque, primera_seq)
+
+    for posicion, (sensor_id, edad_ms, valor, texto) in enumerate(registros):
+        datos_texto = texto.encode("utf-8")[:ancho_texto] if texto is not None else b""
+        formato.pack_into(
+            salida,
+            CABECERA.size + posicion * formato.size,
+            sensor_id,
+            FLAG_TEXTO if texto is not None else 0,
+            edad_ms,
+            float(valor),
+            datos_texto,
+        )
+    return bytes(salida)
@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from models.storage_backends import crear_backend_desde_entorno
+
+
+class PooledConnection:
+    """
+    Conexión prestada por el pool. Se usa igual que la conexión original,
+    pero close() la devuelve al pool en lugar de cerrar el socket.
+    """
+
+    def __init__(self, pool: "ConnectionPool", raw):
+        self._pool = pool
+        self._raw = raw
+        self._devuelta = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if not self._devuelta:
+            self._devuelta = True
+            self._pool._devolver(self._raw)
+
+    def descartar(self):
+        """Cierra la conexión de verdad en lugar de devolverla (p. ej. con resultados sin leer)."""
+        if not self._devuelta:
+            self._devuelta = True
+            self._pool._descartar(self._raw)
+
+    def __del__(self):
+        # Red de seguridad: si un camino de error no llega a llamar a close(),
+        # el hueco del pool se recupera cuando se libera el objeto.
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones a la BBDD construido sobre factory() (por defecto,
+    conectar() del motor de almacenamiento configurado).
+
+    - Mantiene entre min_size y max_size conexiones abiertas.
+    - Comprueba que la conexión sigue viva al prestarla.
+    - Recicla las conexiones que llevan más de max_idle segundos sin usarse.
+    - Si no hay conexiones libres espera hasta timeout segundos y devuelve
+      None, igual que factory() cuando la BBDD no está disponible.
+    """
+
+    def __init__(
+        self,
+        factory: Optional[Callable] = None,
+        min_size: int = 2,
+        max_size: int = 10,
+        timeout: float = 5.0,
+        max_idle: float = 300.0,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Tamaños de pool no válidos")
+
+        self.factory = factory or backend.conectar
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+
+        self._cond = threading.Condition()
+        self._libres = deque()  # (conexión, instante del último uso)
+        self._abiertas = 0
+        self._en_uso = 0
+        self._precalentado = False
+
+        self._esperas = 0
+        self._timeouts = 0
+        self._creadas = 0
+        self._recicladas = 0
+        self._descartadas = 0
+
+    def _crear_conexion(self):
+        try:
+            raw = self.factory()
+        except Exception:
+            raw = None
+
+        with self._cond:
+            if raw:
+                self._creadas += 1
+            else:
+                self._abiertas -= 1
+                self._cond.notify()
+        return raw
+
+    def _cerrar(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._abiertas -= 1
+            self._cond.notify()
+
+    def _esta_viva(self, raw) -> bool:
+        try:
+            if hasattr(raw, "is_connected"):
+                return bool(raw.is_connected())
+            cursor = raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _precalentar(self):
+        with self._cond:
+            if self._precalentado:
+                return
+            self._precalentado = True
+            pendientes = max(0, self.min_size - self._abiertas)
+            self._abiertas += pendientes
+
+        for _ in range(pendientes):
+            raw = self._crear_conexion()
+            if raw:
+                with self._cond:
+                    self._libres.append((raw, time.monotonic()))
+                    self._cond.notify()
+
+    def obtener(self) -> Optional[PooledConnection]:
+        if not self._precalentado:
+            self._precalentar()
+
+        limite = time.monotonic() + self.timeout
+        ha_esperado = False
+
+        while True:
+            raw = None
+            crear = False
+
+            with self._cond:
+                while True:
+                    if self._libres:
+                        raw, ultimo_uso = self._libres.pop()
+                        break
+                    if self._abiertas < self.max_size:
+                        self._abiertas += 1
+                        crear = True
+                        break
+
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._timeouts += 1
+                        return None
+                    if not ha_esperado:
+                        self._esperas += 1
+                        ha_esperado = True
+                    self._cond.wait(restante)
+
+            if crear:
+                raw = self._crear_conexion()
+                if not raw:
+                    return None
+            elif time.monotonic() - ultimo_uso > self.max_idle:
+                with self._cond:
+                    self._recicladas += 1
+                self._cerrar(raw)
+                continue
+            elif not self._esta_viva(raw):
+                with self._cond:
+                    self._descartadas += 1
+                self._cerrar(raw)
+                continue
+
+            with self._cond:
+                self._en_uso += 1
+            return PooledConnection(self, raw)
+
+    def _devolver(self, raw):
+        # Cualquier transacción sin confirmar se descarta antes de reutilizarla
+        try:
+            raw.rollback()
+        except Exception:
+            self._descartar(raw)
+            return
+
+        with self._cond:
+            self._en_uso -= 1
+            self._libres.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    def _descartar(self, raw):
+        with self._cond:
+            self._en_uso -= 1
+            self._descartadas += 1
+        self._cerrar(raw)
+
+    def cerrar_todas(self):
+        with self._cond:
+            libres = list(self._libres)
+            self._libres.clear()
+            self._precalentado = False
+        for raw, _ in libres:
+            self._cerrar(raw)
+
+    def estadisticas(self) -> Dict:
+        with self._cond:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "abiertas": self._abiertas,
+                "en_uso": self._en_uso,
+                "libres": len(self._libres),
+                "esperas": self._esperas,
+                "timeouts": self._timeouts,
+                "creadas": self._creadas,
+                "recicladas": self._recicladas,
+                "descartadas": self._descartadas,
+            }
+
+
+# Motor elegido con TANNHAUSER_DB_BACKEND (MySQL o SQLite embebido)
+backend = crear_backend_desde_entorno()
+
+pool = ConnectionPool(
+    factory=backend.conectar,
+    min_size=int(os.getenv("TANNHAUSER_DB_POOL_MIN", "2")),
+    max_size=int(os.getenv("TANNHAUSER_DB_POOL_MAX", "10")),
+    timeout=float(os.getenv("TANNHAUSER_DB_POOL_TIMEOUT", "5")),
+    max_idle=float(os.getenv("TANNHAUSER_DB_POOL_MAX_IDLE", "300")),
+)
+
+
+def get_pooled_connection() -> Optional[PooledConnection]:
+    return pool.obtener()
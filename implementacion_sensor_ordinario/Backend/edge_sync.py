@@ -0,0 +1,290 @@
+import gzip
+import json
+import os
+import threading
+import urllib.request
+from typing import Dict, List, Optional
+
+
+class EdgeLog:
+    """
+    Registro local de solo anexado para las lecturas de una tienda.
+
+    Cada lectura recibe un número de secuencia creciente y se escribe en un
+    segmento NDJSON del directorio `directorio` antes de ir a la BBDD local,
+    así que un corte de esta no la pierde. Si la escritura se reintenta la
+    lectura puede quedar dos veces, con la misma clave de idempotencia, y
+    el servidor central descarta la repetida. Un fichero de checkpoint guarda la última secuencia confirmada por el
+    servidor central; los segmentos ya confirmados se borran.
+    """
+
+    def __init__(self, directorio: str, max_bytes_segmento: int = 8 * 1024 * 1024, fsync: bool = False):
+        self.directorio = directorio
+        self.max_bytes_segmento = max_bytes_segmento
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._checkpoint_path = os.path.join(directorio, "checkpoint")
+        self._actual = None
+
+        os.makedirs(directorio, exist_ok=True)
+        self.confirmada = self._leer_checkpoint()
+        self.ultima_seq = max(self.confirmada, self._ultima_seq_en_disco())
+
+    # ----------------------- segmentos -----------------------
+
+    def _segmentos(self) -> List[str]:
+        return sorted(
+            nombre for nombre in os.listdir(self.directorio)
+            if nombre.startswith("segmento_") and nombre.endswith(".ndjson")
+        )
+
+    @staticmethod
+    def _primera_seq(nombre_segmento: str) -> int:
+        return int(nombre_segmento[len("segmento_"):-len(".ndjson")])
+
+    def _ultima_seq_en_disco(self) -> int:
+        segmentos = self._segmentos()
+        if not segmentos:
+            return 0
+
+        ruta = os.path.join(self.directorio, segmentos[-1])
+        self._recortar_linea_parcial(ruta)
+        ultima = self._primera_seq(segmentos[-1]) - 1
+        with open(ruta, "r", encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    ultima = max(ultima, json.loads(linea)["seq"])
+                except (ValueError, KeyError):
+                    continue
+        return ultima
+
+    @staticmethod
+    def _recortar_linea_parcial(ruta: str):
+        """
+        Quita la última línea si quedó a medio escribir (la app se cortó),
+        para que el siguiente registro no se pegue a ella.
+        """
+        with open(ruta, "r+b") as f:
+            tamano = f.seek(0, os.SEEK_END)
+            fin = tamano
+            while fin > 0:
+                inicio = max(0, fin - 4096)
+                f.seek(inicio)
+                salto = f.read(fin - inicio).rfind(b"\n")
+                if salto >= 0:
+                    fin = inicio + salto + 1
+                    break
+                fin = inicio
+            if fin < tamano:
+                f.truncate(fin)
+
+    def _leer_checkpoint(self) -> int:
+        if not os.path.exists(self._checkpoint_path):
+            return 0
+        with open(self._checkpoint_path, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+
+    def _abrir_segmento(self, primera_seq: int):
+        if self._actual:
+            self._actual.close()
+        ruta = os.path.join(self.directorio, f"segmento_{primera_seq:012d}.ndjson")
+        self._actual = open(ruta, "a", encoding="utf-8")
+
+    # ----------------------- escritura -----------------------
+
+    def anexar(self, registros: List[Dict]) -> List[int]:
+        """Anexa los registros y devuelve la secuencia asignada a cada uno."""
+        with self._lock:
+            if self._actual is None or self._actual.tell() >= self.max_bytes_segmento:
+                self._abrir_segmento(self.ultima_seq + 1)
+
+            anterior = self.ultima_seq
+            tamano = os.fstat(self._actual.fileno()).st_size
+            secuencias = []
+            lineas = []
+            for registro in registros:
+                self.ultima_seq += 1
+                secuencias.append(self.ultima_seq)
+                lineas.append(json.dumps({**registro, "seq": self.ultima_seq}, ensure_ascii=False, default=str))
+
+            try:
+                self._actual.write("\n".join(lineas) + "\n")
+                self._actual.flush()
+                if self.fsync:
+                    os.fsync(self._actual.fileno())
+            except OSError:
+                # Sin espacio o error de E/S: se quita lo que llegara a escribirse,
+                # para no dejar media línea ni secuencias que se volverán a usar
+                ruta = self._actual.name
+                try:
+                    self._actual.close()
+                except OSError:
+                    pass
+                self._actual = None
+                os.truncate(ruta, tamano)
+                self.ultima_seq = anterior
+                raise
+            return secuencias
+
+    # ----------------------- lectura y confirmación -----------------------
+
+    def leer_pendientes(self, max_registros: int) -> List[Dict]:
+        """Primeros registros aún no confirmados, en orden de secuencia."""
+        with self._lock:
+            if self._actual:
+                self._actual.flush()
+            desde = self.confirmada
+            segmentos = self._segmentos()
+
+        pendientes = []
+        for posicion, nombre in enumerate(segmentos):
+            siguiente = segmentos[posicion + 1] if posicion + 1 < len(segmentos) else None
+            if siguiente and self._primera_seq(siguiente) <= desde + 1:
+                continue
+
+            with open(os.path.join(self.directorio, nombre), "r", encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        registro = json.loads(linea)
+                    except ValueError:
+                        # Una línea dañada no oculta las siguientes
+                        continue
+                    if registro["seq"] <= desde:
+                        continue
+                    pendientes.append(registro)
+                    if len(pendientes) >= max_registros:
+                        return pendientes
+        return pendientes
+
+    def confirmar(self, hasta_seq: int):
+        """Marca como sincronizado todo hasta hasta_seq y borra los segmentos completos."""
+        with self._lock:
+            if hasta_seq <= self.confirmada:
+                return
+            self.confirmada = hasta_seq
+
+            tmp_path = f"{self._checkpoint_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(str(hasta_seq))
+            os.replace(tmp_path, self._checkpoint_path)
+
+            segmentos = self._segmentos()
+            for posicion, nombre in enumerate(segmentos[:-1]):
+                if self._primera_seq(segmentos[posicion + 1]) <= hasta_seq + 1:
+                    os.remove(os.path.join(self.directorio, nombre))
+
+    def pendientes(self) -> int:
+        with self._lock:
+            return self.ultima_seq - self.confirmada
+
+    def cerrar(self):
+        with self._lock:
+            if self._actual:
+                self._actual.close()
+                self._actual = None
+
+
+class EdgeSyncWorker:
+    """
+    Hilo que envía el EdgeLog al servidor central (POST /ingest/sync) en
+    lotes NDJSON comprimidos con gzip. Cada envío lleva el identificador de
+    la tienda y una clave de idempotencia con su rango de secuencias, así que
+    repetir un envío tras un corte no duplica lecturas. Solo avanza el
+    checkpoint cuando el servidor confirma el lote.
+    """
+
+    def __init__(
+        self,
+        registro: EdgeLog,
+        url: str,
+        edge_id: str,
+        intervalo: float = 30.0,
+        max_registros: int = 5000,
+        timeout: float = 30.0,
+    ):
+        self.registro = registro
+        self.url = url
+        self.edge_id = edge_id
+        self.intervalo = intervalo
+        self.max_registros = max_registros
+        self.timeout = timeout
+
+        self._parar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+        self._envios = 0
+        self._enviados = 0
+        self._fallos = 0
+        self._ultimo_error: Optional[str] = None
+
+    def iniciar(self):
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="edge-sync", daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout: float = 30.0):
+        self._parar.set()
+        if self._hilo:
+            self._hilo.join(timeout)
+
+    def _bucle(self):
+        espera_error = 0.0
+        while not self._parar.is_set():
+            try:
+                while self.sincronizar_lote():
+                    espera_error = 0.0
+                    if self._parar.is_set():
+                        return
+                espera = self.intervalo
+            except Exception as e:
+                self._fallos += 1
+                self._ultimo_error = str(e)
+                espera_error = min(self.intervalo, max(1.0, espera_error * 2))
+                espera = espera_error
+            self._parar.wait(espera)
+
+    def sincronizar_lote(self) -> bool:
+        """Envía un lote; devuelve False si no había nada pendiente."""
+        registros = self.registro.leer_pendientes(self.max_registros)
+        if not registros:
+            return False
+
+        primera, ultima = registros[0]["seq"], registros[-1]["seq"]
+        cuerpo = gzip.compress(
+            "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in registros).encode("utf-8")
+        )
+        peticion = urllib.request.Request(
+            self.url,
+            data=cuerpo,
+            method="POST",
+            headers={
+                "Content-Type": "application/x-ndjson",
+                "Content-Encoding": "gzip",
+                "X-Edge-Id": self.edge_id,
+                "Idempotency-Key": f"{self.edge_id}:{primera}-{ultima}",
+            },
+        )
+        with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+            datos = json.loads(respuesta.read().decode("utf-8"))
+
+        if datos.get("status") != "ok":
+            raise RuntimeError(datos.get("message") or "El servidor rechazó el lote")
+
+        self.registro.confirmar(ultima)
+        self._envios += 1
+        self._enviados += len(registros)
+        return True
+
+    def estadisticas(self) -> Dict:
+        return {
+            "edge_id": self.edge_id,
+            "pendientes": self.registro.pendientes(),
+            "confirmada": self.registro.confirmada,
+            "envios": self._envios,
+            "enviados": self._enviados,
+            "fallos": self._fallos,
+            "ultimo_error": self._ultimo_error,
+        }
@@ -0,0 +1,427 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBuffer:
+    """
+    Buffer de escritura diferida para la ingesta de lecturas.
+
+    Los endpoints encolan las lecturas ya validadas y responden al momento;
+    un hilo escritor vacía la cola en microlotes (al llegar a batch_size
+    lecturas o cuando pasa flush_interval) usando SensorDataManager.
+
+    - Cola acotada: si está llena, encolar devuelve False (HTTP 429).
+    - detener() escribe todo lo pendiente antes de terminar.
+    - Con spool_path, cada lectura aceptada se anota en un diario en disco
+      y un fichero de checkpoint guarda cuántas están ya en la BBDD; al
+      arrancar se vuelven a encolar las que faltaban.
+    - Si la BBDD no responde, las lecturas siguen en la cola (y en el
+      diario) y se reintentan sin límite. Solo se descartan las que nunca
+      se podrán escribir (datos no válidos); quedan en dead_letter_path,
+      por defecto `<spool_path>.dead`.
+    """
+
+    def __init__(
+        self,
+        sensor_manager,
+        max_size: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        spool_path: Optional[str] = None,
+        fsync: bool = False,
+        max_intentos: int = 5,
+        dead_letter_path: Optional[str] = None,
+    ):
+        self.sensor_manager = sensor_manager
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.fsync = fsync
+        # Intentos ante un error que no es de conexión antes de descartar la lectura
+        self.max_intentos = max_intentos
+        self.dead_letter_path = dead_letter_path or (f"{spool_path}.dead" if spool_path else None)
+
+        self._cond = threading.Condition()
+        self._pendientes = deque()
+        self._en_escritura = 0
+        self._detener = False
+        self._hilo: Optional[threading.Thread] = None
+
+        self._spool = None
+        self._checkpoint_path = f"{spool_path}.ckpt" if spool_path else None
+        self._confirmadas = 0  # líneas del diario ya procesadas
+        self._siguiente = 0  # número de línea de la próxima lectura aceptada
+        self._resueltas = set()  # líneas resueltas por detrás de la primera pendiente
+
+        self._aceptadas = 0
+        self._rechazadas = 0
+        self._escritas = 0
+        self._fallidas = 0
+        self._reintentos = 0
+        self._lotes = 0
+
+    # ----------------------- ciclo de vida -----------------------
+
+    def iniciar(self):
+        if self._hilo and self._hilo.is_alive():
+            return
+
+        if self.spool_path:
+            self._recuperar_spool()
+
+        self._detener = False
+        self._hilo = threading.Thread(target=self._bucle_escritor, name="ingest-writer", daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout: float = 30.0):
+        with self._cond:
+            self._detener = True
+            self._cond.notify_all()
+
+        if self._hilo:
+            self._hilo.join(timeout)
+
+        if self._spool:
+            self._spool.close()
+            self._spool = None
+
+    # ----------------------- encolado -----------------------
+
+    def encolar_lectura(self, nombre_sensor: str, valor, source: str, idempotency_key: Optional[str] = None) -> bool:
+        return self._encolar([{
+            "tipo": "lectura",
+            "sensor": nombre_sensor,
+            "valor": valor,
+            "source": source,
+            "idempotency_key": idempotency_key,
+        }])
+
+    def encolar_lote(self, lecturas: List[Dict], source: str, ordinarias: Optional[List[Dict]] = None) -> bool:
+        """
+        Encola todas las lecturas del lote o ninguna. ordinarias son lecturas
+        del sensor ordinario (valor_numerico, valor_alfanumerico,
+        idempotency_key, recorded_at) que van en el mismo lote.
+        """
+        items = [
+            {
+                "tipo": "lectura",
+                "sensor": lectura.get("sensor"),
+                "valor": lectura.get("valor"),
+                "source": source,
+                "idempotency_key": lectura.get("idempotency_key"),
+                "recorded_at": _fecha_iso(lectura.get("recorded_at")),
+            }
+            for lectura in lecturas
+        ]
+        items.extend(
+            {
+                "tipo": "ordinaria",
+                "valor_numerico": ordinaria["valor_numerico"],
+                "valor_alfanumerico": ordinaria["valor_alfanumerico"],
+                "source": source,
+                "idempotency_key": ordinaria.get("idempotency_key"),
+                "recorded_at": _fecha_iso(ordinaria.get("recorded_at")),
+            }
+            for ordinaria in ordinarias or ()
+        )
+        return self._encolar(items)
+
+    def encolar_ordinaria(
+        self,
+        valor_numerico,
+        valor_alfanumerico: str,
+        source: str,
+        idempotency_key: Optional[str] = None,
+        recorded_at: Optional[datetime] = None,
+    ) -> bool:
+        return self._encolar([{
+            "tipo": "ordinaria",
+            "valor_numerico": valor_numerico,
+            "valor_alfanumerico": valor_alfanumerico,
+            "source": source,
+            "idempotency_key": idempotency_key,
+            "recorded_at": _fecha_iso(recorded_at),
+        }])
+
+    def _encolar(self, items: List[Dict]) -> bool:
+        with self._cond:
+            if len(self._pendientes) + len(items) > self.max_size:
+                self._rechazadas += len(items)
+                return False
+
+            if self._spool:
+                for item in items:
+                    self._spool.write(json.dumps(item, ensure_ascii=False) + "\n")
+                    item["_n"] = self._siguiente
+                    self._siguiente += 1
+                self._spool.flush()
+                if self.fsync:
+                    os.fsync(self._spool.fileno())
+
+            self._pendientes.extend(items)
+            self._aceptadas += len(items)
+            self._cond.notify()
+            return True
+
+    # ----------------------- escritor -----------------------
+
+    def _bucle_escritor(self):
+        espera_error = 0.0
+
+        while True:
+            with self._cond:
+                while not self._pendientes and not self._detener:
+                    self._cond.wait()
+
+                if not self._pendientes and self._detener:
+                    return
+
+                # Microlote: por tamaño o por tiempo desde el primer elemento
+                limite = time.monotonic() + self.flush_interval
+                while len(self._pendientes) < self.batch_size and not self._detener:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+
+                lote = [self._pendientes.popleft() for _ in range(min(self.batch_size, len(self._pendientes)))]
+                self._en_escritura = len(lote)
+
+            escritas, reintentar, descartadas = self._escribir_lote(lote)
+            if descartadas:
+                self._anotar_descartadas(descartadas)
+            self._confirmar(escritas + [item for item, _ in descartadas], reintentar)
+
+            if not reintentar:
+                espera_error = 0.0
+                continue
+
+            # BBDD caída: lo que falta vuelve al principio de la cola y se
+            # reintenta sin límite, esperando cada vez más (hasta 5 s)
+            espera_error = min(5.0, max(0.2, espera_error * 2))
+            with self._cond:
+                if not self._detener:
+                    self._cond.wait(espera_error)
+                if self._detener:
+                    # Sigue en el diario: se escribirá al volver a arrancar
+                    return
+
+    def _escribir_lote(self, lote: List[Dict]) -> Tuple[List[Dict], List[Dict], List[Tuple[Dict, str]]]:
+        """
+        Escribe el microlote agrupando lecturas consecutivas con el mismo
+        source. Devuelve (escritas, para reintentar, descartadas con su error):
+        cada grupo es una transacción, así que lo confirmado no se repite, y
+        tras un error de conexión el resto del lote espera al reintento.
+        """
+        self._lotes += 1
+        escritas: List[Dict] = []
+        reintentar: List[Dict] = []
+        descartadas: List[Tuple[Dict, str]] = []
+        grupo: List[Dict] = []
+        caida = []  # no vacía tras un error de conexión
+
+        def escribir_grupo():
+            if not grupo:
+                return
+            try:
+                resultados = self.sensor_manager.guardar_lecturas_lote(
+                    [
+                        {
+                            "sensor": item["sensor"],
+                            "valor": item["valor"],
+                            "idempotency_key": item.get("idempotency_key"),
+                            "recorded_at": item.get("recorded_at"),
+                        }
+                        for item in grupo
+                    ],
+                    source=grupo[0]["source"],
+                )
+            except Exception as e:
+                # Nada del grupo llegó a confirmarse
+                fallo(list(grupo), e)
+                return
+
+            for item, resultado in zip(grupo, resultados):
+                # Un reintento descartado por repetido ya está en la BBDD
+                if resultado["estado"] in ("ok", "duplicada"):
+                    escritas.append(item)
+                elif resultado.get("reintentable"):
+                    reintentar.append(item)
+                    caida.append(item)
+                else:
+                    descartadas.append((item, resultado.get("detalle") or "Lectura no válida"))
+
+        def fallo(items: List[Dict], error: Exception):
+            if self.sensor_manager.es_error_transitorio(error):
+                reintentar.extend(items)
+                caida.extend(items)
+                return
+            # Un error que no es de conexión y se repite no se arregla
+            # reintentando: tras max_intentos se aparta para no bloquear la cola
+            for item in items:
+                item["_intentos"] = item.get("_intentos", 0) + 1
+                if item["_intentos"] >= self.max_intentos:
+                    descartadas.append((item, str(error)))
+                else:
+                    reintentar.append(item)
+
+        for posicion, item in enumerate(lote):
+            if caida:
+                # Sin BBDD no se sigue intentando: el resto espera al reintento
+                reintentar.extend(grupo + lote[posicion:])
+                grupo = []
+                break
+            if item["tipo"] == "lectura":
+                if grupo and grupo[0]["source"] != item["source"]:
+                    escribir_grupo()
+                    grupo = []
+                grupo.append(item)
+                continue
+
+            escribir_grupo()
+            grupo = []
+            try:
+                guardada = self.sensor_manager.guardar_lectura_sensor_ordinario(
+                    item["valor_numerico"],
+                    item["valor_alfanumerico"],
+                    source=item["source"],
+                    idempotency_key=item.get("idempotency_key"),
+                    recorded_at=item.get("recorded_at"),
+                )
+            except (TypeError, ValueError) as e:
+                descartadas.append((item, str(e)))
+                continue
+            except Exception as e:
+                fallo([item], e)
+                continue
+            if guardada:
+                escritas.append(item)
+            else:
+                # Sin conexión o sin recursos del sensor en la BBDD
+                reintentar.append(item)
+                caida.append(item)
+
+        escribir_grupo()
+
+        self._escritas += len(escritas)
+        self._fallidas += len(descartadas)
+        if reintentar:
+            self._reintentos += 1
+        return escritas, reintentar, descartadas
+
+    # ----------------------- spool en disco -----------------------
+
+    def _confirmar(self, resueltas: List[Dict], reintentar: List[Dict]):
+        """
+        Da por terminadas las lecturas escritas o descartadas y devuelve las
+        demás al principio de la cola, en su orden. El checkpoint avanza
+        solo hasta la primera lectura del diario que aún no está resuelta.
+        """
+        with self._cond:
+            self._en_escritura = 0
+            if reintentar:
+                self._pendientes.extendleft(reversed(reintentar))
+            if not self._spool:
+                return
+
+            for item in resueltas:
+                self._resueltas.add(item["_n"])
+            while self._confirmadas in self._resueltas:
+                self._resueltas.discard(self._confirmadas)
+                self._confirmadas += 1
+
+            if self._confirmadas == self._siguiente:
+                # Todo lo aceptado está resuelto: se vacía el diario
+                self._spool.seek(0)
+                self._spool.truncate()
+                self._confirmadas = 0
+                self._siguiente = 0
+            self._guardar_checkpoint()
+
+    def _anotar_descartadas(self, descartadas: List[Tuple[Dict, str]]):
+        """Las lecturas que nunca se podrán escribir van al fichero de rechazadas."""
+        fecha = datetime.now().isoformat()
+        for item, error in descartadas:
+            logger.warning("Lectura descartada de la cola de ingesta: %s", error)
+        if not self.dead_letter_path:
+            return
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            for item, error in descartadas:
+                lectura = {k: v for k, v in item.items() if not k.startswith("_")}
+                f.write(json.dumps({"fecha": fecha, "error": error, "lectura": lectura}, ensure_ascii=False) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def _guardar_checkpoint(self):
+        tmp_path = f"{self._checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(self._confirmadas))
+        os.replace(tmp_path, self._checkpoint_path)
+
+    def _recuperar_spool(self):
+        confirmadas = 0
+        if os.path.exists(self._checkpoint_path):
+            with open(self._checkpoint_path, "r", encoding="utf-8") as f:
+                confirmadas = int(f.read().strip() or 0)
+
+        recuperadas = []
+        if os.path.exists(self.spool_path):
+            with open(self.spool_path, "r", encoding="utf-8") as f:
+                for numero, linea in enumerate(f):
+                    if numero < confirmadas or not linea.strip():
+                        continue
+                    try:
+                        recuperadas.append(json.loads(linea))
+                    except ValueError:
+                        # Última línea a medio escribir si la app se cortó
+                        break
+
+        # Se reescribe el diario solo con lo pendiente
+        tmp_path = f"{self.spool_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for item in recuperadas:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.spool_path)
+
+        self._spool = open(self.spool_path, "a+", encoding="utf-8")
+        self._confirmadas = 0
+        self._resueltas = set()
+        for numero, item in enumerate(recuperadas):
+            item["_n"] = numero
+        self._siguiente = len(recuperadas)
+        self._guardar_checkpoint()
+
+        with self._cond:
+            self._pendientes.extend(recuperadas)
+
+    # ----------------------- métricas -----------------------
+
+    def estadisticas(self) -> Dict:
+        with self._cond:
+            return {
+                "pendientes": len(self._pendientes) + self._en_escritura,
+                "capacidad": self.max_size,
+                "aceptadas": self._aceptadas,
+                "rechazadas": self._rechazadas,
+                "escritas": self._escritas,
+                "fallidas": self._fallidas,
+                "reintentos": self._reintentos,
+                "lotes": self._lotes,
+                "spool": self.spool_path,
+                "dead_letter": self.dead_letter_path,
+            }
+
+
+def _fecha_iso(valor) -> Optional[str]:
+    # El diario en disco es JSON: las fechas se guardan como texto ISO
+    return valor.isoformat() if isinstance(valor, datetime) else valor
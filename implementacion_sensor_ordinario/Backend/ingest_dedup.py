@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+
+class DedupCache:
+    """
+    Conjunto acotado de claves de idempotencia ya vistas (LRU).
+
+    registrar() comprueba y anota la clave en O(1): devuelve False si ya
+    estaba, así el reintento de una lectura se descarta sin tocar la BBDD.
+    Al llenarse se olvidan las claves más antiguas; de esas se encarga el
+    índice único de readings.
+    """
+
+    def __init__(self, max_claves: int = 50000):
+        self.max_claves = max_claves
+        self._claves: "OrderedDict[Hashable, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._nuevas = 0
+        self._duplicadas = 0
+
+    def registrar(self, clave: Hashable) -> bool:
+        with self._lock:
+            if clave in self._claves:
+                self._claves.move_to_end(clave)
+                self._duplicadas += 1
+                return False
+
+            self._claves[clave] = None
+            if len(self._claves) > self.max_claves:
+                self._claves.popitem(last=False)
+            self._nuevas += 1
+            return True
+
+    def contiene(self, clave: Hashable) -> bool:
+        with self._lock:
+            return clave in self._claves
+
+    def olvidar(self, clave: Hashable):
+        """Quita una clave cuya escritura falló, para que el reintento sí se guarde."""
+        with self._lock:
+            self._claves.pop(clave, None)
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "claves": len(self._claves),
+                "capacidad": self.max_claves,
+                "nuevas": self._nuevas,
+                "duplicadas": self._duplicadas,
+            }
@@ -0,0 +1,158 @@
+import asyncio
+import itertools
+import json
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class Suscripcion:
+    """
+    Cliente conectado al feed en directo con sus filtros.
+
+    Solo guarda el último cambio de cada (device_id, state_code) pendiente de
+    enviar: si llegan varias lecturas del mismo sensor antes de que el
+    cliente las reciba, se envía únicamente la más reciente.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        sensores: Optional[Iterable[str]] = None,
+        dispositivos: Optional[Iterable[int]] = None,
+        state_codes: Optional[Iterable[str]] = None,
+    ):
+        self.sensores = frozenset(sensores) if sensores else None
+        self.dispositivos = frozenset(dispositivos) if dispositivos else None
+        self.state_codes = frozenset(state_codes) if state_codes else None
+
+        self._loop = loop
+        self._evento = asyncio.Event()
+        self._lock = threading.Lock()
+        self._pendientes: Dict[Tuple[int, str], Dict] = {}
+        self._avisada = False
+
+        self.enviados = 0
+        self.coalescidos = 0
+
+    def acepta(self, cambio: Dict) -> bool:
+        return (
+            (self.sensores is None or cambio["sensor"] in self.sensores)
+            and (self.dispositivos is None or cambio["device_id"] in self.dispositivos)
+            and (self.state_codes is None or cambio["state_code"] in self.state_codes)
+        )
+
+    def _publicar(self, cambio: Dict):
+        # Se llama desde los hilos que escriben en la BBDD
+        with self._lock:
+            clave = (cambio["device_id"], cambio["state_code"])
+            if clave in self._pendientes:
+                self.coalescidos += 1
+            self._pendientes[clave] = cambio
+            if self._avisada:
+                return
+            self._avisada = True
+        self._loop.call_soon_threadsafe(self._evento.set)
+
+    async def esperar(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._evento.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def extraer(self) -> List[Dict]:
+        with self._lock:
+            cambios = list(self._pendientes.values())
+            self._pendientes.clear()
+            self._avisada = False
+            self._evento.clear()
+        self.enviados += len(cambios)
+        return cambios
+
+
+class LiveFeed:
+    """
+    Reparte a los clientes conectados (SSE) los cambios de current_state que
+    SensorDataManager confirma. publicar() se registra como oyente del
+    manager; cada cliente recibe solo lo que pasa sus filtros, agrupado en
+    ventanas de `ventana` segundos.
+    """
+
+    def __init__(self, ventana: float = 0.25, keepalive: float = 15.0, max_clientes: int = 100):
+        self.ventana = ventana
+        self.keepalive = keepalive
+        self.max_clientes = max_clientes
+
+        self._lock = threading.Lock()
+        self._suscripciones: List[Suscripcion] = []
+        self._ids = itertools.count(1)
+        self._publicados = 0
+        # Totales de las suscripciones ya cerradas
+        self._enviados = 0
+        self._coalescidos = 0
+
+    def suscribir(self, **filtros) -> Optional[Suscripcion]:
+        """Nueva suscripción, o None si ya hay max_clientes conectados."""
+        suscripcion = Suscripcion(asyncio.get_running_loop(), **filtros)
+        with self._lock:
+            if len(self._suscripciones) >= self.max_clientes:
+                return None
+            self._suscripciones = self._suscripciones + [suscripcion]
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion):
+        with self._lock:
+            if suscripcion not in self._suscripciones:
+                return
+            self._suscripciones = [s for s in self._suscripciones if s is not suscripcion]
+            self._enviados += suscripcion.enviados
+            self._coalescidos += suscripcion.coalescidos
+
+    def publicar(self, cambios: List[Dict]):
+        # La lista se sustituye al (des)suscribir, así que se recorre sin lock
+        suscripciones = self._suscripciones
+        self._publicados += len(cambios)
+        if not suscripciones:
+            return
+
+        for cambio in cambios:
+            for suscripcion in suscripciones:
+                if suscripcion.acepta(cambio):
+                    suscripcion._publicar(cambio)
+
+    async def eventos_sse(
+        self, suscripcion: Suscripcion, desconectado: Callable[[], Awaitable[bool]]
+    ) -> AsyncIterator[bytes]:
+        """Flujo text/event-stream de la suscripción hasta que el cliente se va."""
+        try:
+            yield b"retry: 2000\n: conectado\n\n"
+            while True:
+                hay_cambios = await suscripcion.esperar(self.keepalive)
+                if await desconectado():
+                    return
+                if not hay_cambios:
+                    yield b": keepalive\n\n"
+                    continue
+
+                # Deja que se acumule la ráfaga antes de enviar
+                await asyncio.sleep(self.ventana)
+                salida = []
+                for cambio in suscripcion.extraer():
+                    salida.append(
+                        f"id: {next(self._ids)}\nevent: state\n"
+                        f"data: {json.dumps(cambio, ensure_ascii=False)}\n\n"
+                    )
+                if salida:
+                    yield "".join(salida).encode("utf-8")
+        finally:
+            self.cancelar(suscripcion)
+
+    def estadisticas(self) -> Dict:
+        suscripciones = self._suscripciones
+        return {
+            "clientes": len(suscripciones),
+            "capacidad": self.max_clientes,
+            "publicados": self._publicados,
+            "enviados": self._enviados + sum(s.enviados for s in suscripciones),
+            "coalescidos": self._coalescidos + sum(s.coalescidos for s in suscripciones),
+        }
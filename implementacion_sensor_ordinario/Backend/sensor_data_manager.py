@@ -1,14 +1,54 @@
 import json
-import statistics
+import logging
+import math
+import threading
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-from models.db import get_connection
+from models.alert_engine import AlertEngine
+from models.db_pool import ConnectionPool, pool as default_pool
+from models.edge_sync import EdgeLog
+from models.ingest_dedup import DedupCache
+from models.sensor_rollups import actualizar_rollups, elegir_resolucion, leer_serie
+from models.sensor_stats import P2Quantile, RunningStats, SensorStatsStore, TextStats
+from models.storage_backends import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+EN_REGISTRO_LOCAL = "La BBDD local no responde; la lectura queda en el registro local"
+
+# Con clave de idempotencia, la fila repetida se descarta sin error y sin
+# contar en rowcount. No vale INSERT IGNORE: también convertiría en avisos
+# los fallos de FK (1452), de rango o de truncado, y la lectura se perdería
+# como si fuera repetida.
+SIN_REPETIDAS = " ON DUPLICATE KEY UPDATE id = id"
 
 
 class SensorDataManager:
-    def __init__(self):
+    def __init__(
+        self,
+        pool: Optional[ConnectionPool] = None,
+        backend: Optional[StorageBackend] = None,
+        registro_local: Optional[EdgeLog] = None,
+    ):
+        # Todas las operaciones toman prestada la conexión del pool. Con un
+        # backend (p. ej. SQLiteBackend) se crea un pool propio sobre él.
+        if pool is None and backend is not None:
+            pool = ConnectionPool(factory=backend.conectar)
+        self.pool = pool or default_pool
+
+        # En una tienda (edge) cada lectura se anota primero en un registro
+        # local que EdgeSyncWorker envía después al servidor central; si la
+        # BBDD local no responde, la lectura sigue a salvo en el registro.
+        self.registro_local = registro_local
+
+        # Claves de idempotencia ya guardadas (reintentos de la ESP32): el
+        # duplicado se descarta aquí, antes de cualquier consulta.
+        self.dedup = DedupCache()
+
         self.sensor_catalog = {
             "sensor_temperatura": {
                 "type_code": "temperatura",
@@ -72,6 +112,112 @@ class SensorDataManager:
             },
         }
 
+        # Caché en memoria nombre_sensor -> (device_id, sensor_type_id, unit).
+        # Evita las consultas a sensor_types/devices en cada lectura.
+        self._recursos_cache: Dict[str, Tuple[int, int, Optional[str]]] = {}
+        self._recursos_lock = threading.Lock()
+        # Serializa la creación de sensor_types/devices cuando falla la caché
+        self._creacion_lock = threading.Lock()
+        self._catalogo_precargado = False
+
+        # Agregados por sensor (total, media, min, max, mediana aproximada...)
+        # que no vuelven a recorrer readings: al leerlos solo se suman las
+        # filas nuevas desde la última incorporada, tras cada escritura de
+        # este proceso o cada minuto para ver lo que escriben otros.
+        self.estadisticas = SensorStatsStore(ttl=60.0)
+
+        # Umbrales de alert_thresholds compilados en memoria; se evalúan en
+        # cada escritura de current_state sin consultar la tabla.
+        self.alertas = AlertEngine()
+
+        # Oyentes de los cambios de current_state (p. ej. el feed en directo
+        # de la API). Reciben la lista de cambios de cada transacción después
+        # del commit; los cambios se van anotando por hilo.
+        self._oyentes: List[Callable[[List[Dict]], None]] = []
+        self._local = threading.local()
+
+    def _get_connection(self):
+        return self.pool.obtener()
+
+    @contextmanager
+    def _unidad_de_trabajo(self):
+        """
+        Transacción sobre una única conexión: todo lo que se escribe dentro
+        del bloque se confirma con un solo commit al salir, o se deshace
+        entero si algo falla. Devuelve None si no hay conexión.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logger.warning("No hay conexión con la BBDD")
+            yield None
+            return
+
+        self._local.cambios = [] if self._oyentes else None
+        alertas = self._local.alertas = self.alertas.transaccion()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Las alertas abiertas o resueltas en esta transacción no cuentan
+            self.alertas.descartar(alertas)
+            raise
+        finally:
+            cambios, self._local.cambios = self._local.cambios, None
+            self._local.alertas = None
+            conn.close()
+
+        self.alertas.confirmar(alertas)
+        if cambios:
+            self._notificar_oyentes(cambios)
+
+    def agregar_oyente(self, oyente: Callable[[List[Dict]], None]):
+        self._oyentes = self._oyentes + [oyente]
+
+    def quitar_oyente(self, oyente: Callable[[List[Dict]], None]):
+        self._oyentes = [o for o in self._oyentes if o != oyente]
+
+    def _notificar_oyentes(self, cambios: List[Dict]):
+        for oyente in self._oyentes:
+            try:
+                oyente(cambios)
+            except Exception:
+                # Un oyente roto no puede afectar a la ingesta
+                logger.exception("Error notificando cambios de estado")
+
+    def _anotar_cambio_estado(
+        self, device_id: int, nombre_sensor: Optional[str], state_code: str, state_value, numeric_value, source: str
+    ):
+        cambios = getattr(self._local, "cambios", None)
+        if cambios is None:
+            return
+        cambios.append({
+            "device_id": device_id,
+            "sensor": nombre_sensor,
+            "state_code": state_code,
+            "state_value": state_value,
+            "numeric_value": float(numeric_value) if numeric_value is not None else None,
+            "source": source,
+            "updated_at": datetime.now().isoformat(),
+        })
+
+    def _parse_recorded_at(self, valor, por_defecto: datetime) -> Optional[datetime]:
+        """
+        Fecha de una lectura recibida como datetime o texto ISO; None si no
+        es válida. Las fechas con zona (Z, +02:00...) se pasan a la hora
+        local del servidor, la misma que datetime.now() en el resto de la BBDD.
+        """
+        if valor is None:
+            return por_defecto
+        if isinstance(valor, datetime):
+            fecha = valor
+        else:
+            try:
+                fecha = datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+            except ValueError:
+                return None
+        return fecha.astimezone().replace(tzinfo=None) if fecha.tzinfo else fecha
+
     def _is_numeric(self, value) -> bool:
         if isinstance(value, bool):
             return False
@@ -98,12 +244,121 @@ class SensorDataManager:
             "location_name": "No definida",
         }
 
+    def _precargar_catalogo(self, conn):
+        """
+        Resuelve de una vez los ids de todos los sensores del catálogo
+        (2 consultas en total) y los deja en la caché.
+        """
+        type_codes = [info["type_code"] for info in self.sensor_catalog.values()]
+        device_codes = [info["device_code"] for info in self.sensor_catalog.values()]
+
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT id, code FROM sensor_types WHERE code IN ({})".format(
+                ", ".join(["%s"] * len(type_codes))
+            ),
+            tuple(type_codes)
+        )
+        tipos = {row["code"]: row["id"] for row in cursor.fetchall()}
+
+        cursor.execute(
+            "SELECT id, device_code FROM devices WHERE device_code IN ({})".format(
+                ", ".join(["%s"] * len(device_codes))
+            ),
+            tuple(device_codes)
+        )
+        dispositivos = {row["device_code"]: row["id"] for row in cursor.fetchall()}
+        cursor.close()
+
+        with self._recursos_lock:
+            for nombre_sensor, info in self.sensor_catalog.items():
+                device_id = dispositivos.get(info["device_code"])
+                sensor_type_id = tipos.get(info["type_code"])
+                if device_id and sensor_type_id:
+                    self._recursos_cache.setdefault(
+                        nombre_sensor, (device_id, sensor_type_id, info["unit"])
+                    )
+            self._catalogo_precargado = True
+
+    def invalidar_cache_recursos(
+        self,
+        nombre_sensor: Optional[str] = None,
+        device_id: Optional[int] = None,
+        device_code: Optional[str] = None,
+    ):
+        """
+        Elimina entradas de la caché de ids. Hay que llamarlo cuando se borra
+        o se recodifica una fila de devices/sensor_types fuera de esta clase.
+        Sin argumentos vacía la caché completa.
+        """
+        with self._recursos_lock:
+            if nombre_sensor is None and device_id is None and device_code is None:
+                self._recursos_cache.clear()
+                self._catalogo_precargado = False
+                return
+
+            for nombre, (cached_device_id, _, _) in list(self._recursos_cache.items()):
+                if (
+                    nombre == nombre_sensor
+                    or (device_id is not None and cached_device_id == device_id)
+                    or (device_code is not None and self._get_catalog_info(nombre)["device_code"] == device_code)
+                ):
+                    del self._recursos_cache[nombre]
+
+    def _es_error_recurso_obsoleto(self, error: Exception) -> bool:
+        # 1452: la FK de readings/current_state apunta a un device o
+        # sensor_type que ya no existe (fila borrada o recodificada).
+        return getattr(error, "errno", None) == 1452
+
+    # Errores de MySQL que pasan solos: conexión perdida, bloqueos, deadlocks
+    ERRNOS_TRANSITORIOS = {1040, 1205, 1213, 2002, 2003, 2006, 2013, 2055}
+
+    def es_error_transitorio(self, error: Exception) -> bool:
+        """True si el error viene de la conexión o de un bloqueo y reintentar tiene sentido."""
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return True
+        if getattr(error, "errno", None) in self.ERRNOS_TRANSITORIOS:
+            return True
+        # sqlite3 y los conectores DB-API usan estos nombres para los fallos de conexión
+        return type(error).__name__ in ("OperationalError", "InterfaceError")
+
+    def _reintentar_si_recurso_obsoleto(self, nombre_sensor: str, operacion):
+        try:
+            return operacion()
+        except Exception as e:
+            if not self._es_error_recurso_obsoleto(e):
+                raise
+            self.invalidar_cache_recursos(nombre_sensor)
+            return operacion()
+
     def _ensure_sensor_resources(self, nombre_sensor: str) -> Tuple[Optional[int], Optional[int], Optional[str]]:
-        info = self._get_catalog_info(nombre_sensor)
-        conn = get_connection()
-        if not conn:
-            return None, None, None
+        cached = self._recursos_cache.get(nombre_sensor)
+        if cached:
+            return cached
+
+        with self._creacion_lock:
+            # Otro hilo puede haberlo resuelto mientras esperábamos
+            cached = self._recursos_cache.get(nombre_sensor)
+            if cached:
+                return cached
 
+            conn = self._get_connection()
+            if not conn:
+                return None, None, None
+
+            try:
+                if not self._catalogo_precargado:
+                    self._precargar_catalogo(conn)
+                    cached = self._recursos_cache.get(nombre_sensor)
+                    if cached:
+                        return cached
+
+                return self._crear_sensor_resources(conn, nombre_sensor)
+            finally:
+                conn.close()
+
+    def _crear_sensor_resources(self, conn, nombre_sensor: str) -> Tuple[int, int, Optional[str]]:
+        info = self._get_catalog_info(nombre_sensor)
         cursor = conn.cursor(dictionary=True)
 
         # Sensor type
@@ -164,11 +419,15 @@ class SensorDataManager:
             device_id = cursor.lastrowid
 
         cursor.close()
-        conn.close()
+
+        with self._recursos_lock:
+            self._recursos_cache[nombre_sensor] = (device_id, sensor_type_id, info["unit"])
 
         return device_id, sensor_type_id, info["unit"]
 
-    def _get_current_state_row(self, conn, device_id: int, state_code: str):
+    def _get_current_state_row(self, conn, device_id: int, state_code: str, bloquear: bool = False):
+        # Con bloquear=True la fila queda reservada hasta el commit, de modo
+        # que dos escritores del mismo dispositivo no leen el mismo valor previo.
         cursor = conn.cursor(dictionary=True)
         cursor.execute(
             """
@@ -177,7 +436,7 @@ class SensorDataManager:
             WHERE device_id = %s AND state_code = %s
             ORDER BY id DESC
             LIMIT 1
-            """,
+            """ + (" FOR UPDATE" if bloquear else ""),
             (device_id, state_code)
         )
         row = cursor.fetchone()
@@ -194,36 +453,84 @@ class SensorDataManager:
         source: str = "simulado",
         payload: Optional[dict] = None,
     ):
+        # Usa la clave única uq_current_state_device_state en lugar de
+        # leer y luego escribir. No hace commit: lo hace la unidad de trabajo.
         payload_json = json.dumps(payload or {}, ensure_ascii=False)
-
-        existing = self._get_current_state_row(conn, device_id, state_code)
         cursor = conn.cursor()
-
-        if existing:
-            cursor.execute(
-                """
-                UPDATE current_state
-                SET state_value = %s,
-                    numeric_value = %s,
-                    updated_at = NOW(6),
-                    source = %s,
-                    payload = %s
-                WHERE id = %s
-                """,
-                (state_value, numeric_value, source, payload_json, existing["id"])
+        cursor.execute(
+            """
+            INSERT INTO current_state (
+                device_id, state_code, state_value, numeric_value, updated_at, source, payload
             )
+            VALUES (%s, %s, %s, %s, NOW(6), %s, %s)
+            ON DUPLICATE KEY UPDATE
+                state_value = VALUES(state_value),
+                numeric_value = VALUES(numeric_value),
+                updated_at = VALUES(updated_at),
+                source = VALUES(source),
+                payload = VALUES(payload)
+            """,
+            (device_id, state_code, state_value, numeric_value, source, payload_json)
+        )
+        cursor.close()
+        nombre_sensor = (payload or {}).get("sensor_name")
+        self._evaluar_umbrales(conn, device_id, nombre_sensor, state_code, numeric_value)
+        self._anotar_cambio_estado(device_id, nombre_sensor, state_code, state_value, numeric_value, source)
+
+    def _evaluar_umbrales(self, conn, device_id: int, nombre_sensor: Optional[str], state_code: str, numeric_value):
+        if numeric_value is None:
+            return
+
+        info = self.sensor_catalog.get(nombre_sensor)
+        if info:
+            codigos = (state_code, info["type_code"])
+            contexto = {"sensor": nombre_sensor, "unidad": info["unit"] or "", "state_code": state_code}
         else:
-            cursor.execute(
-                """
-                INSERT INTO current_state (
-                    device_id, state_code, state_value, numeric_value, updated_at, source, payload
-                )
-                VALUES (%s, %s, %s, %s, NOW(6), %s, %s)
-                """,
-                (device_id, state_code, state_value, numeric_value, source, payload_json)
-            )
+            codigos = (state_code,)
+            contexto = {"sensor": nombre_sensor or "", "unidad": "", "state_code": state_code}
+        self.alertas.evaluar(
+            conn, device_id, codigos, float(numeric_value), contexto,
+            transaccion=getattr(self._local, "alertas", None),
+        )
+
+    def _upsert_ultimas_lecturas(self, conn, filas: List[Tuple]):
+        """
+        Actualiza readings_latest con filas (device_id, sensor_type_id,
+        reading_value, text_value, reading_unit, recorded_at, source).
+        Una lectura más antigua que la guardada no la sustituye. No hace commit.
+        """
+        ultimas: Dict[int, Tuple] = {}
+        for fila in filas:
+            if fila[0] not in ultimas or fila[5] >= ultimas[fila[0]][5]:
+                ultimas[fila[0]] = fila
+        if not ultimas:
+            return
+
+        valores = []
+        for fila in ultimas.values():
+            valores.extend(fila)
 
-        conn.commit()
+        # recorded_at va al final: MySQL aplica las asignaciones en orden y
+        # las anteriores tienen que comparar con el valor aún sin modificar.
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO readings_latest (
+                device_id, sensor_type_id, reading_value, text_value,
+                reading_unit, recorded_at, source
+            )
+            VALUES {}
+            ON DUPLICATE KEY UPDATE
+                sensor_type_id = IF(VALUES(recorded_at) >= recorded_at, VALUES(sensor_type_id), sensor_type_id),
+                reading_value = IF(VALUES(recorded_at) >= recorded_at, VALUES(reading_value), reading_value),
+                text_value = IF(VALUES(recorded_at) >= recorded_at, VALUES(text_value), text_value),
+                reading_unit = IF(VALUES(recorded_at) >= recorded_at, VALUES(reading_unit), reading_unit),
+                consumption_w = IF(VALUES(recorded_at) >= recorded_at, NULL, consumption_w),
+                source = IF(VALUES(recorded_at) >= recorded_at, VALUES(source), source),
+                recorded_at = GREATEST(recorded_at, VALUES(recorded_at))
+            """.format(", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(ultimas))),
+            tuple(valores)
+        )
         cursor.close()
 
     def _insert_state_history(
@@ -248,85 +555,157 @@ class SensorDataManager:
             """,
             (device_id, state_code, old_value, new_value, event_type, source, payload_json)
         )
-        conn.commit()
         cursor.close()
 
-    def guardar_lectura_sensor(self, nombre_sensor: str, valor, source: str = "simulado"):
+    def lectura_duplicada(self, nombre_sensor: str, idempotency_key: Optional[str]) -> bool:
+        """True si esa clave de idempotencia ya se guardó (o se está guardando)."""
+        return bool(idempotency_key) and self.dedup.contiene((nombre_sensor, idempotency_key))
+
+    def _guardar_idempotente(self, nombre_sensor: str, idempotency_key: Optional[str], operacion) -> bool:
+        """
+        Ejecuta la escritura solo si la clave no se ha visto antes. Un
+        duplicado cuenta como guardado (la lectura ya está en la BBDD). Si la
+        escritura falla se olvida la clave para que el reintento se aplique.
+        """
+        if not idempotency_key:
+            return operacion()
+
+        clave = (nombre_sensor, idempotency_key)
+        if not self.dedup.registrar(clave):
+            return True
+
+        try:
+            guardada = operacion()
+        except Exception:
+            self.dedup.olvidar(clave)
+            raise
+        if not guardada:
+            self.dedup.olvidar(clave)
+        return guardada
+
+    def guardar_lectura_sensor(
+        self, nombre_sensor: str, valor, source: str = "simulado", idempotency_key: Optional[str] = None
+    ) -> bool:
+        def guardar() -> bool:
+            recorded_at = datetime.now()
+            anotada = self._anotar_en_registro_local([{
+                "tipo": "lectura",
+                "sensor": nombre_sensor,
+                "valor": valor,
+                "source": source,
+                "recorded_at": recorded_at,
+                "idempotency_key": self._clave_registro(idempotency_key),
+            }])
+            return self._escribir_tras_anotar(anotada, lambda: self._reintentar_si_recurso_obsoleto(
+                nombre_sensor,
+                lambda: self._guardar_lectura_sensor(nombre_sensor, valor, source, recorded_at, idempotency_key),
+            ))
+
+        return self._guardar_idempotente(nombre_sensor, idempotency_key, guardar)
+
+    def _guardar_lectura_sensor(
+        self, nombre_sensor: str, valor, source: str, recorded_at: datetime, idempotency_key: Optional[str] = None
+    ) -> bool:
         device_id, sensor_type_id, unit = self._ensure_sensor_resources(nombre_sensor)
         if not device_id or not sensor_type_id:
-            return
-
-        conn = get_connection()
-        if not conn:
-            return
+            return False
 
         payload = {"sensor_name": nombre_sensor}
+        registro = None
 
-        if self._is_numeric(valor):
-            numeric_value = float(valor)
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO readings (
-                    device_id, sensor_type_id, reading_value, normalized_value,
-                    consumption_w, reading_unit, recorded_at, source, payload
+        # La lectura, el historial y current_state van en una sola transacción
+        with self._unidad_de_trabajo() as conn:
+            if not conn:
+                return False
+
+            if self._is_numeric(valor):
+                numeric_value = float(valor)
+                cursor = conn.cursor()
+                # Con clave, el índice único descarta el reintento que la
+                # caché ya no recuerda (p. ej. tras reiniciar el servidor)
+                cursor.execute(
+                    """
+                    INSERT INTO readings (
+                        device_id, sensor_type_id, reading_value, normalized_value,
+                        consumption_w, reading_unit, recorded_at, source, payload, idempotency_key
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s){}
+                    """.format(SIN_REPETIDAS if idempotency_key else ""),
+                    (
+                        device_id,
+                        sensor_type_id,
+                        numeric_value,
+                        numeric_value,
+                        None,
+                        unit,
+                        recorded_at,
+                        source,
+                        json.dumps(payload, ensure_ascii=False),
+                        idempotency_key,
+                    )
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, NOW(6), %s, %s)
-                """,
-                (
+                insertada = cursor.rowcount != 0
+                cursor.close()
+                if not insertada:
+                    return True
+
+                actualizar_rollups(conn, [(device_id, recorded_at, numeric_value, None)])
+                self._upsert_ultimas_lecturas(
+                    conn, [(device_id, sensor_type_id, numeric_value, None, unit, recorded_at, source)]
+                )
+
+                self._upsert_current_state(
+                    conn,
                     device_id,
-                    sensor_type_id,
+                    "lectura_actual",
+                    str(valor),
                     numeric_value,
-                    numeric_value,
-                    None,
-                    unit,
-                    source,
-                    json.dumps(payload, ensure_ascii=False),
+                    source=source,
+                    payload=payload,
                 )
-            )
-            conn.commit()
-            cursor.close()
+                registro = numeric_value
+            else:
+                state_code = "estado"
+                previous = self._get_current_state_row(conn, device_id, state_code, bloquear=True)
+                old_value = previous["state_value"] if previous else None
+                new_value = str(valor)
 
-            self._upsert_current_state(
-                conn,
-                device_id,
-                "lectura_actual",
-                str(valor),
-                numeric_value,
-                source=source,
-                payload=payload,
-            )
-        else:
-            state_code = "estado"
-            previous = self._get_current_state_row(conn, device_id, state_code)
-            old_value = previous["state_value"] if previous else None
-            new_value = str(valor)
+                if old_value != new_value:
+                    self._insert_state_history(
+                        conn,
+                        device_id,
+                        state_code,
+                        old_value,
+                        new_value,
+                        "cambio_estado",
+                        source=source,
+                        payload=payload,
+                    )
+                    registro = new_value
 
-            if old_value != new_value:
-                self._insert_state_history(
+                self._upsert_current_state(
                     conn,
                     device_id,
                     state_code,
-                    old_value,
                     new_value,
-                    "cambio_estado",
+                    None,
                     source=source,
                     payload=payload,
                 )
 
-            self._upsert_current_state(
-                conn,
-                device_id,
-                state_code,
-                new_value,
-                None,
-                source=source,
-                payload=payload,
-            )
+        if registro is not None:
+            self._marcar_estadistica(nombre_sensor)
 
-        conn.close()
+        return True
 
-    def guardar_lectura_sensor_ordinario(self, valor_numerico, valor_alfanumerico: str, source: str = "esp32"):
+    def guardar_lectura_sensor_ordinario(
+        self,
+        valor_numerico,
+        valor_alfanumerico: str,
+        source: str = "esp32",
+        idempotency_key: Optional[str] = None,
+        recorded_at: Optional[datetime] = None,
+    ) -> bool:
         """
         Guarda en la BBDD una lectura mixta del nuevo sensor ordinario.
 
@@ -337,211 +716,971 @@ class SensorDataManager:
         Esta implementación usa la tabla readings ampliada con los campos
         text_value y reading_kind para mantener los dos valores asociados
         al mismo instante de lectura.
+
+        Con idempotency_key, un reintento de la misma lectura no se guarda
+        dos veces. recorded_at es el instante de la lectura si la placa lo
+        envía (por defecto, ahora).
+
+        Devuelve False si no se pudo escribir en la BBDD (ni, en una tienda,
+        en el registro local).
         """
+        recorded_at = self._parse_recorded_at(recorded_at, None) or datetime.now()
+
+        def guardar() -> bool:
+            anotada = self._anotar_en_registro_local([{
+                "tipo": "ordinaria",
+                "sensor": "sensor_ordinario",
+                "valor_numerico": valor_numerico,
+                "valor_alfanumerico": valor_alfanumerico,
+                "source": source,
+                "recorded_at": recorded_at,
+                "idempotency_key": self._clave_registro(idempotency_key),
+            }])
+            return self._escribir_tras_anotar(anotada, lambda: self._reintentar_si_recurso_obsoleto(
+                "sensor_ordinario",
+                lambda: self._guardar_lectura_sensor_ordinario(
+                    valor_numerico, valor_alfanumerico, source, recorded_at, idempotency_key
+                ),
+            ))
+
+        return self._guardar_idempotente("sensor_ordinario", idempotency_key, guardar)
+
+    def _guardar_lectura_sensor_ordinario(
+        self,
+        valor_numerico,
+        valor_alfanumerico: str,
+        source: str,
+        recorded_at: datetime,
+        idempotency_key: Optional[str] = None,
+    ) -> bool:
         device_id, sensor_type_id, unit = self._ensure_sensor_resources("sensor_ordinario")
         if not device_id or not sensor_type_id:
-            return
-
-        conn = get_connection()
-        if not conn:
-            return
+            return False
 
-        try:
-            numeric_value = float(valor_numerico)
-            text_value = str(valor_alfanumerico).strip()[:100]
+        numeric_value = float(valor_numerico)
+        text_value = str(valor_alfanumerico).strip()[:100]
 
-            payload = {
-                "sensor_name": "sensor_ordinario",
-                "numeric_value": numeric_value,
-                "text_value": text_value,
-            }
+        with self._unidad_de_trabajo() as conn:
+            if not conn:
+                return False
 
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO readings (
-                    device_id, sensor_type_id, reading_value, text_value, normalized_value,
-                    consumption_w, reading_unit, reading_kind, recorded_at, source, payload
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, 'mixto', NOW(6), %s, %s)
-                """,
-                (
-                    device_id,
-                    sensor_type_id,
-                    numeric_value,
-                    text_value,
-                    numeric_value,
-                    None,
-                    unit,
-                    source,
-                    json.dumps(payload, ensure_ascii=False),
-                )
+            insertada = self._escribir_ordinaria(
+                conn, device_id, sensor_type_id, unit, numeric_value, text_value, source, recorded_at,
+                idempotency_key,
             )
-            conn.commit()
-            cursor.close()
 
-            self._upsert_current_state(
-                conn,
-                device_id,
-                "ordinario_num",
-                str(numeric_value),
-                numeric_value,
-                source=source,
-                payload=payload,
+        if insertada:
+            self._marcar_estadistica("sensor_ordinario")
+        return True
+
+    def _escribir_ordinaria(
+        self,
+        conn,
+        device_id: int,
+        sensor_type_id: int,
+        unit: Optional[str],
+        numeric_value: float,
+        text_value: str,
+        source: str,
+        recorded_at: datetime,
+        idempotency_key: Optional[str] = None,
+    ) -> bool:
+        """Escribe la lectura mixta; False si el índice único la descartó por repetida."""
+        payload = {
+            "sensor_name": "sensor_ordinario",
+            "numeric_value": numeric_value,
+            "text_value": text_value,
+        }
+
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO readings (
+                device_id, sensor_type_id, reading_value, text_value, normalized_value,
+                consumption_w, reading_unit, reading_kind, recorded_at, source, payload, idempotency_key
             )
-            self._upsert_current_state(
-                conn,
+            VALUES (%s, %s, %s, %s, %s, %s, %s, 'mixto', %s, %s, %s, %s){}
+            """.format(SIN_REPETIDAS if idempotency_key else ""),
+            (
                 device_id,
-                "ordinario_txt",
+                sensor_type_id,
+                numeric_value,
                 text_value,
+                numeric_value,
                 None,
-                source=source,
-                payload=payload,
+                unit,
+                recorded_at,
+                source,
+                json.dumps(payload, ensure_ascii=False),
+                idempotency_key,
             )
-        finally:
-            conn.close()
+        )
+        insertada = cursor.rowcount != 0
+        cursor.close()
+        if not insertada:
+            return False
 
-    def guardar_lecturas_lote(self, lecturas: List[Dict], source: str = "simulado"):
-        if not lecturas:
-            return
-        for lectura in lecturas:
-            self.guardar_lectura_sensor(
-                lectura.get("sensor"),
-                lectura.get("valor"),
-                source=source,
-            )
+        actualizar_rollups(conn, [(device_id, recorded_at, numeric_value, None)])
+        self._upsert_ultimas_lecturas(
+            conn, [(device_id, sensor_type_id, numeric_value, text_value, unit, recorded_at, source)]
+        )
 
-    def leer_lecturas_sensor(self, nombre_sensor: str) -> List[Dict]:
-        info = self._get_catalog_info(nombre_sensor)
+        self._upsert_current_state(
+            conn,
+            device_id,
+            "ordinario_num",
+            str(numeric_value),
+            numeric_value,
+            source=source,
+            payload=payload,
+        )
+        self._upsert_current_state(
+            conn,
+            device_id,
+            "ordinario_txt",
+            text_value,
+            None,
+            source=source,
+            payload=payload,
+        )
+        return True
 
-        conn = get_connection()
-        if not conn:
-            return []
+    def guardar_lecturas_lote(self, lecturas: List[Dict], source: str = "simulado") -> List[Dict]:
+        """
+        Guarda un lote de lecturas con una sola conexión y un único commit.
 
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT id FROM devices WHERE device_code = %s LIMIT 1",
-            (info["device_code"],)
-        )
-        device = cursor.fetchone()
+        - Los ids de cada sensor se resuelven una vez por lote.
+        - Las lecturas numéricas se insertan en readings con un executemany.
+        - current_state se actualiza con un único INSERT ... ON DUPLICATE KEY
+          UPDATE con el último valor de cada (device_id, state_code).
+        - Los cambios de estado (sensores no numéricos) van a state_history.
+        - Las lecturas con idempotency_key ya vistas se marcan como
+          "duplicada" y no se escriben.
+        - En una tienda, las lecturas válidas se anotan antes en el registro
+          local; si la BBDD local no responde quedan "ok" con ese detalle.
 
-        if not device:
-            cursor.close()
-            conn.close()
+        Devuelve un resultado por lectura, en el mismo orden de entrada. Los
+        errores de conexión llevan "reintentable": True.
+        """
+        if not lecturas:
             return []
 
-        device_id = device["id"]
+        # Los reintentos ya vistos se descartan antes de cualquier consulta
+        claves: Dict[int, Tuple[str, str]] = {}
+        omitidas = set()
+        for indice, lectura in enumerate(lecturas):
+            if lectura.get("idempotency_key") and lectura.get("sensor"):
+                clave = (lectura["sensor"], lectura["idempotency_key"])
+                if self.dedup.registrar(clave):
+                    claves[indice] = clave
+                else:
+                    omitidas.add(indice)
 
-        if nombre_sensor == "sensor_ordinario":
-            cursor.execute(
-                """
-                SELECT reading_value, text_value, recorded_at
-                FROM readings
-                WHERE device_id = %s
-                ORDER BY recorded_at ASC, id ASC
-                """,
-                (device_id,)
-            )
-            rows = cursor.fetchall()
-            cursor.close()
-            conn.close()
+        ahora = datetime.now()
+        lecturas = [lectura if lectura.get("recorded_at") else {**lectura, "recorded_at": ahora} for lectura in lecturas]
 
-            return [
-                {
-                    "timestamp": row["recorded_at"].isoformat(),
-                    "valor": float(row["reading_value"]),
-                    "valor_numerico": float(row["reading_value"]),
-                    "valor_alfanumerico": row.get("text_value"),
-                }
-                for row in rows
-            ]
+        # Las claves del registro local se fijan aquí para que un reintento anote las mismas
+        claves_registro = None
+        if self.registro_local is not None:
+            claves_registro = [self._clave_registro(lectura.get("idempotency_key")) for lectura in lecturas]
 
-        if nombre_sensor == "sensor_puerta":
-            cursor.execute(
-                """
-                SELECT new_value, changed_at
-                FROM state_history
-                WHERE device_id = %s AND state_code = 'estado'
-                ORDER BY changed_at ASC, id ASC
-                """,
-                (device_id,)
+        try:
+            resultados = self._reintentar_si_recurso_obsoleto(
+                None,
+                lambda: self._guardar_lecturas_lote(lecturas, source, omitidas, claves_registro),
             )
-            rows = cursor.fetchall()
+        except Exception:
+            for clave in claves.values():
+                self.dedup.olvidar(clave)
+            raise
 
-            if not rows:
-                cursor.execute(
-                    """
-                    SELECT state_value, updated_at
-                    FROM current_state
-                    WHERE device_id = %s AND state_code = 'estado'
-                    ORDER BY id DESC
-                    LIMIT 1
-                    """,
-                    (device_id,)
-                )
-                current = cursor.fetchone()
-                cursor.close()
-                conn.close()
+        for indice, clave in claves.items():
+            if resultados[indice]["estado"] == "error":
+                self.dedup.olvidar(clave)
+        return resultados
 
-                if not current:
-                    return []
+    def _guardar_lecturas_lote(
+        self, lecturas: List[Dict], source: str, omitidas=frozenset(), claves_registro: Optional[List[str]] = None
+    ) -> List[Dict]:
+        resultados: List[Optional[Dict]] = [None] * len(lecturas)
+        recursos: Dict[str, Tuple[Optional[int], Optional[int], Optional[str]]] = {}
+        validas = []
+        por_anotar = []
+        anotadas = set()
 
-                return [{
-                    "timestamp": current["updated_at"].isoformat(),
-                    "valor": current["state_value"]
-                }]
+        def no_escrita(indice: int, nombre_sensor: str, detalle: str) -> Dict:
+            # La BBDD no respondió: si la lectura ya está en el registro local, no se pierde
+            if indice in anotadas:
+                return {"indice": indice, "sensor": nombre_sensor, "estado": "ok", "detalle": EN_REGISTRO_LOCAL}
+            return {
+                "indice": indice,
+                "sensor": nombre_sensor,
+                "estado": "error",
+                "detalle": detalle,
+                "reintentable": True,
+            }
 
-            cursor.close()
-            conn.close()
+        ahora = datetime.now()
+
+        for indice, lectura in enumerate(lecturas):
+            nombre_sensor = lectura.get("sensor")
+            valor = lectura.get("valor")
+
+            if indice in omitidas:
+                resultados[indice] = {"indice": indice, "sensor": nombre_sensor, "estado": "duplicada"}
+                continue
+
+            if not nombre_sensor or valor is None:
+                resultados[indice] = {
+                    "indice": indice,
+                    "sensor": nombre_sensor,
+                    "estado": "error",
+                    "detalle": "Faltan el sensor o el valor de la lectura",
+                }
+                continue
+
+            if isinstance(valor, float) and not math.isfinite(valor):
+                # Un NaN haría fallar la transacción de todo el lote
+                resultados[indice] = {
+                    "indice": indice,
+                    "sensor": nombre_sensor,
+                    "estado": "error",
+                    "detalle": "Valor no finito (NaN o infinito)",
+                }
+                continue
 
-            return [
+            recorded_at = self._parse_recorded_at(lectura.get("recorded_at"), ahora)
+            if recorded_at is None:
+                resultados[indice] = {
+                    "indice": indice,
+                    "sensor": nombre_sensor,
+                    "estado": "error",
+                    "detalle": "Fecha de la lectura no válida",
+                }
+                continue
+
+            if claves_registro is not None:
+                por_anotar.append((indice, nombre_sensor, valor, recorded_at))
+            validas.append((
+                indice, nombre_sensor, valor, None, None, None, recorded_at,
+                lectura.get("idempotency_key"),
+            ))
+
+        # Antes de tocar la BBDD: si no responde, lo anotado llega igual al servidor central
+        if por_anotar:
+            self._anotar_en_registro_local([
                 {
-                    "timestamp": row["changed_at"].isoformat(),
-                    "valor": row["new_value"]
+                    "tipo": "lectura",
+                    "sensor": nombre_sensor,
+                    "valor": valor,
+                    "source": source,
+                    "recorded_at": recorded_at,
+                    "idempotency_key": claves_registro[indice],
                 }
-                for row in rows
-            ]
+                for indice, nombre_sensor, valor, recorded_at in por_anotar
+            ])
+            anotadas = {indice for indice, *_ in por_anotar}
+
+        resueltas = []
+        for indice, nombre_sensor, valor, _, _, _, recorded_at, clave in validas:
+            if nombre_sensor not in recursos:
+                recursos[nombre_sensor] = self._ensure_sensor_resources(nombre_sensor)
+
+            device_id, sensor_type_id, unit = recursos[nombre_sensor]
+            if not device_id or not sensor_type_id:
+                resultados[indice] = no_escrita(indice, nombre_sensor, "No se pudo resolver el sensor en la BBDD")
+                continue
+
+            resueltas.append((indice, nombre_sensor, valor, device_id, sensor_type_id, unit, recorded_at, clave))
+        validas = resueltas
+
+        if not validas:
+            return resultados
+
+        try:
+            with self._unidad_de_trabajo() as conn:
+                if not conn:
+                    for indice, nombre_sensor, *_ in validas:
+                        resultados[indice] = no_escrita(indice, nombre_sensor, "No se pudo conectar con la BBDD")
+                    return resultados
+
+                registros, repetidas = self._escribir_lote(conn, validas, source)
+        except Exception as e:
+            if self._es_error_recurso_obsoleto(e):
+                raise
+            transitorio = self.es_error_transitorio(e)
+            for indice, nombre_sensor, *_ in validas:
+                if transitorio:
+                    resultados[indice] = no_escrita(indice, nombre_sensor, str(e))
+                else:
+                    resultados[indice] = {
+                        "indice": indice,
+                        "sensor": nombre_sensor,
+                        "estado": "error",
+                        "detalle": str(e),
+                        "reintentable": False,
+                    }
+            return resultados
+
+        for indice, nombre_sensor, *_ in validas:
+            resultados[indice] = {
+                "indice": indice,
+                "sensor": nombre_sensor,
+                "estado": "duplicada" if indice in repetidas else "ok",
+            }
+
+        for nombre_sensor in {nombre_sensor for nombre_sensor, _, _ in registros}:
+            self._marcar_estadistica(nombre_sensor)
+
+        return resultados
+
+    def _escribir_lote(self, conn, validas: List[Tuple], source: str) -> Tuple[List[Tuple[str, object, datetime]], set]:
+        """
+        Escribe el lote (tuplas indice, sensor, valor, device_id, sensor_type_id,
+        unit, recorded_at, idempotency_key) y devuelve los (sensor, valor,
+        recorded_at) que cuentan para las estadísticas y los índices
+        descartados por repetidos.
+        """
+        filas_readings = []
+        filas_historial = []
+        filas_rollup = []
+        registros = []
+        # (device_id, state_code) -> (state_value, numeric_value, payload_json)
+        estados: Dict[Tuple[int, str], Tuple[str, Optional[float], str]] = {}
+
+        dispositivos_estado = sorted({
+            device_id for _, _, valor, device_id, _, _, _, _ in validas
+            if not self._is_numeric(valor)
+        })
+        estado_previo = self._get_current_state_values(conn, dispositivos_estado, "estado")
+
+        # Claves de idempotencia que la caché no recordaba pero ya están en readings
+        existentes = self._claves_existentes(conn, [
+            (device_id, clave) for _, _, valor, device_id, _, _, _, clave in validas
+            if clave and self._is_numeric(valor)
+        ])
+        repetidas = set()
+        # Cada lectura numérica del lote se evalúa contra los umbrales, en orden
+        evaluaciones: List[Tuple[int, str, float]] = []
+        nombres: Dict[int, str] = {}
+
+        for indice, nombre_sensor, valor, device_id, sensor_type_id, unit, recorded_at, clave in validas:
+            payload_json = json.dumps({"sensor_name": nombre_sensor}, ensure_ascii=False)
+            nombres[device_id] = nombre_sensor
+
+            if self._is_numeric(valor):
+                if clave:
+                    if (device_id, clave) in existentes:
+                        repetidas.add(indice)
+                        continue
+                    existentes.add((device_id, clave))
 
+                numeric_value = float(valor)
+                filas_readings.append((
+                    device_id,
+                    sensor_type_id,
+                    numeric_value,
+                    numeric_value,
+                    None,
+                    unit,
+                    recorded_at,
+                    source,
+                    payload_json,
+                    clave,
+                ))
+                filas_rollup.append((device_id, recorded_at, numeric_value, None))
+                evaluaciones.append((device_id, nombre_sensor, numeric_value))
+                estados[(device_id, "lectura_actual")] = (str(valor), numeric_value, payload_json)
+                registros.append((nombre_sensor, numeric_value, recorded_at))
+            else:
+                new_value = str(valor)
+                old_value = estado_previo.get(device_id)
+                if old_value != new_value:
+                    filas_historial.append((
+                        device_id, "estado", old_value, new_value,
+                        "cambio_estado", source, payload_json,
+                    ))
+                    estado_previo[device_id] = new_value
+                    registros.append((nombre_sensor, new_value, recorded_at))
+                estados[(device_id, "estado")] = (new_value, None, payload_json)
+
+        cursor = conn.cursor()
+
+        if filas_readings:
+            cursor.executemany(
+                """
+                INSERT INTO readings (
+                    device_id, sensor_type_id, reading_value, normalized_value,
+                    consumption_w, reading_unit, recorded_at, source, payload, idempotency_key
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s){}
+                """.format(SIN_REPETIDAS if existentes else ""),
+                filas_readings
+            )
+            actualizar_rollups(conn, filas_rollup)
+            self._upsert_ultimas_lecturas(conn, [
+                (device_id, sensor_type_id, reading_value, None, unit, recorded_at, source)
+                for device_id, sensor_type_id, reading_value, _, _, unit, recorded_at, _, _, _ in filas_readings
+            ])
+
+        if filas_historial:
+            cursor.executemany(
+                """
+                INSERT INTO state_history (
+                    device_id, state_code, old_value, new_value, changed_at, event_type, source, payload
+                )
+                VALUES (%s, %s, %s, %s, NOW(6), %s, %s, %s)
+                """,
+                filas_historial
+            )
+
+        if estados:
+            valores = []
+            for (device_id, state_code), (state_value, numeric_value, payload_json) in estados.items():
+                valores.extend((device_id, state_code, state_value, numeric_value, source, payload_json))
+
+            cursor.execute(
+                """
+                INSERT INTO current_state (
+                    device_id, state_code, state_value, numeric_value, updated_at, source, payload
+                )
+                VALUES {}
+                ON DUPLICATE KEY UPDATE
+                    state_value = VALUES(state_value),
+                    numeric_value = VALUES(numeric_value),
+                    updated_at = VALUES(updated_at),
+                    source = VALUES(source),
+                    payload = VALUES(payload)
+                """.format(", ".join(["(%s, %s, %s, %s, NOW(6), %s, %s)"] * len(estados))),
+                tuple(valores)
+            )
+        cursor.close()
+
+        for device_id, nombre_sensor, numeric_value in evaluaciones:
+            self._evaluar_umbrales(conn, device_id, nombre_sensor, "lectura_actual", numeric_value)
+        for (device_id, state_code), (state_value, numeric_value, _) in estados.items():
+            self._anotar_cambio_estado(device_id, nombres[device_id], state_code, state_value, numeric_value, source)
+
+        return registros, repetidas
+
+    def _claves_existentes(self, conn, pares: List[Tuple[int, str]]) -> set:
+        """De los pares (device_id, idempotency_key), los que ya tienen fila en readings."""
+        if not pares:
+            return set()
+
+        # Filtrar también por device_id deja usar uq_readings_device_idempotency
+        # (device_id, idempotency_key); solo por la clave se recorre readings
+        dispositivos = sorted({device_id for device_id, _ in pares})
+        claves = sorted({clave for _, clave in pares})
+        cursor = conn.cursor()
         cursor.execute(
             """
-            SELECT reading_value, recorded_at
+            SELECT device_id, idempotency_key
             FROM readings
-            WHERE device_id = %s
-            ORDER BY recorded_at ASC, id ASC
+            WHERE device_id IN ({}) AND idempotency_key IN ({})
+            """.format(", ".join(["%s"] * len(dispositivos)), ", ".join(["%s"] * len(claves))),
+            tuple(dispositivos) + tuple(claves)
+        )
+        buscados = set(pares)
+        existentes = {(device_id, clave) for device_id, clave in cursor.fetchall() if (device_id, clave) in buscados}
+        cursor.close()
+        return existentes
+
+    def _get_current_state_values(self, conn, device_ids: List[int], state_code: str) -> Dict[int, str]:
+        if not device_ids:
+            return {}
+
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            """
+            SELECT device_id, state_value
+            FROM current_state
+            WHERE state_code = %s AND device_id IN ({})
+            FOR UPDATE
+            """.format(", ".join(["%s"] * len(device_ids))),
+            (state_code, *device_ids)
+        )
+        valores = {row["device_id"]: row["state_value"] for row in cursor.fetchall()}
+        cursor.close()
+        return valores
+
+    def _clave_registro(self, idempotency_key: Optional[str]) -> Optional[str]:
+        """
+        Clave con la que la lectura va al registro local: la de la placa o,
+        si no trae, una nueva. Con ella el servidor central descarta la
+        lectura que se anotó dos veces porque se reintentó la escritura.
+        """
+        if self.registro_local is None:
+            return None
+        return idempotency_key or f"edge-{uuid.uuid4().hex}"
+
+    def _anotar_en_registro_local(self, registros: List[Dict]) -> bool:
+        """
+        Anexa las lecturas al EdgeLog antes de escribirlas en la BBDD, así
+        que un corte de la BBDD local no pierde nada. False si no hay
+        registro local.
+        """
+        if self.registro_local is None:
+            return False
+        self.registro_local.anexar(registros)
+        return True
+
+    def _escribir_tras_anotar(self, anotada: bool, escritura: Callable[[], bool]) -> bool:
+        """
+        Escribe en la BBDD una lectura. Si ya está en el registro local, que
+        la BBDD no responda no la pierde: cuenta como guardada y llegará al
+        servidor central.
+        """
+        try:
+            guardada = escritura()
+        except Exception as e:
+            if not (anotada and self.es_error_transitorio(e)):
+                raise
+            logger.warning("%s: %s", EN_REGISTRO_LOCAL, e)
+            return True
+        if not guardada and anotada:
+            logger.warning(EN_REGISTRO_LOCAL)
+            return True
+        return guardada
+
+    def guardar_lote_sincronizado(self, edge_id: str, registros: List[Dict]) -> Dict:
+        """
+        Aplica un lote enviado por una tienda (EdgeSyncWorker) en una sola
+        transacción. Los registros traen la secuencia de su registro local;
+        los que no superan la última secuencia aplicada de esa tienda
+        (edge_sync_state) se dan por duplicados, así que reenviar un lote
+        es inocuo. Los registros no válidos se cuentan en errores y no se
+        vuelven a pedir.
+        """
+        if not registros:
+            return {"aplicadas": 0, "duplicadas": 0, "ultima_seq": None, "errores": []}
+
+        return self._reintentar_si_recurso_obsoleto(
+            None,
+            lambda: self._guardar_lote_sincronizado(edge_id, registros),
+        )
+
+    def _guardar_lote_sincronizado(self, edge_id: str, registros: List[Dict]) -> Dict:
+        registros = sorted(registros, key=lambda r: r["seq"])
+        errores = []
+        lecturas_por_origen: Dict[str, List[Tuple]] = {}
+        ordinarias = []
+        recursos: Dict[str, Tuple[Optional[int], Optional[int], Optional[str]]] = {}
+
+        for registro in registros:
+            seq = registro["seq"]
+            nombre_sensor = registro.get("sensor")
+            source = registro.get("source") or "esp32"
+            recorded_at = self._parse_recorded_at(registro.get("recorded_at"), None)
+
+            if not nombre_sensor or recorded_at is None:
+                errores.append({"seq": seq, "detalle": "Faltan el sensor o la fecha de la lectura"})
+                continue
+
+            if nombre_sensor not in recursos:
+                recursos[nombre_sensor] = self._ensure_sensor_resources(nombre_sensor)
+            device_id, sensor_type_id, unit = recursos[nombre_sensor]
+            if not device_id or not sensor_type_id:
+                errores.append({"seq": seq, "detalle": "No se pudo resolver el sensor en la BBDD"})
+                continue
+
+            if registro.get("tipo") == "ordinaria":
+                if not self._is_numeric(registro.get("valor_numerico")) or registro.get("valor_alfanumerico") is None:
+                    errores.append({"seq": seq, "detalle": "Lectura ordinaria incompleta"})
+                    continue
+                if not math.isfinite(float(registro["valor_numerico"])):
+                    errores.append({"seq": seq, "detalle": "Valor no finito (NaN o infinito)"})
+                    continue
+                ordinarias.append((
+                    seq, device_id, sensor_type_id, unit,
+                    float(registro["valor_numerico"]), str(registro["valor_alfanumerico"]).strip()[:100],
+                    source, recorded_at, registro.get("idempotency_key"),
+                ))
+            else:
+                if registro.get("valor") is None:
+                    errores.append({"seq": seq, "detalle": "Falta el valor de la lectura"})
+                    continue
+                if isinstance(registro["valor"], float) and not math.isfinite(registro["valor"]):
+                    # Un NaN haría fallar la transacción de todo el lote en cada reenvío
+                    errores.append({"seq": seq, "detalle": "Valor no finito (NaN o infinito)"})
+                    continue
+                lecturas_por_origen.setdefault(source, []).append((
+                    seq, nombre_sensor, registro["valor"], device_id, sensor_type_id, unit, recorded_at,
+                    registro.get("idempotency_key"),
+                ))
+
+        ultima_seq = registros[-1]["seq"]
+        registros_stats = []
+        aplicadas = 0
+        duplicadas = 0
+
+        with self._unidad_de_trabajo() as conn:
+            if not conn:
+                raise ConnectionError("No se pudo conectar con la BBDD")
+
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                "SELECT last_seq FROM edge_sync_state WHERE edge_id = %s FOR UPDATE",
+                (edge_id,)
+            )
+            row = cursor.fetchone()
+            aplicada = int(row["last_seq"]) if row else 0
+
+            for source, validas in lecturas_por_origen.items():
+                nuevas = [v for v in validas if v[0] > aplicada]
+                duplicadas += len(validas) - len(nuevas)
+                if nuevas:
+                    registros_lote, repetidas = self._escribir_lote(conn, nuevas, source)
+                    registros_stats.extend(registros_lote)
+                    aplicadas += len(nuevas) - len(repetidas)
+                    duplicadas += len(repetidas)
+
+            for seq, device_id, sensor_type_id, unit, numeric_value, text_value, source, recorded_at, clave in ordinarias:
+                if seq <= aplicada or not self._escribir_ordinaria(
+                    conn, device_id, sensor_type_id, unit, numeric_value, text_value, source, recorded_at, clave
+                ):
+                    duplicadas += 1
+                    continue
+                registros_stats.append(("sensor_ordinario", (numeric_value, text_value), recorded_at))
+                aplicadas += 1
+
+            cursor.execute(
+                """
+                INSERT INTO edge_sync_state (edge_id, last_seq, updated_at)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    last_seq = GREATEST(last_seq, VALUES(last_seq)),
+                    updated_at = VALUES(updated_at)
+                """,
+                (edge_id, max(aplicada, ultima_seq), datetime.now())
+            )
+            cursor.close()
+
+        for nombre_sensor in {nombre_sensor for nombre_sensor, _, _ in registros_stats}:
+            self._marcar_estadistica(nombre_sensor)
+
+        return {
+            "aplicadas": aplicadas,
+            "duplicadas": duplicadas,
+            "ultima_seq": max(aplicada, ultima_seq),
+            "errores": [e for e in errores if e["seq"] > aplicada],
+        }
+
+    def leer_lecturas_sensor(
+        self,
+        nombre_sensor: str,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        limite: Optional[int] = None,
+        cursor: Optional[str] = None,
+        descendente: bool = False,
+    ) -> List[Dict]:
+        """
+        Lecturas del sensor ordenadas por fecha. Sin argumentos devuelve todo
+        el histórico; ver leer_pagina_lecturas() para consultas paginadas.
+        """
+        return self.leer_pagina_lecturas(
+            nombre_sensor, desde, hasta, limite, cursor, descendente
+        )["lecturas"]
+
+    def leer_pagina_lecturas(
+        self,
+        nombre_sensor: str,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        limite: Optional[int] = None,
+        cursor: Optional[str] = None,
+        descendente: bool = False,
+    ) -> Dict:
+        """
+        Página de lecturas en el intervalo [desde, hasta].
+        La paginación es por clave (fecha, id): el "cursor" devuelto se pasa
+        tal cual para pedir la página siguiente y vale None en la última.
+        """
+        vacia = {"lecturas": [], "cursor": None}
+        posicion = self._decodificar_cursor(cursor) if cursor else None
+
+        conn = self._get_connection()
+        if not conn:
+            return vacia
+
+        try:
+            db_cursor = conn.cursor(dictionary=True)
+            device_id = self._get_device_id(db_cursor, nombre_sensor)
+            if not device_id:
+                return vacia
+
+            sql, params, columna_fecha = self._consulta_lecturas(
+                nombre_sensor, device_id, desde, hasta, posicion, descendente, limite
+            )
+            db_cursor.execute(sql, tuple(params))
+            rows = db_cursor.fetchall()
+
+            siguiente = None
+            if limite and len(rows) > limite:
+                rows = rows[:limite]
+                siguiente = self._codificar_cursor(rows[-1][columna_fecha], rows[-1]["id"])
+
+            if nombre_sensor == "sensor_puerta" and not rows and not posicion:
+                return {"lecturas": self._leer_estado_actual(db_cursor, device_id, desde, hasta), "cursor": None}
+
+            lecturas = [self._formatear_fila(nombre_sensor, row) for row in rows]
+            db_cursor.close()
+            return {"lecturas": lecturas, "cursor": siguiente}
+        finally:
+            conn.close()
+
+    def _consulta_lecturas(
+        self,
+        nombre_sensor: str,
+        device_id: int,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        posicion: Optional[Tuple[datetime, int]] = None,
+        descendente: bool = False,
+        limite: Optional[int] = None,
+    ) -> Tuple[str, List, str]:
+        """Construye la consulta del histórico: (sql, parámetros, columna de fecha)."""
+        if nombre_sensor == "sensor_puerta":
+            tabla, columna_fecha, columnas = "state_history", "changed_at", "new_value"
+            condiciones = ["device_id = %s", "state_code = 'estado'"]
+        else:
+            tabla, columna_fecha, columnas = "readings", "recorded_at", "reading_value, text_value"
+            condiciones = ["device_id = %s"]
+        params: List = [device_id]
+
+        if desde:
+            condiciones.append(f"{columna_fecha} >= %s")
+            params.append(desde)
+        if hasta:
+            condiciones.append(f"{columna_fecha} <= %s")
+            params.append(hasta)
+        if posicion:
+            comparador = "<" if descendente else ">"
+            condiciones.append(
+                f"({columna_fecha} {comparador} %s OR ({columna_fecha} = %s AND id {comparador} %s))"
+            )
+            params.extend([posicion[0], posicion[0], posicion[1]])
+
+        orden = "DESC" if descendente else "ASC"
+        sql = f"""
+            SELECT id, {columnas}, {columna_fecha}
+            FROM {tabla}
+            WHERE {" AND ".join(condiciones)}
+            ORDER BY {columna_fecha} {orden}, id {orden}
+        """
+        if limite:
+            # Se pide una fila de más para saber si hay otra página
+            sql += " LIMIT %s"
+            params.append(limite + 1)
+
+        return sql, params, columna_fecha
+
+    def _formatear_fila(self, nombre_sensor: str, row: Dict) -> Dict:
+        if nombre_sensor == "sensor_puerta":
+            return {
+                "timestamp": row["changed_at"].isoformat(),
+                "valor": row["new_value"]
+            }
+        return self._formatear_lectura(nombre_sensor, row)
+
+    def exportar_lecturas(
+        self,
+        nombre_sensor: str,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        tamano_bloque: int = 1000,
+    ) -> Optional[Iterator[List[Dict]]]:
+        """
+        Exporta el histórico del sensor en bloques de tamano_bloque lecturas
+        con un cursor sin buffer, de modo que la memoria no depende del
+        número de filas. La consulta se lanza aquí (None si no hay BBDD o
+        no existe el sensor) y las filas se leen al recorrer el iterador.
+        """
+        conn = self._get_connection()
+        if not conn:
+            return None
+
+        try:
+            cursor = conn.cursor(dictionary=True)
+            device_id = self._get_device_id(cursor, nombre_sensor)
+            cursor.close()
+            if not device_id:
+                conn.close()
+                return None
+
+            sql, params, _ = self._consulta_lecturas(nombre_sensor, device_id, desde, hasta)
+            cursor = conn.cursor(dictionary=True, buffered=False)
+            cursor.execute(sql, tuple(params))
+        except Exception:
+            conn.close()
+            raise
+
+        def bloques():
+            completado = False
+            try:
+                while True:
+                    rows = cursor.fetchmany(tamano_bloque)
+                    if not rows:
+                        completado = True
+                        return
+                    yield [self._formatear_fila(nombre_sensor, row) for row in rows]
+            finally:
+                if completado:
+                    cursor.close()
+                    conn.close()
+                else:
+                    # Export cortado a medias: quedan filas sin leer en el
+                    # socket, así que la conexión no se puede reutilizar.
+                    conn.descartar()
+
+        return bloques()
+
+    def _leer_estado_actual(
+        self, cursor, device_id: int, desde: Optional[datetime], hasta: Optional[datetime]
+    ) -> List[Dict]:
+        # Sin historial: se devuelve el estado actual si cae en el intervalo
+        cursor.execute(
+            """
+            SELECT state_value, updated_at
+            FROM current_state
+            WHERE device_id = %s AND state_code = 'estado'
+            ORDER BY id DESC
+            LIMIT 1
             """,
             (device_id,)
         )
-        rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        current = cursor.fetchone()
+
+        if not current:
+            return []
+        if (desde and current["updated_at"] < desde) or (hasta and current["updated_at"] > hasta):
+            return []
+
+        return [{
+            "timestamp": current["updated_at"].isoformat(),
+            "valor": current["state_value"]
+        }]
+
+    @staticmethod
+    def _codificar_cursor(fecha: datetime, row_id: int) -> str:
+        return f"{fecha.isoformat()}_{row_id}"
+
+    @staticmethod
+    def _decodificar_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            fecha, row_id = cursor.rsplit("_", 1)
+            return datetime.fromisoformat(fecha), int(row_id)
+        except ValueError:
+            raise ValueError(f"Cursor de paginación no válido: {cursor}")
+
+    def obtener_ultimas_lecturas(self, nombre_sensor: Optional[str] = None) -> List[Dict]:
+        """
+        Última lectura de cada dispositivo (o solo la del sensor indicado),
+        leída de readings_latest por clave primaria.
+        """
+        conn = self._get_connection()
+        if not conn:
+            return []
+
+        try:
+            cursor = conn.cursor(dictionary=True)
+            condicion = ""
+            params: Tuple = ()
+            if nombre_sensor:
+                device_id = self._get_device_id(cursor, nombre_sensor)
+                if not device_id:
+                    return []
+                condicion = "WHERE rl.device_id = %s"
+                params = (device_id,)
+
+            cursor.execute(
+                f"""
+                SELECT d.device_code, d.device_name, st.code AS sensor_code, st.name AS sensor_name,
+                       rl.reading_value, rl.text_value, rl.reading_unit, rl.consumption_w,
+                       rl.recorded_at, rl.source
+                FROM readings_latest rl
+                JOIN devices d ON d.id = rl.device_id
+                JOIN sensor_types st ON st.id = rl.sensor_type_id
+                {condicion}
+                ORDER BY d.device_code ASC
+                """,
+                params
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
 
         return [
             {
+                "device_code": row["device_code"],
+                "device_name": row["device_name"],
+                "sensor_code": row["sensor_code"],
+                "sensor_name": row["sensor_name"],
+                "valor": float(row["reading_value"]),
+                "valor_alfanumerico": row["text_value"],
+                "unidad": row["reading_unit"],
+                "consumo_w": float(row["consumption_w"]) if row["consumption_w"] is not None else None,
                 "timestamp": row["recorded_at"].isoformat(),
-                "valor": float(row["reading_value"])
+                "source": row["source"],
             }
             for row in rows
         ]
 
+    def obtener_serie(
+        self,
+        nombre_sensor: str,
+        desde: datetime,
+        hasta: Optional[datetime] = None,
+        max_puntos: int = 500,
+    ) -> Dict:
+        """
+        Serie agregada del sensor para gráficas, leída de readings_rollup con
+        la resolución más fina (1m, 1h o 1d) que no supera max_puntos.
+        """
+        hasta = hasta or datetime.now()
+        resolucion = elegir_resolucion(desde, hasta, max_puntos)
+        serie = {"resolucion": resolucion, "puntos": []}
+
+        conn = self._get_connection()
+        if not conn:
+            return serie
+
+        try:
+            cursor = conn.cursor(dictionary=True)
+            device_id = self._get_device_id(cursor, nombre_sensor)
+            if device_id:
+                serie["puntos"] = leer_serie(cursor, device_id, resolucion, desde, hasta)
+            cursor.close()
+            return serie
+        finally:
+            conn.close()
+
     def guardar_consumo_sensor(self, nombre_sensor: str, consumo_wh):
+        self._reintentar_si_recurso_obsoleto(
+            nombre_sensor,
+            lambda: self._guardar_consumo_sensor(nombre_sensor, consumo_wh),
+        )
+
+    def _guardar_consumo_sensor(self, nombre_sensor: str, consumo_wh):
         device_id, _, _ = self._ensure_sensor_resources(nombre_sensor)
         if not device_id:
             return
 
-        conn = get_connection()
-        if not conn:
-            return
+        with self._unidad_de_trabajo() as conn:
+            if not conn:
+                return
 
-        self._upsert_current_state(
-            conn,
-            device_id,
-            "consumo_24h",
-            str(consumo_wh),
-            float(consumo_wh) if self._is_numeric(consumo_wh) else None,
-            source="sistema",
-            payload={"sensor_name": nombre_sensor, "tipo": "consumo_24h"},
-        )
-        conn.close()
+            self._upsert_current_state(
+                conn,
+                device_id,
+                "consumo_24h",
+                str(consumo_wh),
+                float(consumo_wh) if self._is_numeric(consumo_wh) else None,
+                source="sistema",
+                payload={"sensor_name": nombre_sensor, "tipo": "consumo_24h"},
+            )
 
     def obtener_estadisticas_sensores(self) -> Dict:
         estadisticas = {}
@@ -549,10 +1688,270 @@ class SensorDataManager:
             estadisticas[nombre_sensor] = self.obtener_estadisticas_sensor_individual(nombre_sensor)
         return estadisticas
 
-    def obtener_estadisticas_sensor_individual(self, nombre_sensor: str) -> Dict:
-        lecturas = self.leer_lecturas_sensor(nombre_sensor)
+    def _marcar_estadistica(self, nombre_sensor: str):
+        # Las filas nuevas se suman al leer las estadísticas, por su id
+        self.estadisticas.marcar(nombre_sensor)
 
-        if not lecturas:
+    def _get_device_id(self, cursor, nombre_sensor: str) -> Optional[int]:
+        cached = self._recursos_cache.get(nombre_sensor)
+        if cached:
+            return cached[0]
+
+        cursor.execute(
+            "SELECT id FROM devices WHERE device_code = %s LIMIT 1",
+            (self._get_catalog_info(nombre_sensor)["device_code"],)
+        )
+        device = cursor.fetchone()
+        return device["id"] if device else None
+
+    def _formatear_lectura(self, nombre_sensor: str, row: Dict) -> Dict:
+        lectura = {
+            "timestamp": row["recorded_at"].isoformat(),
+            "valor": float(row["reading_value"]),
+        }
+        if nombre_sensor == "sensor_ordinario":
+            lectura["valor_numerico"] = lectura["valor"]
+            lectura["valor_alfanumerico"] = row.get("text_value")
+        return lectura
+
+    def _valores_en_rangos(self, cursor, device_id: int, rangos: List[int]) -> Dict[int, float]:
+        """
+        Valores en esas posiciones (base 0) de las lecturas ordenadas por
+        valor, con una sola ordenación que se corta en la mayor posición.
+        """
+        if not rangos:
+            return {}
+
+        buscados = set(rangos)
+        valores: Dict[int, float] = {}
+        cursor.execute(
+            """
+            SELECT reading_value
+            FROM readings
+            WHERE device_id = %s
+            ORDER BY reading_value ASC
+            LIMIT %s
+            """,
+            (device_id, max(buscados) + 1)
+        )
+        posicion = 0
+        while True:
+            filas = cursor.fetchmany(1000)
+            if not filas:
+                break
+            for fila in filas:
+                if posicion in buscados:
+                    valores[posicion] = float(fila["reading_value"])
+                posicion += 1
+        return valores
+
+    def _cargar_estadisticas(self, nombre_sensor: str, mediana_exacta: bool = False):
+        """
+        Calcula los agregados del sensor con consultas de agregación (sin
+        traer el histórico a Python) y los deja en self.estadisticas.
+        Devuelve (stats, mediana exacta o None).
+        """
+        conn = self._get_connection()
+        if not conn:
+            return None, None
+
+        try:
+            cursor = conn.cursor(dictionary=True)
+            device_id = self._get_device_id(cursor, nombre_sensor)
+            if not device_id:
+                return None, None
+
+            if nombre_sensor == "sensor_puerta":
+                stats = self._cargar_estadisticas_estado(cursor, device_id)
+                self.estadisticas.cargar(nombre_sensor, stats)
+                return stats, None
+
+            cursor.execute(
+                """
+                SELECT COUNT(*) AS total,
+                       SUM(reading_value) AS suma,
+                       SUM(reading_value * reading_value) AS suma_cuadrados,
+                       MIN(reading_value) AS minimo,
+                       MAX(reading_value) AS maximo,
+                       MAX(id) AS ultimo_id
+                FROM readings
+                WHERE device_id = %s
+                """,
+                (device_id,)
+            )
+            agregados = cursor.fetchone()
+            total = int(agregados["total"] or 0)
+
+            if not total:
+                stats = RunningStats()
+                self.estadisticas.cargar(nombre_sensor, stats)
+                return stats, None
+
+            extremos = []
+            for orden in ("ASC", "DESC"):
+                cursor.execute(
+                    """
+                    SELECT reading_value, text_value, recorded_at
+                    FROM readings
+                    WHERE device_id = %s
+                    ORDER BY recorded_at {0}, id {0}
+                    LIMIT 1
+                    """.format(orden),
+                    (device_id,)
+                )
+                extremos.append(self._formatear_lectura(nombre_sensor, cursor.fetchone()))
+
+            # Los extremos ya los dan MIN/MAX: solo hacen falta las posiciones intermedias
+            rangos = P2Quantile.rangos_semilla(0.5, total) if total >= 5 else list(range(total))
+            centrales = sorted({(total - 1) // 2, total // 2}) if mediana_exacta else []
+            conocidos = {0: float(agregados["minimo"]), total - 1: float(agregados["maximo"])}
+            valores = self._valores_en_rangos(
+                cursor, device_id, sorted({r for r in rangos + centrales if r not in conocidos})
+            )
+            valores.update(conocidos)
+            alturas = [valores[r] for r in rangos]
+
+            stats = RunningStats.desde_agregados(
+                total,
+                float(agregados["suma"]),
+                float(agregados["suma_cuadrados"]),
+                float(agregados["minimo"]),
+                float(agregados["maximo"]),
+                P2Quantile.desde_cuantiles(0.5, total, alturas),
+                extremos[0],
+                extremos[1],
+                int(agregados["ultimo_id"]),
+            )
+            self.estadisticas.cargar(nombre_sensor, stats)
+
+            mediana = None
+            if mediana_exacta:
+                mediana = sum(valores[r] for r in centrales) / len(centrales)
+
+            return stats, mediana
+        finally:
+            conn.close()
+
+    def _cargar_estadisticas_estado(self, cursor, device_id: int) -> TextStats:
+        stats = TextStats()
+
+        cursor.execute(
+            """
+            SELECT new_value, COUNT(*) AS total, MAX(id) AS ultimo_id
+            FROM state_history
+            WHERE device_id = %s AND state_code = 'estado'
+            GROUP BY new_value
+            """,
+            (device_id,)
+        )
+        for row in cursor.fetchall():
+            stats.valores[row["new_value"]] = int(row["total"])
+            stats.ultimo_id = max(stats.ultimo_id, int(row["ultimo_id"]))
+        stats.total = sum(stats.valores.values())
+
+        if not stats.total:
+            # Sin historial: se usa el estado actual como única lectura
+            cursor.execute(
+                """
+                SELECT state_value, updated_at
+                FROM current_state
+                WHERE device_id = %s AND state_code = 'estado'
+                ORDER BY id DESC
+                LIMIT 1
+                """,
+                (device_id,)
+            )
+            current = cursor.fetchone()
+            if current:
+                lectura = {"timestamp": current["updated_at"].isoformat(), "valor": current["state_value"]}
+                stats.add(current["state_value"], lectura)
+            return stats
+
+        extremos = []
+        for orden in ("ASC", "DESC"):
+            cursor.execute(
+                """
+                SELECT new_value, changed_at
+                FROM state_history
+                WHERE device_id = %s AND state_code = 'estado'
+                ORDER BY changed_at {0}, id {0}
+                LIMIT 1
+                """.format(orden),
+                (device_id,)
+            )
+            row = cursor.fetchone()
+            extremos.append({"timestamp": row["changed_at"].isoformat(), "valor": row["new_value"]})
+
+        stats.primera_lectura, stats.ultima_lectura = extremos
+        return stats
+
+    def _refrescar_estadisticas(self, nombre_sensor: str, stats, cambios: int):
+        """
+        Suma a los agregados las filas con id posterior a la última que
+        cuentan, escritas por este proceso o por otros. Es un rango del
+        índice por dispositivo: no se vuelve a recorrer el histórico.
+        """
+        conn = self._get_connection()
+        if not conn:
+            return
+
+        try:
+            cursor = conn.cursor(dictionary=True)
+            device_id = self._get_device_id(cursor, nombre_sensor)
+            if not device_id:
+                return
+
+            if isinstance(stats, TextStats):
+                cursor.execute(
+                    """
+                    SELECT id, new_value, changed_at
+                    FROM state_history
+                    WHERE device_id = %s AND state_code = 'estado' AND id > %s
+                    ORDER BY id
+                    """,
+                    (device_id, stats.ultimo_id)
+                )
+                filas = [
+                    (row["id"], row["new_value"], {"timestamp": row["changed_at"].isoformat(), "valor": row["new_value"]})
+                    for row in cursor.fetchall()
+                ]
+            else:
+                cursor.execute(
+                    """
+                    SELECT id, reading_value, text_value, recorded_at
+                    FROM readings
+                    WHERE device_id = %s AND id > %s
+                    ORDER BY id
+                    """,
+                    (device_id, stats.ultimo_id)
+                )
+                filas = [
+                    (row["id"], row["reading_value"], self._formatear_lectura(nombre_sensor, row))
+                    for row in cursor.fetchall()
+                ]
+            cursor.close()
+        finally:
+            conn.close()
+
+        self.estadisticas.incorporar(nombre_sensor, stats, filas, cambios)
+
+    def obtener_estadisticas_sensor_individual(self, nombre_sensor: str, exacto: bool = False) -> Dict:
+        """
+        Estadísticas del sensor a partir de los agregados en memoria. La
+        primera vez (o con exacto=True) se calculan con consultas de
+        agregación; después solo se suman las filas nuevas. Con exacto=True
+        la mediana también es exacta en lugar de la estimación P².
+        """
+        stats = self.estadisticas.obtener(nombre_sensor)
+        mediana = None
+        if stats is None or exacto:
+            stats, mediana = self._cargar_estadisticas(nombre_sensor, mediana_exacta=exacto)
+        else:
+            cambios = self.estadisticas.por_refrescar(nombre_sensor)
+            if cambios is not None:
+                self._refrescar_estadisticas(nombre_sensor, stats, cambios)
+
+        if not stats or not stats.total:
             return {
                 "nombre": nombre_sensor,
                 "estado": "sin_datos",
@@ -560,41 +1959,32 @@ class SensorDataManager:
                 "mensaje": "No hay datos disponibles",
             }
 
-        valores = []
-        valores_no_numericos = []
-
-        for lectura in lecturas:
-            valor = lectura.get("valor")
-            try:
-                valores.append(float(valor))
-            except (ValueError, TypeError):
-                valores_no_numericos.append(valor)
-
         resultado = {
             "nombre": nombre_sensor,
             "estado": "operativo",
-            "total_lecturas": len(lecturas),
-            "ultima_lectura": lecturas[-1],
-            "primera_lectura": lecturas[0],
+            "total_lecturas": stats.total,
+            "ultima_lectura": stats.ultima_lectura,
+            "primera_lectura": stats.primera_lectura,
         }
 
-        if valores:
+        if isinstance(stats, RunningStats):
             resultado.update({
                 "tipo_dato": "numerico",
-                "valores_numericos": len(valores),
-                "valores_no_numericos": len(valores_no_numericos),
-                "minimo": round(min(valores), 2),
-                "maximo": round(max(valores), 2),
-                "promedio": round(sum(valores) / len(valores), 2),
-                "mediana": round(statistics.median(valores), 2),
-                "desviacion_estandar": round(statistics.stdev(valores), 2) if len(valores) > 1 else 0,
-                "rango": round(max(valores) - min(valores), 2),
+                "valores_numericos": stats.total,
+                "valores_no_numericos": 0,
+                "minimo": round(stats.minimo, 2),
+                "maximo": round(stats.maximo, 2),
+                "promedio": round(stats.media, 2),
+                "mediana": round(mediana if mediana is not None else stats.mediana.value(), 2),
+                "mediana_exacta": mediana is not None or stats.total < 5,
+                "desviacion_estandar": round(stats.desviacion_estandar(), 2),
+                "rango": round(stats.maximo - stats.minimo, 2),
             })
         else:
             resultado.update({
                 "tipo_dato": "texto",
-                "valores_unicos": len(set(valores_no_numericos)),
-                "valores": list(set(valores_no_numericos)),
+                "valores_unicos": len(stats.valores),
+                "valores": list(stats.valores.keys()),
             })
 
-        return resultado
\ No newline at end of file
+        return resultado
@@ -0,0 +1,44 @@
+import csv
+import io
+import json
+import zlib
+from typing import Dict, Iterable, Iterator, List
+
+
+def columnas_exportacion(nombre_sensor: str) -> List[str]:
+    if nombre_sensor == "sensor_ordinario":
+        return ["timestamp", "valor", "valor_alfanumerico"]
+    return ["timestamp", "valor"]
+
+
+def generar_ndjson(bloques: Iterable[List[Dict]]) -> Iterator[bytes]:
+    """Una lectura JSON por línea; un trozo de salida por bloque leído de la BBDD."""
+    for bloque in bloques:
+        yield "".join(
+            json.dumps(lectura, ensure_ascii=False) + "\n" for lectura in bloque
+        ).encode("utf-8")
+
+
+def generar_csv(bloques: Iterable[List[Dict]], columnas: List[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columnas, extrasaction="ignore")
+    writer.writeheader()
+
+    for bloque in bloques:
+        writer.writerows(bloque)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def comprimir_gzip(trozos: Iterable[bytes], nivel: int = 6) -> Iterator[bytes]:
+    """Comprime en streaming con formato gzip (wbits=31) sin acumular la salida."""
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+    for trozo in trozos:
+        comprimido = compresor.compress(trozo)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Resoluciones de readings_rollup, de la más fina a la más gruesa
+RESOLUCIONES: List[Tuple[str, timedelta]] = [
+    ("1m", timedelta(minutes=1)),
+    ("1h", timedelta(hours=1)),
+    ("1d", timedelta(days=1)),
+]
+
+
+def inicio_bucket(fecha: datetime, resolucion: str) -> datetime:
+    if resolucion == "1m":
+        return fecha.replace(second=0, microsecond=0)
+    if resolucion == "1h":
+        return fecha.replace(minute=0, second=0, microsecond=0)
+    if resolucion == "1d":
+        return fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Resolución no válida: {resolucion}")
+
+
+def elegir_resolucion(desde: datetime, hasta: datetime, max_puntos: int) -> str:
+    """
+    Resolución más fina cuyo número de buckets en [desde, hasta] cabe en
+    max_puntos. Si ninguna cabe se usa la diaria.
+    """
+    duracion = hasta - desde
+    for resolucion, paso in RESOLUCIONES:
+        if duracion // paso + 1 <= max_puntos:
+            return resolucion
+    return RESOLUCIONES[-1][0]
+
+
+def agrupar_rollups(lecturas: Iterable[Tuple[int, datetime, float, Optional[float]]]) -> List[Tuple]:
+    """
+    Agrega en memoria las lecturas (device_id, recorded_at, valor, consumo_w)
+    por dispositivo, resolución y bucket, para hacer un único upsert.
+    """
+    buckets: Dict[Tuple[int, str, datetime], List] = {}
+    for device_id, recorded_at, valor, consumo in lecturas:
+        for resolucion, _ in RESOLUCIONES:
+            clave = (device_id, resolucion, inicio_bucket(recorded_at, resolucion))
+            bucket = buckets.get(clave)
+            if bucket is None:
+                buckets[clave] = [1, valor, valor, valor, consumo or 0.0]
+            else:
+                bucket[0] += 1
+                bucket[1] += valor
+                bucket[2] = min(bucket[2], valor)
+                bucket[3] = max(bucket[3], valor)
+                bucket[4] += consumo or 0.0
+
+    return [clave + tuple(agregado) for clave, agregado in buckets.items()]
+
+
+def actualizar_rollups(conn, lecturas: Iterable[Tuple[int, datetime, float, Optional[float]]]):
+    """Suma las lecturas a readings_rollup dentro de la transacción de conn (no hace commit)."""
+    filas = agrupar_rollups(lecturas)
+    if not filas:
+        return
+
+    valores = []
+    for fila in filas:
+        valores.extend(fila)
+
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        INSERT INTO readings_rollup (
+            device_id, resolution, bucket_start, sample_count,
+            value_sum, value_min, value_max, consumption_sum
+        )
+        VALUES {}
+        ON DUPLICATE KEY UPDATE
+            sample_count = sample_count + VALUES(sample_count),
+            value_sum = value_sum + VALUES(value_sum),
+            value_min = LEAST(value_min, VALUES(value_min)),
+            value_max = GREATEST(value_max, VALUES(value_max)),
+            consumption_sum = consumption_sum + VALUES(consumption_sum)
+        """.format(", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(filas))),
+        tuple(valores)
+    )
+    cursor.close()
+
+
+def leer_serie(cursor, device_id: int, resolucion: str, desde: datetime, hasta: datetime) -> List[Dict]:
+    cursor.execute(
+        """
+        SELECT bucket_start, sample_count, value_sum, value_min, value_max, consumption_sum
+        FROM readings_rollup
+        WHERE device_id = %s
+          AND resolution = %s
+          AND bucket_start >= %s
+          AND bucket_start <= %s
+        ORDER BY bucket_start ASC
+        """,
+        (device_id, resolucion, inicio_bucket(desde, resolucion), hasta)
+    )
+
+    return [
+        {
+            "timestamp": row["bucket_start"].isoformat(),
+            "total": int(row["sample_count"]),
+            "minimo": round(float(row["value_min"]), 2),
+            "maximo": round(float(row["value_max"]), 2),
+            "promedio": round(float(row["value_sum"]) / row["sample_count"], 2),
+            "consumo": round(float(row["consumption_sum"]), 4),
+        }
+        for row in cursor.fetchall()
+    ]
@@ -0,0 +1,264 @@
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class P2Quantile:
+    """
+    Estimador P² (Jain y Chlamtac) de un cuantil sobre un flujo de datos.
+    Usa memoria constante (5 marcadores) y cada add() es O(1).
+    Con menos de 5 valores devuelve el cuantil exacto.
+    """
+
+    def __init__(self, p: float = 0.5):
+        self.p = p
+        self._iniciales: List[float] = []
+        self.q: List[float] = []
+        self.n: List[int] = []
+        self.np: List[float] = []
+        self.dn = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    @classmethod
+    def desde_cuantiles(cls, p: float, total: int, alturas: List[float]) -> "P2Quantile":
+        """
+        Crea el estimador a partir de 5 valores ya conocidos (mínimo, cuantiles
+        intermedios y máximo) de un conjunto de `total` elementos.
+        """
+        estimador = cls(p)
+        if total < 5:
+            estimador._iniciales = sorted(alturas[:total])
+            return estimador
+
+        estimador.q = list(alturas)
+        estimador.np = [1 + (total - 1) * d for d in estimador.dn]
+        estimador.n = [rango + 1 for rango in cls.rangos_semilla(p, total)]
+        return estimador
+
+    @staticmethod
+    def rangos_semilla(p: float, total: int) -> List[int]:
+        """Posiciones (base 0) que hay que consultar para desde_cuantiles()."""
+        return [int(round((total - 1) * d)) for d in (0.0, p / 2, p, (1 + p) / 2, 1.0)]
+
+    def add(self, x: float):
+        if not self.q:
+            self._iniciales.append(x)
+            if len(self._iniciales) == 5:
+                self.q = sorted(self._iniciales)
+                self.n = [1, 2, 3, 4, 5]
+                self.np = [1 + 4 * d for d in self.dn]
+                self._iniciales = []
+            return
+
+        q, n = self.q, self.n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while k < 3 and x >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+
+        for i in (1, 2, 3):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                candidato = self._parabolica(i, d)
+                if not q[i - 1] < candidato < q[i + 1]:
+                    candidato = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = candidato
+                n[i] += d
+
+    def _parabolica(self, i: int, d: int) -> float:
+        q, n = self.q, self.n
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        if self.q:
+            return self.q[2]
+        if not self._iniciales:
+            return None
+
+        valores = sorted(self._iniciales)
+        posicion = (len(valores) - 1) * self.p
+        inferior = math.floor(posicion)
+        superior = math.ceil(posicion)
+        return valores[inferior] + (valores[superior] - valores[inferior]) * (posicion - inferior)
+
+
+class RunningStats:
+    """Agregados incrementales de un sensor numérico (Welford + P² para la mediana)."""
+
+    def __init__(self):
+        self.total = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.minimo: Optional[float] = None
+        self.maximo: Optional[float] = None
+        self.mediana = P2Quantile(0.5)
+        self.primera_lectura: Optional[Dict] = None
+        self.ultima_lectura: Optional[Dict] = None
+        # Id de la última fila de readings incorporada
+        self.ultimo_id = 0
+
+    @classmethod
+    def desde_agregados(
+        cls,
+        total: int,
+        suma: float,
+        suma_cuadrados: float,
+        minimo: float,
+        maximo: float,
+        mediana: P2Quantile,
+        primera_lectura: Dict,
+        ultima_lectura: Dict,
+        ultimo_id: int = 0,
+    ) -> "RunningStats":
+        stats = cls()
+        stats.ultimo_id = ultimo_id
+        stats.total = total
+        stats.media = suma / total
+        stats.m2 = max(0.0, suma_cuadrados - suma * suma / total)
+        stats.minimo = minimo
+        stats.maximo = maximo
+        stats.mediana = mediana
+        stats.primera_lectura = primera_lectura
+        stats.ultima_lectura = ultima_lectura
+        return stats
+
+    def add(self, valor: float, lectura: Dict):
+        self.total += 1
+        delta = valor - self.media
+        self.media += delta / self.total
+        self.m2 += delta * (valor - self.media)
+        self.minimo = valor if self.minimo is None else min(self.minimo, valor)
+        self.maximo = valor if self.maximo is None else max(self.maximo, valor)
+        self.mediana.add(valor)
+        _actualizar_extremos(self, lectura)
+
+    def desviacion_estandar(self) -> float:
+        return math.sqrt(self.m2 / (self.total - 1)) if self.total > 1 else 0
+
+
+class TextStats:
+    """Recuento incremental de un sensor de estado (valores de texto)."""
+
+    def __init__(self):
+        self.total = 0
+        self.valores: Dict[str, int] = {}
+        self.primera_lectura: Optional[Dict] = None
+        self.ultima_lectura: Optional[Dict] = None
+        # Id de la última fila de state_history incorporada
+        self.ultimo_id = 0
+
+    def add(self, valor: str, lectura: Dict):
+        self.total += 1
+        self.valores[valor] = self.valores.get(valor, 0) + 1
+        _actualizar_extremos(self, lectura)
+
+
+def _actualizar_extremos(stats, lectura: Dict):
+    # Por la fecha de la lectura: las que llegan tarde no pasan por la última
+    if stats.primera_lectura is None or lectura["timestamp"] < stats.primera_lectura["timestamp"]:
+        stats.primera_lectura = lectura
+    if stats.ultima_lectura is None or lectura["timestamp"] >= stats.ultima_lectura["timestamp"]:
+        stats.ultima_lectura = lectura
+
+
+class _Entrada:
+    __slots__ = ("stats", "refrescado", "cambios", "cambios_vistos")
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.refrescado = time.monotonic()
+        self.cambios = 0
+        self.cambios_vistos = 0
+
+
+class SensorStatsStore:
+    """
+    Almacén en memoria de los agregados por sensor, seguro entre hilos.
+
+    Cada agregado recuerda el id de la última fila que cuenta. Las
+    escrituras de este proceso solo marcan el sensor (marcar()); al leerlo,
+    si hay marcas o han pasado ttl segundos (para ver lo que escriben otros
+    procesos), se incorporan las filas con id posterior (incorporar()), sin
+    volver a recorrer el histórico.
+    """
+
+    def __init__(self, ttl: Optional[float] = 60.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _Entrada] = {}
+
+    def obtener(self, nombre_sensor: str):
+        """Los agregados del sensor, o None si no están cargados."""
+        with self._lock:
+            entrada = self._stats.get(nombre_sensor)
+            return entrada.stats if entrada else None
+
+    def por_refrescar(self, nombre_sensor: str) -> Optional[int]:
+        """
+        Si hay que buscar filas nuevas del sensor, la marca de cambios que
+        hay que pasar a incorporar(); None si está al día.
+        """
+        with self._lock:
+            entrada = self._stats.get(nombre_sensor)
+            if entrada is None:
+                return None
+            caducado = self.ttl is not None and time.monotonic() - entrada.refrescado > self.ttl
+            if entrada.cambios == entrada.cambios_vistos and not caducado:
+                return None
+            return entrada.cambios
+
+    def cargar(self, nombre_sensor: str, stats):
+        with self._lock:
+            entrada = self._stats[nombre_sensor] = _Entrada(stats)
+            # Lo escrito mientras se calculaba la carga se mira en la siguiente lectura
+            entrada.cambios = 1
+
+    def marcar(self, nombre_sensor: str):
+        """Hay filas nuevas del sensor (escritas por este proceso)."""
+        with self._lock:
+            entrada = self._stats.get(nombre_sensor)
+            if entrada is not None:
+                entrada.cambios += 1
+
+    def incorporar(self, nombre_sensor: str, stats, filas: Iterable[Tuple[int, object, Dict]], cambios: int):
+        """
+        Añade las filas (id, valor, lectura) en orden de id. Las que ya
+        contaban (otro hilo las incorporó antes) se saltan.
+        """
+        with self._lock:
+            entrada = self._stats.get(nombre_sensor)
+            if entrada is None or entrada.stats is not stats:
+                # Se recargó mientras se leían las filas
+                return
+            for fila_id, valor, lectura in filas:
+                if fila_id <= stats.ultimo_id:
+                    continue
+                if isinstance(stats, RunningStats):
+                    stats.add(float(valor), lectura)
+                else:
+                    stats.add(str(valor), lectura)
+                stats.ultimo_id = fila_id
+            entrada.refrescado = time.monotonic()
+            entrada.cambios_vistos = max(entrada.cambios_vistos, cambios)
+
+    def invalidar(self, nombre_sensor: Optional[str] = None):
+        with self._lock:
+            if nombre_sensor is None:
+                self._stats.clear()
+            else:
+                self._stats.pop(nombre_sensor, None)
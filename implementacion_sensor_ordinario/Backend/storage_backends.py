@@ -0,0 +1,416 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class StorageBackend:
+    """
+    Motor de almacenamiento de SensorDataManager. conectar() devuelve una
+    conexión estilo mysql-connector (cursor(dictionary=True), commit,
+    rollback, close) o None si la BBDD no está disponible.
+    """
+
+    nombre = "base"
+
+    def conectar(self):
+        raise NotImplementedError
+
+
+class MySQLBackend(StorageBackend):
+    """Servidor MySQL a través de models.db.get_connection()."""
+
+    nombre = "mysql"
+
+    def conectar(self):
+        # Import diferido: en las tiendas con SQLite no hace falta el conector de MySQL
+        from models.db import get_connection
+        return get_connection()
+
+
+# ----------------------- SQLite -----------------------
+
+SCRIPTS_ESQUEMA = [
+    "tannhauser_original.sql",
+    "adaptacion_sensor_ordinario.sql",
+    "rollups_lecturas.sql",
+    "ultimas_lecturas.sql",
+    "sincronizacion_edge.sql",
+    "idempotencia_lecturas.sql",
+    "alertas_umbral.sql",
+]
+
+# Tablas cuyos INSERT de los scripts de migración se cargan siempre: sin
+# ellos un edge recién creado no tendría, por ejemplo, ningún umbral
+TABLAS_REFERENCIA = ("alert_thresholds",)
+
+_TIPOS = [
+    (r"^(bigint|int|tinyint|smallint|mediumint)", "INTEGER"),
+    (r"^(decimal|float|double)", "REAL"),
+    (r"^datetime", "DATETIME"),
+    (r"^timestamp", "TIMESTAMP"),
+    (r"^(longblob|blob)", "BLOB"),
+]
+
+sqlite3.register_adapter(datetime, lambda d: d.strftime("%Y-%m-%d %H:%M:%S.%f"))
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+for _tipo in ("DATETIME", "TIMESTAMP"):
+    sqlite3.register_converter(_tipo, lambda b: datetime.fromisoformat(b.decode()))
+
+
+def _ahora(*_):
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _date_format(valor, formato):
+    if valor is None:
+        return None
+    fecha = datetime.fromisoformat(str(valor))
+    return fecha.strftime(formato.replace("%i", "%M").replace("%s", "%S"))
+
+
+_traducciones: Dict[str, str] = {}
+_MAX_TRADUCCIONES = 1024
+
+
+def traducir_sql(sql: str) -> str:
+    """Traduce una consulta del backend (dialecto MySQL) a SQLite."""
+    traducida = _traducciones.get(sql)
+    if traducida is not None:
+        return traducida
+
+    s = sql.replace("%s", "?")
+    s = re.sub(r"NOW\(\d*\)", "NOW()", s)
+    s = s.replace("INSERT IGNORE", "INSERT OR IGNORE")
+    s = re.sub(r"\bFOR UPDATE\b", "", s)
+    s = re.sub(r"\bLEAST\(", "MIN(", s)
+    s = re.sub(r"\bGREATEST\(", "MAX(", s)
+    s = re.sub(r"\bIF\(", "IIF(", s)
+    # "UPDATE id = id" solo descarta la fila repetida; en SQLite un DO UPDATE
+    # contaría en rowcount como escrita
+    s = re.sub(r"ON DUPLICATE KEY UPDATE\s+(\w+)\s*=\s*\1\s*$", "ON CONFLICT DO NOTHING", s)
+    if "ON DUPLICATE KEY UPDATE" in s:
+        s = s.replace("ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET")
+        s = re.sub(r"VALUES\((\w+)\)", r"excluded.\1", s)
+
+    if len(_traducciones) >= _MAX_TRADUCCIONES:
+        _traducciones.clear()
+    _traducciones[sql] = s
+    return s
+
+
+def dividir_sentencias(sql: str) -> List[str]:
+    """Separa un script en sentencias respetando cadenas y comentarios."""
+    sentencias = []
+    actual = []
+    i = 0
+    comilla = None
+
+    while i < len(sql):
+        c = sql[i]
+        if comilla:
+            actual.append(c)
+            if c == "\\":
+                actual.append(sql[i + 1])
+                i += 2
+                continue
+            if c == comilla:
+                comilla = None
+        elif c in ("'", '"', "`"):
+            comilla = c
+            actual.append(c)
+        elif sql.startswith("--", i):
+            fin = sql.find("\n", i)
+            i = len(sql) if fin == -1 else fin
+            continue
+        elif sql.startswith("/*", i) and not sql.startswith("/*!", i):
+            fin = sql.find("*/", i)
+            i = len(sql) if fin == -1 else fin + 2
+            continue
+        elif c == ";":
+            sentencia = "".join(actual).strip()
+            if sentencia:
+                sentencias.append(sentencia)
+            actual = []
+        else:
+            actual.append(c)
+        i += 1
+
+    sentencia = "".join(actual).strip()
+    if sentencia:
+        sentencias.append(sentencia)
+    return sentencias
+
+
+def _traducir_columna(linea: str) -> Optional[str]:
+    linea = linea.strip().rstrip(",")
+    if not linea or re.match(r"(CONSTRAINT|FOREIGN KEY|KEY|INDEX)\b", linea, re.I):
+        return None
+    if re.match(r"(PRIMARY KEY|UNIQUE)\b", linea, re.I):
+        return linea
+
+    m = re.match(r"`?(\w+)`?\s+(\w+(?:\([^)]*\))?)(.*)", linea)
+    nombre, tipo, resto = m.groups()
+    destino = "TEXT"
+    for patron, tipo_sqlite in _TIPOS:
+        if re.match(patron, tipo, re.I):
+            destino = tipo_sqlite
+
+    resto = re.sub(r"COLLATE \w+|CHARACTER SET \w+|UNSIGNED|ON UPDATE CURRENT_TIMESTAMP(\(\d*\))?", "", resto, flags=re.I)
+    resto = re.sub(r"\bAFTER `?\w+`?", "", resto, flags=re.I)
+    resto = re.sub(r"CURRENT_TIMESTAMP\(\d*\)", "CURRENT_TIMESTAMP", resto)
+    return f"`{nombre}` {destino} {resto.strip()}".strip()
+
+
+def _partes(cuerpo: str) -> List[str]:
+    """Divide por comas de primer nivel (columnas de un CREATE, acciones de un ALTER)."""
+    partes, nivel, actual = [], 0, []
+    for c in cuerpo:
+        if c == "(":
+            nivel += 1
+        elif c == ")":
+            nivel -= 1
+        if c == "," and nivel == 0:
+            partes.append("".join(actual))
+            actual = []
+        else:
+            actual.append(c)
+    partes.append("".join(actual))
+    return partes
+
+
+def _traducir_datos(sentencia: str) -> str:
+    # Escapes de MySQL dentro de las cadenas del volcado
+    sentencia = sentencia.replace('\\"', '"').replace("\\'", "''").replace("\\n", "\n")
+    sentencia = re.sub(r"\b0x([0-9a-fA-F]+)\b", r"X'\1'", sentencia)
+    if re.search(r"ON DUPLICATE KEY UPDATE\s+(\w+)\s*=\s*\w+\.\1\s*$", sentencia, re.S):
+        # Carga inicial que no debe pisar nada: equivale a INSERT OR IGNORE
+        sentencia = re.sub(r"\s*ON DUPLICATE KEY UPDATE.*$", "", sentencia, flags=re.S)
+        sentencia = sentencia.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+    return traducir_sql(sentencia)
+
+
+class CursorSQLite:
+    def __init__(self, backend: "SQLiteBackend", conn: sqlite3.Connection, dictionary: bool = False):
+        self._backend = backend
+        self._conn = conn
+        self._cursor = conn.cursor()
+        self.dictionary = dictionary
+
+    def _fila(self, fila):
+        if fila is None or not self.dictionary:
+            return fila
+        return {d[0]: v for d, v in zip(self._cursor.description, fila)}
+
+    def execute(self, sql: str, params=()):
+        self._backend._contar()
+        if "FOR UPDATE" in sql and not self._conn.in_transaction:
+            # Equivalente a bloquear la fila: la transacción toma ya el
+            # cerrojo de escritura y nadie cambia el valor antes del UPDATE.
+            self._conn.execute("BEGIN IMMEDIATE")
+        self._cursor.execute(traducir_sql(sql), tuple(params or ()))
+
+    def executemany(self, sql: str, filas):
+        self._backend._contar()
+        self._cursor.executemany(traducir_sql(sql), [tuple(f) for f in filas])
+
+    def fetchone(self):
+        return self._fila(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._fila(f) for f in self._cursor.fetchall()]
+
+    def fetchmany(self, size: int = 1):
+        return [self._fila(f) for f in self._cursor.fetchmany(size)]
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexionSQLite:
+    """Conexión SQLite con la interfaz de mysql-connector que usa el backend."""
+
+    def __init__(self, backend: "SQLiteBackend", conn: sqlite3.Connection):
+        self._backend = backend
+        self._conn = conn
+
+    def cursor(self, dictionary: bool = False, buffered: Optional[bool] = None):
+        return CursorSQLite(self._backend, self._conn, dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+    def is_connected(self) -> bool:
+        return True
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    BBDD SQLite embebida (modo WAL) para las tiendas sin servidor MySQL.
+
+    El esquema se crea con los mismos scripts de BaseDeDatos, traducidos a
+    SQLite, y las consultas del backend se traducen al ejecutarse, así que
+    readings, current_state, state_history, devices y sensor_types se
+    comportan igual que en MySQL.
+    """
+
+    nombre = "sqlite"
+
+    def __init__(self, path: str, scripts_dir: Optional[str] = None, busy_timeout: float = 30.0):
+        self.path = path
+        self.scripts_dir = Path(scripts_dir) if scripts_dir else Path(__file__).resolve().parents[1] / "BaseDeDatos"
+        self.busy_timeout = busy_timeout
+        self._lock = threading.Lock()
+        self.consultas = 0
+
+    def _contar(self):
+        with self._lock:
+            self.consultas += 1
+
+    def reiniciar_contador(self):
+        with self._lock:
+            self.consultas = 0
+
+    def _conectar_sqlite(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            timeout=self.busy_timeout,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.create_function("NOW", -1, _ahora)
+        conn.create_function("DATABASE", 0, lambda: os.path.basename(self.path))
+        conn.create_function("DATE_FORMAT", 2, _date_format)
+        return conn
+
+    def conectar(self):
+        try:
+            return ConexionSQLite(self, self._conectar_sqlite())
+        except sqlite3.Error:
+            return None
+
+    def tiene_esquema(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        conn = self._conectar_sqlite()
+        try:
+            fila = conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'readings'"
+            ).fetchone()
+            return bool(fila[0])
+        finally:
+            conn.close()
+
+    def crear_esquema(self, scripts: List[str] = SCRIPTS_ESQUEMA, con_datos: bool = False, reemplazar: bool = False):
+        """
+        Crea las tablas ejecutando los scripts de BaseDeDatos traducidos.
+        Con con_datos=True también carga los INSERT de los scripts (volcado
+        de ejemplo incluido); si no, solo los datos de referencia que
+        añaden los scripts de migración (TABLAS_REFERENCIA).
+        """
+        if reemplazar and os.path.exists(self.path):
+            os.remove(self.path)
+
+        tablas: Dict[str, List[str]] = {}
+        claves_primarias: Dict[str, str] = {}
+        indices: List[str] = []
+        posteriores: List[str] = []
+
+        for numero, script in enumerate(scripts):
+            sql = (self.scripts_dir / script).read_text(encoding="utf-8")
+            for sentencia in dividir_sentencias(sql):
+                cabecera = sentencia.split("(", 1)[0].upper()
+                if re.match(r"(SET|START|COMMIT|USE|/\*!|DROP)\b", sentencia, re.I) or "VIEW" in cabecera:
+                    continue
+
+                m = re.match(r"CREATE TABLE (?:IF NOT EXISTS )?`?(\w+)`?\s*\((.*)\)[^)]*$", sentencia, re.S | re.I)
+                if m:
+                    nombre = m.group(1)
+                    if nombre.startswith("vw_"):
+                        continue
+                    columnas = [c for c in (_traducir_columna(p) for p in _partes(m.group(2))) if c]
+                    if numero == 0:
+                        # En el volcado las claves primarias llegan después, con ALTER TABLE
+                        tablas[nombre] = columnas
+                    else:
+                        posteriores.append(f"CREATE TABLE IF NOT EXISTS `{nombre}` (\n  " + ",\n  ".join(columnas) + "\n)")
+                    continue
+
+                m = re.match(r"ALTER TABLE `?(\w+)`?\s+(.*)$", sentencia, re.S | re.I)
+                if m:
+                    tabla = m.group(1)
+                    for accion in _partes(m.group(2)):
+                        accion = accion.strip()
+                        pk = re.match(r"ADD PRIMARY KEY \(`?(\w+)`?\)$", accion, re.I)
+                        clave = re.match(r"ADD (UNIQUE )?(?:KEY|INDEX) `?(\w+)`? \((.*)\)", accion, re.I)
+                        columna = re.match(r"ADD COLUMN (.*)$", accion, re.S | re.I)
+                        if pk:
+                            claves_primarias[tabla] = pk.group(1)
+                        elif clave:
+                            indice = (
+                                f"CREATE {clave.group(1) or ''}INDEX IF NOT EXISTS `{tabla}_{clave.group(2)}` "
+                                f"ON `{tabla}` ({clave.group(3)})"
+                            )
+                            # Los scripts posteriores pueden indexar columnas que añaden ellos mismos
+                            (indices if numero == 0 else posteriores).append(indice)
+                        elif columna:
+                            posteriores.append(f"ALTER TABLE `{tabla}` ADD COLUMN {_traducir_columna(columna.group(1))}")
+                    continue
+
+                m = re.match(r"INSERT INTO `?(\w+)`?", sentencia, re.I)
+                if m and (con_datos or (numero > 0 and m.group(1) in TABLAS_REFERENCIA)):
+                    posteriores.append(_traducir_datos(sentencia))
+
+        conn = self._conectar_sqlite()
+        try:
+            for nombre, columnas in tablas.items():
+                pk = claves_primarias.get(nombre)
+                columnas = [
+                    f"`{pk}` INTEGER PRIMARY KEY AUTOINCREMENT" if pk and c.startswith(f"`{pk}` ") else c
+                    for c in columnas
+                ]
+                conn.execute(f"CREATE TABLE IF NOT EXISTS `{nombre}` (\n  " + ",\n  ".join(columnas) + "\n)")
+            for indice in indices:
+                conn.execute(indice)
+            for sentencia in posteriores:
+                conn.execute(sentencia)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def crear_backend_desde_entorno() -> StorageBackend:
+    """
+    TANNHAUSER_DB_BACKEND=mysql (por defecto) o sqlite.
+    Con sqlite, TANNHAUSER_SQLITE_PATH indica el fichero y el esquema se
+    crea la primera vez.
+    """
+    if os.getenv("TANNHAUSER_DB_BACKEND", "mysql").lower() == "sqlite":
+        backend = SQLiteBackend(
+            os.getenv("TANNHAUSER_SQLITE_PATH", "tannhauser.db"),
+            scripts_dir=os.getenv("TANNHAUSER_SQL_DIR") or None,
+        )
+        if not backend.tiene_esquema():
+            backend.crear_esquema()
+        return backend
+
+    return MySQLBackend()
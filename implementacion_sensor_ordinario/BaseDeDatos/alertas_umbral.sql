@@ -0,0 +1,47 @@
+/*
+  ALERTAS POR UMBRAL
+  Proyecto Tannhäuser
+
+  Objetivo:
+  El backend evalúa alert_thresholds en cada escritura de current_state y
+  registra en events las alertas que se disparan, en la misma transacción
+  que la lectura. Para no generar una alerta por lectura cuando el valor
+  oscila alrededor del límite, cada umbral tiene una histéresis: la alerta
+  solo se da por resuelta cuando el valor vuelve por debajo (gt) o por
+  encima (lt) del umbral más/menos esa histéresis.
+
+  El state_code de un umbral puede ser el state_code de current_state
+  (p. ej. lectura_actual, consumo_24h) o el código del tipo de sensor
+  (p. ej. temperatura, humedad).
+*/
+
+USE tannhauser;
+
+/* 1) Histéresis de cada umbral (0 = se resuelve en cuanto deja de superarse). */
+ALTER TABLE alert_thresholds
+  ADD COLUMN hysteresis_value DECIMAL(10,2) NOT NULL DEFAULT 0.00 AFTER threshold_value;
+
+/* 2) El backend busca las alertas abiertas al arrancar. */
+ALTER TABLE events
+  ADD KEY idx_events_type_resolved (event_type, is_resolved);
+
+/* 3) Umbrales equivalentes a los límites que usaba el panel de empleado. */
+INSERT INTO alert_thresholds (state_code, operator_type, threshold_value, hysteresis_value, severity, title, description_template, is_active)
+SELECT 'temperatura', 'gt', 30.00, 1.00, 'critical', 'Temperatura muy alta',
+       '{sensor}: {valor} {unidad} supera el máximo de {umbral} {unidad}', 1
+WHERE NOT EXISTS (SELECT 1 FROM alert_thresholds WHERE state_code = 'temperatura' AND operator_type = 'gt' AND threshold_value = 30.00);
+
+INSERT INTO alert_thresholds (state_code, operator_type, threshold_value, hysteresis_value, severity, title, description_template, is_active)
+SELECT 'temperatura', 'lt', 0.00, 1.00, 'critical', 'Temperatura muy baja',
+       '{sensor}: {valor} {unidad} está por debajo del mínimo de {umbral} {unidad}', 1
+WHERE NOT EXISTS (SELECT 1 FROM alert_thresholds WHERE state_code = 'temperatura' AND operator_type = 'lt' AND threshold_value = 0.00);
+
+INSERT INTO alert_thresholds (state_code, operator_type, threshold_value, hysteresis_value, severity, title, description_template, is_active)
+SELECT 'humedad', 'gt', 80.00, 2.00, 'critical', 'Humedad muy alta',
+       '{sensor}: {valor} {unidad} supera el máximo de {umbral} {unidad}', 1
+WHERE NOT EXISTS (SELECT 1 FROM alert_thresholds WHERE state_code = 'humedad' AND operator_type = 'gt' AND threshold_value = 80.00);
+
+INSERT INTO alert_thresholds (state_code, operator_type, threshold_value, hysteresis_value, severity, title, description_template, is_active)
+SELECT 'humedad', 'lt', 20.00, 2.00, 'critical', 'Humedad muy baja',
+       '{sensor}: {valor} {unidad} está por debajo del mínimo de {umbral} {unidad}', 1
+WHERE NOT EXISTS (SELECT 1 FROM alert_thresholds WHERE state_code = 'humedad' AND operator_type = 'lt' AND threshold_value = 20.00);
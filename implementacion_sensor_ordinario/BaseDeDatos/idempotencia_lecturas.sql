@@ -0,0 +1,19 @@
+/*
+  LECTURAS IDEMPOTENTES
+  Proyecto Tannhäuser
+
+  Objetivo:
+  La ESP32 reintenta los POST que fallan, y si la primera petición sí llegó
+  a la BBDD la lectura se guardaba dos veces. Ahora cada lectura puede traer
+  una clave de idempotencia (arranque de la placa + número de secuencia). El
+  backend descarta en memoria las claves ya vistas y, como respaldo (tras un
+  reinicio del servidor, por ejemplo), el índice único impide la fila repetida.
+*/
+
+USE tannhauser;
+
+/* 1) Clave de idempotencia de la lectura. Las lecturas sin clave (NULL) no
+      se ven afectadas por el índice único. */
+ALTER TABLE readings
+  ADD COLUMN idempotency_key VARCHAR(64) NULL AFTER source,
+  ADD UNIQUE KEY uq_readings_device_idempotency (device_id, idempotency_key);
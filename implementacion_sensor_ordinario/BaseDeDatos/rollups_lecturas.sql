@@ -0,0 +1,73 @@
+/*
+  AGREGADOS DE LECTURAS (ROLLUPS)
+  Proyecto Tannhäuser
+
+  Objetivo:
+  Guardar por dispositivo el resumen de las lecturas por minuto, hora y día
+  (número de lecturas, suma, mínimo, máximo y consumo) para que las gráficas
+  de periodos largos lean cientos de filas en lugar de millones.
+  El backend actualiza esta tabla en la misma transacción que inserta en readings.
+*/
+
+USE tannhauser;
+
+/* 1) Tabla de agregados. La media de cada bucket es value_sum / sample_count. */
+CREATE TABLE IF NOT EXISTS readings_rollup (
+  device_id bigint UNSIGNED NOT NULL,
+  resolution ENUM('1m','1h','1d') NOT NULL,
+  bucket_start DATETIME NOT NULL,
+  sample_count INT UNSIGNED NOT NULL,
+  value_sum DOUBLE NOT NULL,
+  value_min DECIMAL(10,2) NOT NULL,
+  value_max DECIMAL(10,2) NOT NULL,
+  consumption_sum DOUBLE NOT NULL DEFAULT 0,
+  PRIMARY KEY (device_id, resolution, bucket_start),
+  CONSTRAINT fk_readings_rollup_device FOREIGN KEY (device_id) REFERENCES devices (id) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+/* 2) Carga inicial con las lecturas que ya existen.
+      Solo debe ejecutarse una vez, con la tabla recién creada. */
+INSERT INTO readings_rollup (
+  device_id, resolution, bucket_start, sample_count,
+  value_sum, value_min, value_max, consumption_sum
+)
+SELECT device_id,
+       '1m',
+       DATE_FORMAT(recorded_at, '%Y-%m-%d %H:%i:00'),
+       COUNT(*),
+       SUM(reading_value),
+       MIN(reading_value),
+       MAX(reading_value),
+       COALESCE(SUM(consumption_w), 0)
+FROM readings
+GROUP BY device_id, DATE_FORMAT(recorded_at, '%Y-%m-%d %H:%i:00');
+
+INSERT INTO readings_rollup (
+  device_id, resolution, bucket_start, sample_count,
+  value_sum, value_min, value_max, consumption_sum
+)
+SELECT device_id,
+       '1h',
+       DATE_FORMAT(recorded_at, '%Y-%m-%d %H:00:00'),
+       COUNT(*),
+       SUM(reading_value),
+       MIN(reading_value),
+       MAX(reading_value),
+       COALESCE(SUM(consumption_w), 0)
+FROM readings
+GROUP BY device_id, DATE_FORMAT(recorded_at, '%Y-%m-%d %H:00:00');
+
+INSERT INTO readings_rollup (
+  device_id, resolution, bucket_start, sample_count,
+  value_sum, value_min, value_max, consumption_sum
+)
+SELECT device_id,
+       '1d',
+       DATE(recorded_at),
+       COUNT(*),
+       SUM(reading_value),
+       MIN(reading_value),
+       MAX(reading_value),
+       COALESCE(SUM(consumption_w), 0)
+FROM readings
+GROUP BY device_id, DATE(recorded_at);
@@ -0,0 +1,21 @@
+/*
+  SINCRONIZACIÓN DE TIENDAS (EDGE)
+  Proyecto Tannhäuser
+
+  Objetivo:
+  Cada tienda guarda sus lecturas en un registro local y las envía en lotes
+  al servidor central (POST /ingest/sync). Esta tabla guarda, por tienda, la
+  última secuencia aplicada: el backend la bloquea y actualiza en la misma
+  transacción que escribe el lote, así que reenviar un lote tras un corte de
+  red no duplica lecturas.
+*/
+
+USE tannhauser;
+
+/* 1) Última secuencia aplicada de cada tienda. */
+CREATE TABLE IF NOT EXISTS edge_sync_state (
+  edge_id VARCHAR(64) NOT NULL,
+  last_seq bigint UNSIGNED NOT NULL DEFAULT 0,
+  updated_at DATETIME(6) NOT NULL,
+  PRIMARY KEY (edge_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
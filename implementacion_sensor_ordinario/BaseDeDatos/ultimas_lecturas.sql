@@ -0,0 +1,56 @@
+/*
+  ÚLTIMA LECTURA POR DISPOSITIVO
+  Proyecto Tannhäuser
+
+  Objetivo:
+  La vista vw_ultimas_lecturas calculaba la última lectura con un GROUP BY sobre
+  toda la tabla readings en cada consulta. Ahora el backend mantiene la tabla
+  readings_latest (una fila por dispositivo) en la misma transacción que inserta
+  en readings, y la vista solo tiene que leerla.
+*/
+
+USE tannhauser;
+
+/* 1) Tabla con la última lectura de cada dispositivo. */
+CREATE TABLE IF NOT EXISTS readings_latest (
+  device_id bigint UNSIGNED NOT NULL,
+  sensor_type_id bigint UNSIGNED NOT NULL,
+  reading_value DECIMAL(10,2) NOT NULL,
+  text_value VARCHAR(100) NULL,
+  reading_unit VARCHAR(20) NULL,
+  consumption_w DECIMAL(10,4) NULL,
+  recorded_at DATETIME(6) NOT NULL,
+  source ENUM('simulado','esp32','manual','importado') NOT NULL DEFAULT 'simulado',
+  PRIMARY KEY (device_id),
+  CONSTRAINT fk_readings_latest_device FOREIGN KEY (device_id) REFERENCES devices (id) ON DELETE CASCADE ON UPDATE CASCADE,
+  CONSTRAINT fk_readings_latest_sensor_type FOREIGN KEY (sensor_type_id) REFERENCES sensor_types (id) ON DELETE RESTRICT ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+/* 2) Carga inicial con la última lectura que ya existe de cada dispositivo. */
+INSERT INTO readings_latest (
+  device_id, sensor_type_id, reading_value, text_value, reading_unit,
+  consumption_w, recorded_at, source
+)
+SELECT r.device_id, r.sensor_type_id, r.reading_value, r.text_value, r.reading_unit,
+       r.consumption_w, r.recorded_at, r.source
+FROM readings r
+JOIN (
+  SELECT device_id, MAX(recorded_at) AS max_recorded_at
+  FROM readings
+  GROUP BY device_id
+) last_r ON last_r.device_id = r.device_id AND last_r.max_recorded_at = r.recorded_at
+ON DUPLICATE KEY UPDATE device_id = readings_latest.device_id;
+
+/* 3) La vista mantiene las mismas columnas pero lee de readings_latest. */
+CREATE OR REPLACE VIEW vw_ultimas_lecturas AS
+SELECT d.device_code AS device_code,
+       d.device_name AS device_name,
+       st.code AS sensor_code,
+       st.name AS sensor_name,
+       rl.reading_value AS reading_value,
+       rl.reading_unit AS reading_unit,
+       rl.consumption_w AS consumption_w,
+       rl.recorded_at AS recorded_at
+FROM readings_latest rl
+JOIN devices d ON d.id = rl.device_id
+JOIN sensor_types st ON st.id = rl.sensor_type_id;
@@ -0,0 +1,277 @@
+"""
+Banco de pruebas de la ingesta de lecturas.
+
+Reproduce tráfico sintético de la ESP32 contra SensorDataManager (y contra
+los endpoints de api.py si FastAPI está instalado) sobre una BBDD SQLite
+local (SQLiteBackend, creada con los scripts de BaseDeDatos y el volcado de
+ejemplo), y muestra latencia p50/p99, lecturas por segundo y consultas por
+lectura de cada escenario.
+
+Uso (desde esta carpeta):
+    python bench_ingest.py
+    python bench_ingest.py --escenario lote --lecturas 20000 --tamano-lote 50
+    python bench_ingest.py --escenario lectura --ritmo 200 --hilos 4
+"""
+
+import argparse
+import importlib.util
+import os
+import random
+import tempfile
+import sys
+import threading
+import time
+import types
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BACKEND = Path(__file__).resolve().parents[1] / "Backend"
+
+ESCENARIOS = ["lectura", "lote", "ordinaria", "api-lectura", "api-lote"]
+
+SENSORES_NUMERICOS = {
+    "sensor_temperatura": (22.0, 3.0),
+    "sensor_humedad": (45.0, 8.0),
+    "sensor_luz": (600.0, 150.0),
+    "sensor_nevera": (4.0, 1.0),
+}
+
+
+def preparar_modelos(db_path: str):
+    """
+    Expone Backend/ como el paquete models (igual que en el despliegue)
+    configurado con el motor SQLite sobre db_path.
+    """
+    os.environ["TANNHAUSER_DB_BACKEND"] = "sqlite"
+    os.environ["TANNHAUSER_SQLITE_PATH"] = db_path
+
+    models = types.ModuleType("models")
+    models.__path__ = [str(BACKEND)]
+    sys.modules["models"] = models
+
+
+class TraficoESP32:
+    """Genera lecturas como las que envía la placa: sensores numéricos y la puerta."""
+
+    def __init__(self, semilla: int = 1):
+        self.random = random.Random(semilla)
+        self.puerta = "cerrada"
+
+    def lectura(self) -> Dict:
+        if self.random.random() < 0.05:
+            # La puerta cambia de estado de vez en cuando
+            self.puerta = "abierta" if self.puerta == "cerrada" else "cerrada"
+            return {"sensor": "sensor_puerta", "valor": self.puerta}
+
+        nombre = self.random.choice(list(SENSORES_NUMERICOS))
+        media, desviacion = SENSORES_NUMERICOS[nombre]
+        return {"sensor": nombre, "valor": round(self.random.gauss(media, desviacion), 2)}
+
+    def lote(self, tamano: int) -> List[Dict]:
+        return [self.lectura() for _ in range(tamano)]
+
+    def ordinaria(self) -> Dict:
+        return {
+            "valor_numerico": self.random.randint(0, 100),
+            "valor_alfanumerico": self.random.choice(["ESTADO_OK", "AVISO", "ERROR_SENSOR"]),
+        }
+
+
+def percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def ejecutar(
+    backend,
+    operacion: Callable[[TraficoESP32], int],
+    operaciones: int,
+    hilos: int,
+    ritmo: float,
+    lecturas_por_operacion: int,
+) -> Dict:
+    """
+    Lanza `operaciones` llamadas repartidas entre `hilos`. Con ritmo > 0 cada
+    hilo espacia sus llamadas para que el total sea `ritmo` lecturas/s.
+    """
+    latencias: List[float] = []
+    errores = [0]
+    lock = threading.Lock()
+
+    def trabajador(indice: int, cantidad: int):
+        trafico = TraficoESP32(semilla=indice + 1)
+        intervalo = hilos * lecturas_por_operacion / ritmo if ritmo > 0 else 0
+        siguiente = time.perf_counter()
+        propias = []
+        fallidas = 0
+
+        for _ in range(cantidad):
+            if intervalo:
+                espera = siguiente - time.perf_counter()
+                if espera > 0:
+                    time.sleep(espera)
+                siguiente += intervalo
+
+            inicio = time.perf_counter()
+            try:
+                fallidas += operacion(trafico)
+            except Exception:
+                fallidas += lecturas_por_operacion
+            propias.append(time.perf_counter() - inicio)
+
+        with lock:
+            latencias.extend(propias)
+            errores[0] += fallidas
+
+    reparto = [operaciones // hilos + (1 if i < operaciones % hilos else 0) for i in range(hilos)]
+    trabajadores = [threading.Thread(target=trabajador, args=(i, n)) for i, n in enumerate(reparto)]
+
+    backend.reiniciar_contador()
+    inicio = time.perf_counter()
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    duracion = time.perf_counter() - inicio
+
+    lecturas = operaciones * lecturas_por_operacion
+    return {
+        "operaciones": operaciones,
+        "lecturas": lecturas,
+        "errores": errores[0],
+        "duracion_s": duracion,
+        "lecturas_s": lecturas / duracion if duracion else 0.0,
+        "p50_ms": percentil(latencias, 50) * 1000,
+        "p99_ms": percentil(latencias, 99) * 1000,
+        "max_ms": max(latencias) * 1000 if latencias else 0.0,
+        "consultas_lectura": backend.consultas / lecturas if lecturas else 0.0,
+    }
+
+
+def cargar_cliente_api():
+    """TestClient sobre api.py, o None si FastAPI (y httpx) no están instalados."""
+    try:
+        from fastapi.testclient import TestClient
+    except ImportError:
+        return None
+
+    spec = importlib.util.spec_from_file_location("tannhauser_api", BACKEND / "api.py")
+    api = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(api)
+    return TestClient(api.app)
+
+
+def crear_operacion(escenario: str, manager, cliente, tamano_lote: int) -> Optional[Callable[[TraficoESP32], int]]:
+    """Devuelve la operación del escenario; cada llamada devuelve cuántas lecturas fallaron."""
+    if escenario == "lectura":
+        def operacion(trafico):
+            lectura = trafico.lectura()
+            return 0 if manager.guardar_lectura_sensor(lectura["sensor"], lectura["valor"], source="esp32") else 1
+        return operacion
+
+    if escenario == "lote":
+        def operacion(trafico):
+            resultados = manager.guardar_lecturas_lote(trafico.lote(tamano_lote), source="esp32")
+            return sum(1 for r in resultados if r["estado"] != "ok")
+        return operacion
+
+    if escenario == "ordinaria":
+        def operacion(trafico):
+            datos = trafico.ordinaria()
+            return 0 if manager.guardar_lectura_sensor_ordinario(source="esp32", **datos) else 1
+        return operacion
+
+    if cliente is None:
+        return None
+
+    if escenario == "api-lectura":
+        def operacion(trafico):
+            lectura = trafico.lectura()
+            respuesta = cliente.post("/ingest/readings", json={
+                "sensor_name": lectura["sensor"], "value": lectura["valor"], "source": "esp32"
+            })
+            return 0 if respuesta.status_code < 300 and respuesta.json()["status"] != "error" else 1
+        return operacion
+
+    if escenario == "api-lote":
+        def operacion(trafico):
+            respuesta = cliente.post("/ingest/readings/batch", json={
+                "source": "esp32",
+                "readings": [
+                    {"sensor_name": l["sensor"], "value": l["valor"]} for l in trafico.lote(tamano_lote)
+                ],
+            })
+            return 0 if respuesta.status_code < 300 else tamano_lote
+        return operacion
+
+    return None
+
+
+def imprimir(escenario: str, resultado: Dict):
+    print(
+        f"{escenario:<12} "
+        f"{resultado['lecturas']:>8} "
+        f"{resultado['errores']:>7} "
+        f"{resultado['lecturas_s']:>10.1f} "
+        f"{resultado['p50_ms']:>8.3f} "
+        f"{resultado['p99_ms']:>8.3f} "
+        f"{resultado['max_ms']:>8.3f} "
+        f"{resultado['consultas_lectura']:>9.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banco de pruebas de la ingesta de lecturas")
+    parser.add_argument("--escenario", choices=ESCENARIOS + ["todos"], default="todos")
+    parser.add_argument("--lecturas", type=int, default=2000, help="lecturas por escenario")
+    parser.add_argument("--tamano-lote", type=int, default=20)
+    parser.add_argument("--hilos", type=int, default=1)
+    parser.add_argument("--ritmo", type=float, default=0, help="lecturas/s en total (0 = sin límite)")
+    parser.add_argument(
+        "--db",
+        default=os.path.join(tempfile.gettempdir(), "tannhauser_bench.db"),
+        help="fichero SQLite de pruebas",
+    )
+    parser.add_argument("--sin-reconstruir", action="store_true", help="reutiliza la BBDD existente")
+    args = parser.parse_args()
+
+    if not args.sin_reconstruir and os.path.exists(args.db):
+        os.remove(args.db)
+
+    preparar_modelos(args.db)
+    from models.storage_backends import SQLiteBackend
+
+    # El esquema (con el volcado de ejemplo) se crea antes de importar db_pool,
+    # que si no lo crearía vacío al configurar su motor por defecto
+    if not SQLiteBackend(args.db).tiene_esquema():
+        SQLiteBackend(args.db).crear_esquema(con_datos=True)
+
+    from models.db_pool import ConnectionPool, backend
+    from models.sensor_data_manager import SensorDataManager
+
+    manager = SensorDataManager(pool=ConnectionPool(factory=backend.conectar, max_size=max(2, args.hilos)))
+    escenarios = ESCENARIOS if args.escenario == "todos" else [args.escenario]
+    cliente = cargar_cliente_api() if any(e.startswith("api-") for e in escenarios) else None
+
+    # Calentamiento: crea dispositivos y carga las cachés fuera de la medida
+    for nombre in list(SENSORES_NUMERICOS) + ["sensor_puerta"]:
+        manager._ensure_sensor_resources(nombre)
+
+    print(f"BBDD: {args.db}  hilos: {args.hilos}  ritmo: {args.ritmo or 'sin límite'}")
+    print(f"{'escenario':<12} {'lecturas':>8} {'errores':>7} {'lect/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'cons/lect':>9}")
+
+    for escenario in escenarios:
+        operacion = crear_operacion(escenario, manager, cliente, args.tamano_lote)
+        if operacion is None:
+            print(f"{escenario:<12} omitido: FastAPI no está instalado")
+            continue
+
+        por_operacion = args.tamano_lote if escenario in ("lote", "api-lote") else 1
+        operaciones = max(1, args.lecturas // por_operacion)
+        imprimir(escenario, ejecutar(backend, operacion, operaciones, args.hilos, args.ritmo, por_operacion))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ from abc import ABC, abstractmethod
 import json
 import os
 
+from stock_store import StockStore
+
 
 @dataclass
 class Usuario(ABC):
@@ -35,10 +37,9 @@ class Usuario(ABC):
         If the file does not exist, returns an empty list.
         """
         try:
-            if not os.path.exists(db_path):
-                return []
-            with open(db_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            store = StockStore.abrir(db_path)
+            store.refrescar()
+            return store.listar()
         except Exception:
             return []
 
@@ -0,0 +1,191 @@
+import csv
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Tuple
+
+from exceptions import ImportacionError
+from stock_store import StockStore
+
+
+@dataclass
+class ErrorLinea:
+    """Error de validación de una línea del fichero importado."""
+    linea: int
+    mensaje: str
+
+    def __str__(self):
+        return f"Línea {self.linea}: {self.mensaje}"
+
+
+@dataclass
+class ResultadoImportacion:
+    """Resumen de una importación o ajuste masivo."""
+    lineas: int = 0
+    aplicados: int = 0
+    errores: List[ErrorLinea] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errores
+
+    def resumen(self, max_errores: int = 20) -> str:
+        if self.ok:
+            return f"{self.aplicados} productos actualizados ({self.lineas} líneas)"
+        texto = [f"No se aplicó ningún cambio: {len(self.errores)} de {self.lineas} líneas con errores"]
+        texto.extend(str(error) for error in self.errores[:max_errores])
+        if len(self.errores) > max_errores:
+            texto.append(f"... y {len(self.errores) - max_errores} más")
+        return "\n".join(texto)
+
+
+# ------------------- LECTURA DE FICHEROS -------------------
+
+def leer_registros(ruta: str) -> Iterator[Tuple[int, Any]]:
+    """
+    Recorre el fichero línea a línea sin cargarlo entero y devuelve
+    (número de línea, registro). Admite CSV con cabecera (.csv) y JSON por
+    líneas (.jsonl, .ndjson o cualquier otra extensión). Una línea JSON
+    ilegible o una fila CSV con más columnas que la cabecera se devuelve
+    como ErrorLinea.
+    """
+    if os.path.splitext(ruta)[1].lower() == ".csv":
+        with open(ruta, "r", encoding="utf-8-sig", newline="") as f:
+            lector = csv.DictReader(f, skipinitialspace=True)
+            for fila in lector:
+                # DictReader guarda los campos sobrantes en una lista bajo None
+                if None in fila:
+                    yield lector.line_num, ErrorLinea(lector.line_num, "Columnas de más")
+                    continue
+                if not any((valor or "").strip() for valor in fila.values()):
+                    continue
+                yield lector.line_num, fila
+        return
+
+    with open(ruta, "r", encoding="utf-8-sig") as f:
+        for numero, linea in enumerate(f, start=1):
+            if not linea.strip():
+                continue
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                yield numero, ErrorLinea(numero, "JSON no válido")
+                continue
+            if not isinstance(registro, dict):
+                yield numero, ErrorLinea(numero, "Se esperaba un objeto JSON")
+                continue
+            yield numero, registro
+
+
+def _entero(registro: Dict, campo: str) -> int:
+    valor = registro.get(campo)
+    if valor is None or (isinstance(valor, str) and not valor.strip()):
+        raise ValueError(f"Falta el campo '{campo}'")
+    if isinstance(valor, bool) or (isinstance(valor, float) and not valor.is_integer()):
+        raise ValueError(f"'{campo}' debe ser un número entero")
+    try:
+        return int(valor.strip()) if isinstance(valor, str) else int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{campo}' debe ser un número entero: {valor!r}")
+
+
+# ------------------- IMPORTACIÓN DE PRODUCTOS -------------------
+
+def importar_productos(store: StockStore, ruta: str) -> ResultadoImportacion:
+    """
+    Alta o modificación masiva de productos (id, nombre, cantidad). Se valida
+    todo el fichero y, solo si no hay errores, se escribe en una única
+    operación atómica. Los productos existentes conservan sus otros campos.
+    """
+    resultado = ResultadoImportacion()
+    productos: Dict[int, Dict] = {}
+    lineas_por_id: Dict[int, int] = {}
+
+    for numero, registro in leer_registros(ruta):
+        resultado.lineas += 1
+        if isinstance(registro, ErrorLinea):
+            resultado.errores.append(registro)
+            continue
+        try:
+            id_producto = _entero(registro, "id")
+            nombre = str(registro.get("nombre") or "").strip()
+            if not nombre:
+                raise ValueError("Falta el campo 'nombre'")
+            cantidad = _entero(registro, "cantidad")
+            if cantidad < 0:
+                raise ValueError("La cantidad no puede ser negativa")
+            if id_producto in productos:
+                raise ValueError(f"ID {id_producto} repetido (ya aparece en la línea {lineas_por_id[id_producto]})")
+        except ValueError as e:
+            resultado.errores.append(ErrorLinea(numero, str(e)))
+            continue
+
+        productos[id_producto] = {'id': id_producto, 'nombre': nombre, 'cantidad': cantidad}
+        lineas_por_id[id_producto] = numero
+
+    if resultado.errores or not productos:
+        return resultado
+
+    def construir(actuales):
+        return [
+            {"op": "put", "producto": {**actuales.get(id_producto, {}), **producto}}
+            for id_producto, producto in productos.items()
+        ]
+
+    resultado.aplicados = store.aplicar_lote(construir)
+    return resultado
+
+
+# ------------------- AJUSTE MASIVO DE CANTIDADES -------------------
+
+def ajustar_cantidades(store: StockStore, ruta: str) -> ResultadoImportacion:
+    """
+    Suma o resta unidades a productos existentes (id, delta), p. ej. "+24"
+    al 75 y "-3" al 2 al recibir un camión. Varias líneas del mismo id se
+    acumulan. Si algún id no existe o alguna cantidad quedaría negativa no
+    se aplica nada; si todo es válido se escribe en una única operación.
+    """
+    resultado = ResultadoImportacion()
+    ajustes: Dict[int, List[Tuple[int, int]]] = {}
+
+    for numero, registro in leer_registros(ruta):
+        resultado.lineas += 1
+        if isinstance(registro, ErrorLinea):
+            resultado.errores.append(registro)
+            continue
+        try:
+            id_producto = _entero(registro, "id")
+            delta = _entero(registro, "delta")
+        except ValueError as e:
+            resultado.errores.append(ErrorLinea(numero, str(e)))
+            continue
+        ajustes.setdefault(id_producto, []).append((numero, delta))
+
+    if resultado.errores or not ajustes:
+        return resultado
+
+    def construir(actuales):
+        errores = []
+        cambios = []
+        for id_producto, lineas in ajustes.items():
+            producto = actuales.get(id_producto)
+            if producto is None:
+                errores.extend(ErrorLinea(numero, f"No existe el producto {id_producto}") for numero, _ in lineas)
+                continue
+            cantidad = producto['cantidad'] + sum(delta for _, delta in lineas)
+            if cantidad < 0:
+                errores.append(ErrorLinea(
+                    lineas[-1][0], f"La cantidad del producto {id_producto} quedaría en {cantidad}"
+                ))
+                continue
+            cambios.append({"op": "put", "producto": {**producto, 'cantidad': cantidad}})
+
+        if errores:
+            raise ImportacionError(sorted(errores, key=lambda error: error.linea))
+        return cambios
+
+    try:
+        resultado.aplicados = store.aplicar_lote(construir)
+    except ImportacionError as e:
+        resultado.errores = e.errores
+    return resultado
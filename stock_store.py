@@ -0,0 +1,357 @@
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from exceptions import ProductoExisteError, ProductoNoEncontradoError
+from file_utils import FileLock, escritura_atomica
+
+STOCK_PATH = 'database/stock.json'
+
+logger = logging.getLogger(__name__)
+
+
+class StockStore:
+    """
+    Stock del almacén indexado por id.
+
+    Los productos viven en memoria en un dict id -> producto (get/put/delete
+    en O(1)). En disco hay dos ficheros:
+
+    - el snapshot, el stock.json de siempre (lista JSON de productos);
+    - un registro de cambios de solo anexado (stock.log.jsonl), con una línea
+      {"op": "put", "producto": {...}} o {"op": "delete", "id": ...} por
+      cada alta, modificación o baja, o {"op": "lote", "cambios": [...]}
+      para una operación masiva, que se aplica entera o no se aplica.
+
+    Editar un producto solo anexa su línea; cuando el registro acumula
+    max_cambios líneas se compacta: se reescribe el snapshot y se vacía el
+    registro. Al abrir se lee el snapshot y se reaplica el registro.
+
+    Varios procesos (cajas, paneles de trastienda) pueden compartir los
+    ficheros: las lecturas toman el bloqueo compartido de `<ruta>.lock` y
+    las escrituras el exclusivo, y el snapshot se sustituye con os.replace.
+    Si se corta la compactación entre el snapshot y el borrado del
+    registro, reaplicar el registro deja el mismo estado.
+
+    Con StockStore.abrir() todas las ventanas del proceso comparten la misma
+    instancia: el JSON se lee una vez, refrescar() solo mira mtime/tamaño
+    mientras no cambie nada, y los suscriptores reciben aviso de cada
+    cambio, propio o de otro proceso.
+    """
+
+    _abiertos: Dict[str, "StockStore"] = {}
+    _abiertos_lock = threading.Lock()
+
+    def __init__(self, ruta: str = STOCK_PATH, max_cambios: int = 1000):
+        self.ruta = ruta
+        self.ruta_log = os.path.splitext(ruta)[0] + ".log.jsonl"
+        self.max_cambios = max_cambios
+
+        self._lock = threading.RLock()
+        self._bloqueo = FileLock(f"{ruta}.lock")
+        self._productos: Dict[Any, Dict] = {}
+        self._firma_snapshot = None
+        self._offset_log = 0
+        self._cambios_log = 0
+        # Aumenta con cada cambio aplicado, propio o leído del registro
+        self.version = 0
+        self._instantanea: Tuple[Dict, ...] = ()
+        self._version_instantanea = None
+
+        # Cada suscriptor es una función sin argumentos que devuelve su callback, o None si ya no existe
+        self._suscriptores: List[Callable[[], Optional[Callable[[int], None]]]] = []
+        self._intervalo_vigilancia = 2.0
+        self._vigilante: Optional[threading.Thread] = None
+
+        with self._bloqueo.compartido():
+            self._recargar()
+
+    @classmethod
+    def abrir(cls, ruta: str = STOCK_PATH) -> "StockStore":
+        """Instancia compartida por todas las ventanas del proceso para esa ruta."""
+        clave = os.path.abspath(ruta)
+        with cls._abiertos_lock:
+            store = cls._abiertos.get(clave)
+            if store is None:
+                store = cls._abiertos[clave] = cls(ruta)
+            return store
+
+    # ----------------------- carga -----------------------
+
+    @staticmethod
+    def _firma(ruta) -> Optional[tuple]:
+        try:
+            info = os.stat(ruta)
+        except OSError:
+            return None
+        return (info.st_mtime_ns, info.st_size, info.st_ino)
+
+    def _recargar(self):
+        self._firma_snapshot = self._firma(self.ruta)
+        productos = {}
+        if self._firma_snapshot is not None:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                for producto in json.load(f):
+                    productos[producto['id']] = producto
+
+        self._productos = productos
+        self._offset_log = 0
+        self._cambios_log = 0
+        self._leer_log()
+        self.version += 1
+
+    def _leer_log(self) -> int:
+        """Aplica las líneas del registro a partir del último offset leído."""
+        if not os.path.exists(self.ruta_log):
+            return 0
+
+        aplicados = 0
+        with open(self.ruta_log, 'rb') as f:
+            f.seek(self._offset_log)
+            for linea in f:
+                if not linea.endswith(b"\n"):
+                    # Línea a medio escribir: se leerá entera la próxima vez
+                    break
+                try:
+                    cambio = json.loads(linea)
+                except ValueError:
+                    self._offset_log += len(linea)
+                    continue
+                self._cambios_log += self._aplicar(cambio)
+                self._offset_log += len(linea)
+                aplicados += 1
+
+        self.version += aplicados
+        return aplicados
+
+    def _aplicar(self, cambio: Dict) -> int:
+        """Aplica el cambio y devuelve cuántos productos toca."""
+        if cambio["op"] == "put":
+            producto = cambio["producto"]
+            self._productos[producto['id']] = producto
+            return 1
+        if cambio["op"] == "delete":
+            self._productos.pop(cambio["id"], None)
+            return 1
+        if cambio["op"] == "lote":
+            return sum(self._aplicar(c) for c in cambio["cambios"])
+        return 0
+
+    def refrescar(self) -> bool:
+        """
+        Incorpora lo que hayan escrito otros procesos. Devuelve True si hubo
+        cambios. Solo lee las líneas nuevas del registro salvo que el
+        snapshot se haya compactado, en cuyo caso se recarga todo.
+        """
+        if self._sin_cambios_en_disco():
+            return False
+
+        with self._lock, self._bloqueo.compartido():
+            version = self.version
+            self._sincronizar()
+            cambiada = self.version != version
+        if cambiada:
+            self._notificar()
+        return cambiada
+
+    def _sin_cambios_en_disco(self) -> bool:
+        # Dos stat sin bloqueos: el caso normal cuando nadie ha escrito
+        if self._firma(self.ruta) != self._firma_snapshot:
+            return False
+        firma_log = self._firma(self.ruta_log)
+        tamano_log = firma_log[1] if firma_log else 0
+        return tamano_log == self._offset_log
+
+    def _sincronizar(self):
+        firma_log = self._firma(self.ruta_log)
+        if (self._firma(self.ruta) != self._firma_snapshot
+                or (firma_log is None and self._offset_log)
+                or (firma_log is not None and firma_log[1] < self._offset_log)):
+            self._recargar()
+        else:
+            self._leer_log()
+
+    # ----------------------- consultas -----------------------
+
+    def obtener(self, id_producto) -> Optional[Dict]:
+        with self._lock:
+            producto = self._productos.get(id_producto)
+            return dict(producto) if producto else None
+
+    def existe(self, id_producto) -> bool:
+        with self._lock:
+            return id_producto in self._productos
+
+    def listar(self) -> List[Dict]:
+        with self._lock:
+            return [dict(producto) for producto in self._productos.values()]
+
+    def instantanea(self) -> Tuple[Dict, ...]:
+        """
+        Productos de la versión actual, compartidos entre todos los que la
+        piden mientras no haya cambios. No se deben modificar.
+        """
+        with self._lock:
+            if self._version_instantanea != self.version:
+                self._instantanea = tuple(self._productos.values())
+                self._version_instantanea = self.version
+            return self._instantanea
+
+    def __len__(self):
+        return len(self._productos)
+
+    # ----------------------- suscripciones -----------------------
+
+    def suscribir(self, callback: Callable[[int], None], intervalo: float = 2.0) -> Callable[[], None]:
+        """
+        callback(version) tras cada cambio del stock. Se llama desde el hilo
+        que lo detecta (el vigilante o el del pool que escribió), así que las
+        ventanas lo pasan al de Tk con DespachadorResultados.avisar. Si
+        callback es un método, la suscripción no mantiene vivo su objeto:
+        cuando la ventana desaparece se cancela sola. Mientras haya
+        suscriptores, un hilo comprueba cada `intervalo` segundos si otro
+        proceso ha escrito, y termina al no quedar ninguno. Devuelve la
+        función para cancelar la suscripción.
+        """
+        if hasattr(callback, "__self__"):
+            entrada = weakref.WeakMethod(callback)
+        else:
+            entrada = lambda: callback
+
+        with self._lock:
+            self._suscriptores = self._suscriptores + [entrada]
+            self._intervalo_vigilancia = min(self._intervalo_vigilancia, intervalo)
+            if self._vigilante is None:
+                self._vigilante = threading.Thread(target=self._vigilar, name="stock-vigilante", daemon=True)
+                self._vigilante.start()
+
+        def cancelar():
+            with self._lock:
+                self._suscriptores = [s for s in self._suscriptores if s is not entrada]
+        return cancelar
+
+    def _vigilar(self):
+        while True:
+            time.sleep(self._intervalo_vigilancia)
+            with self._lock:
+                self._suscriptores = [s for s in self._suscriptores if s() is not None]
+                if not self._suscriptores:
+                    self._vigilante = None
+                    return
+            try:
+                self.refrescar()
+            except Exception:
+                logger.exception("Error al revisar el stock")
+
+    def _notificar(self):
+        version = self.version
+        for entrada in self._suscriptores:
+            callback = entrada()
+            if callback is None:
+                continue
+            try:
+                callback(version)
+            except Exception:
+                logger.exception("Error al avisar del cambio de stock")
+
+    # ----------------------- escritura -----------------------
+
+    @contextmanager
+    def _escritura(self):
+        cambiada = False
+        try:
+            with self._lock, self._bloqueo.exclusivo():
+                version = self.version
+                try:
+                    yield
+                finally:
+                    cambiada = self.version != version
+        finally:
+            # También si la operación falló pero se leyeron cambios de otro proceso
+            if cambiada:
+                self._notificar()
+
+    def _anexar(self, cambio: Dict):
+        # Con el bloqueo exclusivo: nadie más escribe mientras se anexa
+        self._sincronizar()
+        directorio = os.path.dirname(self.ruta_log)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+        linea = (json.dumps(cambio, ensure_ascii=False) + "\n").encode('utf-8')
+        with open(self.ruta_log, 'ab') as f:
+            if f.tell() > self._offset_log:
+                # Cierra la línea que dejó a medias una escritura cortada
+                linea = b"\n" + linea
+            f.write(linea)
+            f.flush()
+            os.fsync(f.fileno())
+            self._offset_log = f.tell()
+        self._cambios_log += self._aplicar(cambio)
+        self.version += 1
+
+        if self._cambios_log >= self.max_cambios:
+            self.compactar()
+
+    def guardar(self, producto: Dict):
+        """Alta o modificación del producto con ese id."""
+        with self._escritura():
+            self._anexar({"op": "put", "producto": dict(producto)})
+
+    def agregar(self, producto: Dict):
+        with self._escritura():
+            self._sincronizar()
+            if producto['id'] in self._productos:
+                raise ProductoExisteError("Ya existe un producto con ese ID")
+            self._anexar({"op": "put", "producto": dict(producto)})
+
+    def actualizar(self, id_producto, **campos):
+        with self._escritura():
+            self._sincronizar()
+            producto = self._productos.get(id_producto)
+            if producto is None:
+                raise ProductoNoEncontradoError("No se encontró un producto con ese ID")
+            self._anexar({"op": "put", "producto": {**producto, **campos, 'id': id_producto}})
+
+    def eliminar(self, id_producto):
+        with self._escritura():
+            self._sincronizar()
+            if id_producto not in self._productos:
+                raise ProductoNoEncontradoError("No se encontró el producto para eliminar")
+            self._anexar({"op": "delete", "id": id_producto})
+
+    def aplicar_lote(self, construir: Callable[[MappingProxyType], List[Dict]]) -> int:
+        """
+        Operación masiva atómica. construir(productos) recibe el stock al día
+        (solo lectura) con el bloqueo exclusivo tomado y devuelve la lista de
+        cambios put/delete, o lanza una excepción para no escribir nada.
+        Todos los cambios van en una única línea del registro: tras un corte
+        se ven todos o ninguno. Devuelve cuántos cambios se aplicaron.
+        """
+        with self._escritura():
+            self._sincronizar()
+            cambios = construir(MappingProxyType(self._productos))
+            if cambios:
+                self._anexar({"op": "lote", "cambios": cambios})
+            return len(cambios)
+
+    def compactar(self):
+        """Reescribe el snapshot con el estado actual y vacía el registro."""
+        with self._escritura():
+            self._sincronizar()
+            escritura_atomica(
+                self.ruta,
+                json.dumps(list(self._productos.values()), indent=4, ensure_ascii=False)
+            )
+            if os.path.exists(self.ruta_log):
+                os.remove(self.ruta_log)
+
+            self._firma_snapshot = self._firma(self.ruta)
+            self._offset_log = 0
+            self._cambios_log = 0
@@ -1,57 +1,351 @@
+import logging
 import threading
-from queue import Queue, Empty
-import tkinter as tk
 import time
+import tkinter as tk
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Tamaño del pool compartido por todas las ventanas para la E/S en segundo plano
+MAX_WORKERS = 4
+
+MENSAJE_TIMEOUT = "La operación excedió el tiempo de espera"
+
+# timeout para las escrituras: una vez empezadas se confirman igual, así que
+# dejar de esperarlas solo haría creer que fallaron
+SIN_PLAZO = float("inf")
+
+logger = logging.getLogger(__name__)
+
+
+class TaskPool:
+    """Pool acotado de hilos con contadores para /health o depuración."""
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tarea")
+        self._lock = threading.Lock()
+        self._en_curso = 0
+        self._enviadas = 0
+        self._completadas = 0
+        self._fallidas = 0
+        self._canceladas = 0
+        self._agotadas = 0
+        # Canceladas antes de empezar: salen de la cola sin ejecutarse
+        self._descartadas = 0
+
+    def submit(self, func):
+        def ejecutar():
+            with self._lock:
+                self._en_curso += 1
+            try:
+                resultado = func()
+            except Exception:
+                with self._lock:
+                    self._fallidas += 1
+                raise
+            finally:
+                with self._lock:
+                    self._en_curso -= 1
+            with self._lock:
+                self._completadas += 1
+            return resultado
+
+        with self._lock:
+            self._enviadas += 1
+        return self._executor.submit(ejecutar)
+
+    def anotar_cancelada(self, por_timeout: bool = False, descartada: bool = True):
+        with self._lock:
+            if por_timeout:
+                self._agotadas += 1
+            else:
+                self._canceladas += 1
+            if descartada:
+                self._descartadas += 1
+
+    def estadisticas(self):
+        with self._lock:
+            terminadas = self._completadas + self._fallidas
+            return {
+                "max_workers": self.max_workers,
+                "en_curso": self._en_curso,
+                "en_cola": max(0, self._enviadas - terminadas - self._en_curso - self._descartadas),
+                "enviadas": self._enviadas,
+                "completadas": self._completadas,
+                "fallidas": self._fallidas,
+                "canceladas": self._canceladas,
+                "agotadas": self._agotadas,
+            }
+
+    def cerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool_compartido() -> TaskPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = TaskPool()
+        return _pool
+
+
+class Tarea:
+    """Una operación enviada al pool: su future, sus callbacks y su plazo."""
+
+    def __init__(self, future, callback, error_callback, plazo, pool):
+        self.future = future
+        self.callback = callback
+        self.error_callback = error_callback
+        self.plazo = plazo
+        self._pool = pool
+        self.cancelada = False
+        self.terminada = False
+
+    def cancelar(self):
+        """
+        Descarta la tarea: si aún no había empezado ya no se ejecuta, y en
+        ningún caso se llama a sus callbacks.
+        """
+        if self.terminada or self.cancelada:
+            return
+        self.cancelada = True
+        if self.future.cancel():
+            self._pool.anotar_cancelada()
+
+    def _despachar(self, ahora: float) -> bool:
+        """Llama al callback que toque; devuelve True si la tarea ha acabado."""
+        if self.cancelada:
+            return True
+
+        if not self.future.done():
+            if ahora < self.plazo:
+                return False
+            # Se deja de esperar: si no había empezado, no llega a ejecutarse
+            self._pool.anotar_cancelada(por_timeout=True, descartada=self.future.cancel())
+            self.terminada = True
+            if self.error_callback:
+                self.error_callback(MENSAJE_TIMEOUT)
+            return True
+
+        self.terminada = True
+        if self.future.cancelled():
+            return True
+        error = self.future.exception()
+        if error is not None:
+            if self.error_callback:
+                self.error_callback(str(error))
+        elif self.callback:
+            self.callback(self.future.result())
+        return True
+
+
+class DespachadorResultados:
+    """
+    Reparte en el hilo de Tk los resultados de las tareas de una ventana
+    raíz, con un único bucle root.after por raíz. En cada vuelta entrega
+    todos los que hayan terminado, hasta agotar PRESUPUESTO_MS; si quedan
+    más, sigue en la vuelta siguiente sin esperar. Mientras haya tareas en
+    marcha revisa cada INTERVALO_MIN_MS y, si no termina ninguna, va
+    espaciando las vueltas hasta INTERVALO_MAX_MS.
+
+    Otros hilos no pueden llamar a root.after; para pasar algo al de Tk
+    usan avisar(), que solo encola, y el bucle lo recoge. Mientras alguien
+    escuche (escuchar()), el bucle sigue cada INTERVALO_AVISOS_MS aunque
+    no haya tareas. Sin tareas ni oyentes no programa nada.
+    """
+
+    INTERVALO_MIN_MS = 10
+    INTERVALO_MAX_MS = 100
+    INTERVALO_AVISOS_MS = 100
+    PRESUPUESTO_MS = 15
+
+    def __init__(self, root):
+        self.root = root
+        self._tareas = []
+        self._intervalo = self.INTERVALO_MIN_MS
+        self._after_id = None
+        self._cerrado = False
+        # deque.append y popleft son seguros entre hilos sin más bloqueo
+        self._avisos = deque()
+        self._oyentes = 0
+
+    def agregar(self, tarea: Tarea):
+        if self._cerrado:
+            return
+        self._tareas.append(tarea)
+        if self._after_id is None:
+            self._programar(self.INTERVALO_MIN_MS)
+        elif self._intervalo > self.INTERVALO_MIN_MS:
+            # Estaba espaciando las vueltas: la tarea nueva se mira pronto
+            self._programar(self.INTERVALO_MIN_MS)
+
+    def pendientes(self) -> int:
+        return len(self._tareas)
+
+    def escuchar(self):
+        """
+        Desde el hilo de Tk: mantiene el bucle en marcha para recoger los
+        avisos. Devuelve la función para dejar de escuchar.
+        """
+        if self._cerrado:
+            return lambda: None
+        self._oyentes += 1
+        if self._after_id is None:
+            self._programar(self.INTERVALO_AVISOS_MS)
+
+        escuchando = True
+
+        def dejar():
+            nonlocal escuchando
+            if escuchando:
+                escuchando = False
+                self._oyentes -= 1
+        return dejar
+
+    def avisar(self, callback) -> bool:
+        """
+        Desde cualquier hilo: callback() se llama en el de Tk en la próxima
+        vuelta, una sola vez aunque se avise varias veces antes. Devuelve
+        False si la ventana ya se cerró.
+        """
+        if self._cerrado:
+            return False
+        self._avisos.append(callback)
+        return True
+
+    def cerrar(self):
+        """Al destruir la raíz: no se programa nada más ni se llama a nadie."""
+        self._cerrado = True
+        self._tareas = []
+        self._avisos.clear()
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except tk.TclError:
+                pass
+            self._after_id = None
+
+    def _programar(self, intervalo: int):
+        # Un callback puede haber lanzado una tarea y programado ya la vuelta
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+        self._intervalo = intervalo
+        self._after_id = self.root.after(intervalo, self._revisar)
+
+    def _revisar(self):
+        self._after_id = None
+        if self._cerrado:
+            return
+
+        avisos = []
+        while self._avisos:
+            aviso = self._avisos.popleft()
+            if aviso not in avisos:
+                avisos.append(aviso)
+        for aviso in avisos:
+            try:
+                aviso()
+            except Exception:
+                logger.exception("Error al atender un aviso")
+        if self._cerrado:
+            return
+
+        inicio = time.monotonic()
+        limite = inicio + self.PRESUPUESTO_MS / 1000
+        tareas, self._tareas = self._tareas, []
+        pendientes = []
+        entregadas = 0
+        for posicion, tarea in enumerate(tareas):
+            if time.monotonic() >= limite:
+                # Se acabó el tiempo de esta vuelta: el resto, en la siguiente
+                pendientes.extend(tareas[posicion:])
+                break
+            try:
+                if tarea._despachar(inicio):
+                    entregadas += 1
+                else:
+                    pendientes.append(tarea)
+            except Exception:
+                entregadas += 1
+                logger.exception("Error en el callback de una tarea")
+        if self._cerrado:
+            return
+        # Las tareas lanzadas desde los callbacks se revisan en la siguiente vuelta
+        self._tareas = pendientes + self._tareas
+
+        if not self._tareas:
+            if self._oyentes or self._avisos:
+                self._programar(self.INTERVALO_AVISOS_MS)
+            else:
+                self._intervalo = self.INTERVALO_MIN_MS
+        elif time.monotonic() >= limite:
+            self._programar(0)
+        elif entregadas or len(self._tareas) > len(pendientes):
+            self._programar(self.INTERVALO_MIN_MS)
+        else:
+            self._programar(min(self._intervalo * 2, self.INTERVALO_MAX_MS))
+
+
+_despachadores = {}
+
+
+def despachador_para(root) -> DespachadorResultados:
+    """El despachador de esa ventana raíz; se crea la primera vez."""
+    despachador = _despachadores.get(root)
+    if despachador is None:
+        despachador = _despachadores[root] = DespachadorResultados(root)
+
+        def al_destruir(event):
+            if event.widget is root:
+                despachador.cerrar()
+                _despachadores.pop(root, None)
+        root.bind('<Destroy>', al_destruir, add='+')
+    return despachador
+
 
 class ThreadedTask:
-    def __init__(self):
-        self.queue = Queue()
+    """
+    Ejecuta funciones bloqueantes en el pool compartido y entrega el
+    resultado a callback (o el error a error_callback) en el hilo de Tk.
+    Cada llamada tiene su propio future, así que cada resultado llega a su
+    callback aunque haya varias en marcha. Pasado el timeout se deja de
+    esperar, pero lo que ya empezó termina: las escrituras usan SIN_PLAZO.
+    """
+
+    def __init__(self, root=None, pool: TaskPool = None):
+        # La raíz de la aplicación; sin ella se usa la raíz por defecto de Tk
+        self.root = root
+        self.pool = pool or pool_compartido()
         self.default_timeout = 10  # Timeout por defecto de 10 segundos
-    
-    def execute(self, func, callback=None, error_callback=None, timeout=None):
+        self._tareas = []
+
+    def execute(self, func, callback=None, error_callback=None, timeout=None) -> Tarea:
         if timeout is None:
             timeout = self.default_timeout
-            
-        start_time = time.time()
-        
-        def thread_target():
-            try:
-                result = func()
-                if time.time() - start_time < timeout:
-                    self.queue.put(('success', result))
-            except Exception as e:
-                if time.time() - start_time < timeout:
-                    self.queue.put(('error', str(e)))
-        
-        def check_queue():
-            try:
-                if time.time() - start_time > timeout:
-                    if error_callback:
-                        error_callback("La operación excedió el tiempo de espera")
-                    return
-                
-                try:
-                    message_type, result = self.queue.get_nowait()
-                    if message_type == 'success' and callback:
-                        callback(result)
-                    elif message_type == 'error' and error_callback:
-                        error_callback(result)
-                except Empty:
-                    if time.time() - start_time < timeout:
-                        tk.Tk().after(100, check_queue)
-                    else:
-                        if error_callback:
-                            error_callback("La operación excedió el tiempo de espera")
-            except Exception as e:
-                if error_callback:
-                    error_callback(f"Error en el proceso: {str(e)}")
-        
-        thread = threading.Thread(target=thread_target)
-        thread.daemon = True
-        thread.start()
-        
+
+        despachador = None
         if callback or error_callback:
-            tk.Tk().after(100, check_queue)
+            root = self.root if self.root is not None else tk._default_root
+            if root is None:
+                raise RuntimeError("ThreadedTask necesita la ventana raíz para entregar los resultados")
+            despachador = despachador_para(root)
+
+        future = self.pool.submit(func)
+        tarea = Tarea(future, callback, error_callback, time.monotonic() + timeout, self.pool)
+        self._tareas = [t for t in self._tareas if not (t.terminada or t.cancelada)] + [tarea]
+        if despachador is not None:
+            despachador.agregar(tarea)
+        return tarea
+
+    def cancelar_todas(self):
+        """Para usar al cerrar la ventana: descarta lo que quede pendiente."""
+        for tarea in self._tareas:
+            tarea.cancelar()
+        self._tareas = []
 
 # Lock global para operaciones con archivos
-file_lock = threading.Lock()
\ No newline at end of file
+file_lock = threading.Lock()
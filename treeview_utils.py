@@ -0,0 +1,394 @@
+import os
+import re
+import tkinter as tk
+from operator import itemgetter
+from tkinter import ttk
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+
+def firma_fichero(ruta) -> Optional[Tuple[int, int]]:
+    """(mtime en ns, tamaño) del fichero, o None si no existe."""
+    try:
+        info = os.stat(ruta)
+    except OSError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+
+class TreeviewSync:
+    """
+    Mantiene las filas de un ttk.Treeview a partir de una clave por fila.
+
+    Guarda clave -> (item, valores, tags) y en cada sincronizar() solo
+    inserta las filas nuevas, modifica las que han cambiado y borra las que
+    ya no están, en vez de vaciar y rellenar la tabla entera. Si el orden de
+    las filas cambia se recoloca todo con una sola llamada a Tk.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self._filas: Dict[Hashable, Tuple[str, tuple, tuple]] = {}
+        self._orden: List[str] = []
+
+    def sincronizar(self, filas: Iterable[Tuple[Hashable, Sequence, Sequence]]) -> Dict[str, int]:
+        """
+        Aplica las filas (clave, valores, tags) en el orden recibido.
+        Devuelve cuántas filas se insertaron, modificaron y borraron.
+        """
+        nuevas: Dict[Hashable, Tuple[str, tuple, tuple]] = {}
+        orden: List[str] = []
+        insertadas: List[str] = []
+        modificadas = 0
+        repetidas: Dict[Hashable, int] = {}
+
+        for clave, valores, tags in filas:
+            valores = tuple(valores)
+            tags = tuple(tags)
+            if clave in nuevas:
+                # Clave repetida en el origen: se muestra igualmente, aparte
+                repetidas[clave] = repetidas.get(clave, 0) + 1
+                clave = (clave, repetidas[clave])
+
+            anterior = self._filas.get(clave)
+            if anterior is None:
+                item = self.tree.insert('', tk.END, values=valores, tags=tags)
+                insertadas.append(item)
+            else:
+                item = anterior[0]
+                if anterior[1] != valores or anterior[2] != tags:
+                    self.tree.item(item, values=valores, tags=tags)
+                    modificadas += 1
+
+            nuevas[clave] = (item, valores, tags)
+            orden.append(item)
+
+        borradas = [item for clave, (item, _, _) in self._filas.items() if clave not in nuevas]
+        if borradas:
+            self.tree.delete(*borradas)
+
+        # Orden en el que han quedado las filas tras insertar al final
+        vigentes = set(orden)
+        actual = [item for item in self._orden if item in vigentes] + insertadas
+        if actual != orden:
+            self.tree.set_children('', *orden)
+
+        self._filas = nuevas
+        self._orden = orden
+        return {"insertadas": len(insertadas), "modificadas": modificadas, "borradas": len(borradas)}
+
+
+_NUMERO_INICIAL = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+
+def numero_inicial(valor) -> Optional[float]:
+    """Número con el que empieza el valor (también "35 unidades"), o None."""
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return valor
+    texto = str(valor).lstrip()
+    if not texto or not (texto[0].isdigit() or texto[0] == "-"):
+        return None
+    numero = _NUMERO_INICIAL.match(texto)
+    return float(numero.group().replace(",", ".")) if numero else None
+
+
+class ModeloFilas:
+    """
+    Filas (clave, valores, tags) de una VirtualTreeview, sin nada de Tk: se
+    puede construir en un hilo de trabajo. Guarda el texto de búsqueda de
+    cada fila y, por columna, el orden de las claves una vez calculado.
+    """
+
+    def __init__(self, filas: Iterable[Tuple[Hashable, Sequence, Sequence]] = ()):
+        self.filas: Dict[Hashable, Tuple[tuple, tuple]] = {}
+        self.claves: List[Hashable] = []
+        self.textos: Dict[Hashable, str] = {}
+        self._ordenes: Dict[int, List[Hashable]] = {}
+
+        repetidas: Dict[Hashable, int] = {}
+        for clave, valores, tags in filas:
+            if clave in self.filas:
+                repetidas[clave] = repetidas.get(clave, 0) + 1
+                clave = (clave, repetidas[clave])
+            valores = tuple(valores)
+            self.filas[clave] = (valores, tuple(tags))
+            self.claves.append(clave)
+            self.textos[clave] = " ".join(str(v) for v in valores).lower()
+
+    def __len__(self):
+        return len(self.claves)
+
+    def orden(self, columna: int) -> List[Hashable]:
+        """Claves ordenadas de forma ascendente por la columna."""
+        orden = self._ordenes.get(columna)
+        if orden is not None:
+            return orden
+
+        # Números delante y texto detrás; cada grupo se ordena con claves
+        # simples, que es mucho más rápido que comparar tuplas mixtas
+        numeros = []
+        textos = []
+        # Las columnas de cantidades repiten mucho los mismos valores
+        vistos: Dict[object, Optional[float]] = {}
+        for clave in self.claves:
+            valor = self.filas[clave][0][columna]
+            if valor in vistos:
+                numero = vistos[valor]
+            else:
+                numero = vistos[valor] = numero_inicial(valor)
+            if numero is None:
+                textos.append((str(valor).lower(), clave))
+            else:
+                numeros.append((numero, clave))
+        numeros.sort(key=itemgetter(0))
+        textos.sort(key=itemgetter(0))
+
+        orden = self._ordenes[columna] = [clave for _, clave in numeros] + [clave for _, clave in textos]
+        return orden
+
+    def preordenar(self, columnas: int):
+        """Calcula de antemano el orden de todas las columnas (p. ej. en el hilo de carga)."""
+        for columna in range(columnas):
+            self.orden(columna)
+
+    def filtrar(self, claves: Iterable[Hashable], texto: str) -> List[Hashable]:
+        textos = self.textos
+        return [clave for clave in claves if texto in textos[clave]]
+
+
+class VirtualTreeview(ttk.Frame):
+    """
+    Tabla para catálogos grandes: el ttk.Treeview interior solo tiene
+    `height` filas, que se reutilizan mostrando la ventana visible del
+    índice (ModeloFilas ordenado y filtrado). Desplazarse, ordenar por
+    columna o buscar cuesta lo mismo con 100 filas que con 200.000.
+
+    columnas: (id, título, ancho, anchor) por columna.
+    """
+
+    def __init__(self, master, columnas: Sequence[Tuple[str, str, int, str]], height: int = 15):
+        super().__init__(master)
+        self.height = height
+        self._columnas = [columna[0] for columna in columnas]
+        self._titulos = {columna[0]: columna[1] for columna in columnas}
+
+        self._tree = ttk.Treeview(self, columns=self._columnas, show='headings', height=height, selectmode='browse')
+        for id_columna, titulo, ancho, anchor in columnas:
+            self._tree.heading(id_columna, text=titulo, command=lambda c=id_columna: self.ordenar(c))
+            self._tree.column(id_columna, width=ancho, anchor=anchor)
+        self._tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+        self._scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._yview)
+        self._scrollbar.grid(row=0, column=1, sticky='ns')
+
+        # Filas fijas del Treeview; las que sobran quedan desenganchadas
+        self._pool = [self._tree.insert('', tk.END) for _ in range(height)]
+        self._tree.detach(*self._pool)
+        self._enganchadas = 0
+        self._pintadas: Dict[str, Optional[Tuple[Hashable, tuple, tuple]]] = {item: None for item in self._pool}
+        self._claves_pool: Dict[str, Hashable] = {}
+
+        self._modelo = ModeloFilas()
+        self._indice: List[Hashable] = []
+        self._offset = 0
+        self._columna: Optional[int] = None
+        self._descendente = False
+        self._texto = ""
+        self._seleccionada: Optional[Hashable] = None
+        self._al_seleccionar = None
+
+        self._tree.bind('<<TreeviewSelect>>', self._seleccion_cambiada)
+        self._tree.bind('<MouseWheel>', self._rueda)
+        self._tree.bind('<Button-4>', lambda e: self._desplazar(-3))
+        self._tree.bind('<Button-5>', lambda e: self._desplazar(3))
+        for tecla, paso in (('<Up>', -1), ('<Down>', 1), ('<Prior>', -height), ('<Next>', height)):
+            self._tree.bind(tecla, lambda e, p=paso: self._mover_seleccion(p))
+        self._tree.bind('<Home>', lambda e: self._ir_a(0))
+        self._tree.bind('<End>', lambda e: self._ir_a(len(self._indice) - 1))
+
+    # ----------------------- datos -----------------------
+
+    def mostrar(self, modelo: ModeloFilas):
+        """Sustituye las filas conservando orden, búsqueda y selección."""
+        self._modelo = modelo
+        self._recalcular()
+        if self._seleccionada not in modelo.filas:
+            self._seleccionada = None
+        self._pintar()
+
+    def cargar(self, filas: Iterable[Tuple[Hashable, Sequence, Sequence]]):
+        self.mostrar(ModeloFilas(filas))
+
+    def _recalcular(self):
+        modelo = self._modelo
+        base = modelo.orden(self._columna) if self._columna is not None else modelo.claves
+        if self._descendente:
+            base = base[::-1]
+        self._indice = modelo.filtrar(base, self._texto) if self._texto else base
+
+    def ordenar(self, columna: str):
+        """Ordena por la columna; una segunda pulsación invierte el orden."""
+        posicion = self._columnas.index(columna)
+        self._descendente = not self._descendente if self._columna == posicion else False
+        self._columna = posicion
+
+        for id_columna in self._columnas:
+            titulo = self._titulos[id_columna]
+            if id_columna == columna:
+                titulo += " ▼" if self._descendente else " ▲"
+            self._tree.heading(id_columna, text=titulo)
+
+        self._recalcular()
+        self._offset = 0
+        self._pintar()
+
+    def buscar(self, texto: str):
+        """
+        Deja solo las filas que contienen el texto. Si el texto amplía la
+        búsqueda anterior se filtra sobre el resultado ya obtenido.
+        """
+        texto = texto.strip().lower()
+        if texto == self._texto:
+            return
+        if self._texto and texto.startswith(self._texto):
+            self._indice = self._modelo.filtrar(self._indice, texto)
+            self._texto = texto
+        else:
+            self._texto = texto
+            self._recalcular()
+        self._offset = 0
+        self._pintar()
+
+    def cuantas(self) -> int:
+        """Filas que pasan la búsqueda actual."""
+        return len(self._indice)
+
+    # ----------------------- selección -----------------------
+
+    def seleccion(self) -> Optional[Hashable]:
+        return self._seleccionada
+
+    def valores(self, clave: Hashable) -> Optional[tuple]:
+        fila = self._modelo.filas.get(clave)
+        return fila[0] if fila else None
+
+    def al_seleccionar(self, callback):
+        """callback(clave) cuando el usuario selecciona otra fila."""
+        self._al_seleccionar = callback
+
+    def seleccionar(self, clave: Optional[Hashable]):
+        self._seleccionada = clave
+        self._pintar()
+
+    def _seleccion_cambiada(self, event=None):
+        seleccion = self._tree.selection()
+        if not seleccion:
+            return
+        clave = self._claves_pool.get(seleccion[0])
+        if clave is None or clave == self._seleccionada:
+            return
+        self._seleccionada = clave
+        if self._al_seleccionar:
+            self._al_seleccionar(clave)
+
+    def _mover_seleccion(self, paso: int):
+        if self._seleccionada is None:
+            posicion = self._offset
+        else:
+            posicion = self._posicion(self._seleccionada) + paso
+        self._ir_a(posicion)
+        return "break"
+
+    def _ir_a(self, posicion: int):
+        if not self._indice:
+            return "break"
+        posicion = max(0, min(posicion, len(self._indice) - 1))
+        if posicion < self._offset:
+            self._offset = posicion
+        elif posicion >= self._offset + self.height:
+            self._offset = posicion - self.height + 1
+        clave = self._indice[posicion]
+        cambia = clave != self._seleccionada
+        self._seleccionada = clave
+        self._pintar()
+        if cambia and self._al_seleccionar:
+            self._al_seleccionar(clave)
+        return "break"
+
+    def _posicion(self, clave: Hashable) -> int:
+        for item, visible in self._claves_pool.items():
+            if visible == clave:
+                return self._offset + self._pool.index(item)
+        try:
+            return self._indice.index(clave)
+        except ValueError:
+            return self._offset
+
+    # ----------------------- desplazamiento y pintado -----------------------
+
+    def _yview(self, *args):
+        total = len(self._indice)
+        if args[0] == "moveto":
+            self._offset = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            paso = int(args[1]) * (self.height if args[2] == "pages" else 1)
+            self._offset += paso
+        self._pintar()
+
+    def _rueda(self, event):
+        # Windows manda múltiplos de 120; macOS, pasos sueltos
+        pasos = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self._desplazar(-3 * pasos)
+        return "break"
+
+    def _desplazar(self, filas: int):
+        self._offset += filas
+        self._pintar()
+        return "break"
+
+    def _pintar(self):
+        total = len(self._indice)
+        self._offset = max(0, min(self._offset, total - self.height))
+        visibles = self._indice[self._offset:self._offset + self.height]
+        filas = self._modelo.filas
+
+        self._claves_pool = {}
+        seleccionado = None
+        for item, clave in zip(self._pool, visibles):
+            valores, tags = filas[clave]
+            pintada = (clave, valores, tags)
+            if self._pintadas[item] != pintada:
+                self._tree.item(item, values=valores, tags=tags)
+                self._pintadas[item] = pintada
+            self._claves_pool[item] = clave
+            if clave == self._seleccionada:
+                seleccionado = item
+
+        if len(visibles) < self._enganchadas:
+            self._tree.detach(*self._pool[len(visibles):self._enganchadas])
+        for posicion in range(self._enganchadas, len(visibles)):
+            self._tree.move(self._pool[posicion], '', posicion)
+        self._enganchadas = len(visibles)
+
+        if seleccionado:
+            self._tree.selection_set(seleccionado)
+        elif self._tree.selection():
+            self._tree.selection_set(())
+
+        if total:
+            self._scrollbar.set(self._offset / total, (self._offset + len(visibles)) / total)
+        else:
+            self._scrollbar.set(0, 1)
+
+    # ----------------------- delegados al Treeview -----------------------
+
+    def tag_configure(self, tag, **opciones):
+        return self._tree.tag_configure(tag, **opciones)
+
+    def configure(self, cnf=None, **kw):
+        # El cursor se aplica al Treeview, como en los paneles con Treeview normal
+        if "cursor" in kw:
+            self._tree.configure(cursor=kw.pop("cursor"))
+        if cnf or kw:
+            return super().configure(cnf, **kw)
+
+    config = configure